@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""
+full-blog render benchmark: serial vs process pool
+
+builds a throwaway ~/.ttbp with a few thousand markdown entries and times
+core.write_html() with the pool turned off and on. needs /var/global to exist,
+like the rest of ttbp.
+
+    python bench/bench_render.py [entries]
+"""
+import datetime
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+HOME = tempfile.mkdtemp(prefix="ttbp-bench-")
+os.environ["HOME"] = HOME
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ttbp import config
+from ttbp import core
+
+WORDS = "feels town tilde gopher blog entry markdown today wrote some more words".split()
+
+
+def make_entries(count):
+    for path in [config.MAIN_FEELS, config.USER_CONFIG, config.WWW]:
+        os.makedirs(path)
+    with open(os.path.join(config.USER_CONFIG, "header.txt"), "w") as f:
+        f.write(config.DEFAULT_HEADER)
+    with open(os.path.join(config.USER_CONFIG, "footer.txt"), "w") as f:
+        f.write(config.DEFAULT_FOOTER)
+
+    day = datetime.date(2000, 1, 1)
+    for i in range(count):
+        paragraphs = []
+        for p in range(random.randint(2, 8)):
+            words = [random.choice(WORDS) for w in range(random.randint(20, 120))]
+            words[0] = "**" + words[0] + "**"
+            paragraphs.append(" ".join(words))
+        paragraphs.append("* a list\n* of things\n* to feel")
+        with open(os.path.join(config.MAIN_FEELS, day.strftime("%Y%m%d") + ".txt"), "w") as f:
+            f.write("\n\n".join(paragraphs))
+        day += datetime.timedelta(days=1)
+
+def run(threshold):
+    core.RENDERED.clear()
+    core.SETTINGS["parallel render threshold"] = threshold
+    start = time.time()
+    core.write_html("index.html")
+    return time.time() - start
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+
+    try:
+        make_entries(count)
+        core.load({"publishing": True}, publish=False)
+
+        serial = run(float("inf"))
+        index = open(os.path.join(config.WWW, "index.html")).read()
+        parallel = run(0)
+        same = core.unstamped(index) == core.unstamped(open(os.path.join(config.WWW, "index.html")).read())
+
+        print("{count} entries, {cpus} cpus".format(count=count, cpus=os.cpu_count()))
+        print("serial:   {t:.2f}s".format(t=serial))
+        print("parallel: {t:.2f}s ({x:.1f}x)".format(t=parallel, x=serial / parallel))
+        print("identical index: {same}".format(same=same))
+    finally:
+        shutil.rmtree(HOME)
+
+
+if __name__ == "__main__":
+    main()
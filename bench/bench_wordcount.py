@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+word count micro-benchmark: forking `wc -w` per entry vs wordcount.count_files()
+
+makes a pile of entry files of mixed sizes (some with non-ascii text, and some
+with bytes that aren't valid UTF-8 or aren't printable), counts them both
+ways, checks that every count matches, and times each. wc runs in the same
+locale as this script, so run it under LC_ALL=C too to check both modes.
+
+    python bench/bench_wordcount.py [entries]
+"""
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ttbp import wordcount
+
+WORDS = ["feels", "town", "tilde", "today", "**bold**", "café", "—",
+        "naïve", " ", "\U0001f331", "ok.", "\t", "\n\n", "-", "　"]
+# a truncated sequence, an encoded surrogate, U+FFFE, past U+10FFFF, a stray
+# byte, an unassigned code point, and U+2028: none of them start a word
+MALFORMED = [b"\xe2\x80", b"\xed\xa0\x80", b"\xef\xbf\xbe", b"\xf4\x90\x80\x80",
+        b"\xff", b"\xcd\xb8", b"\xe2\x80\xa8"]
+
+
+def make_entries(path, count):
+    random.seed(count)
+    filenames = []
+    for i in range(count):
+        filename = os.path.join(path, "{i:08}.txt".format(i=i))
+        words = [random.choice(WORDS).encode("utf-8") for j in range(random.randint(0, 2000))]
+        if i % 10 == 0:
+            words += [random.choice(MALFORMED) + random.choice([b"", b" "]) for j in range(20)]
+            random.shuffle(words)
+        with open(filename, "wb") as f:
+            f.write(b" ".join(words))
+        filenames.append(filename)
+
+    return filenames
+
+def fork_wc(filenames):
+    '''
+    meta() as it was: one `wc -w` process per entry
+    '''
+
+    counts = {}
+    for filename in filenames:
+        counts[filename] = int(subprocess.check_output(["wc", "-w", filename],
+            stderr=subprocess.STDOUT).split()[0])
+
+    return counts
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    path = tempfile.mkdtemp(prefix="ttbp-bench-")
+
+    try:
+        filenames = make_entries(path, count)
+        size = sum(os.path.getsize(filename) for filename in filenames)
+
+        start = time.time()
+        old = fork_wc(filenames)
+        before = time.time() - start
+
+        start = time.time()
+        new = wordcount.count_files(filenames)
+        after = time.time() - start
+
+        wrong = [filename for filename in filenames if old[filename] != new[filename]]
+
+        print("{count} entries, {size:.1f}MB, {mode} mode".format(count=count,
+            size=size / 1024.0 / 1024, mode="utf-8" if wordcount.UTF8 else "byte"))
+        print("         total       per entry")
+        for name, elapsed in [("before", before), ("after", after)]:
+            print("{name:8} {s:8.3f}s   {ms:8.3f}ms".format(name=name, s=elapsed,
+                ms=elapsed * 1000 / count))
+        print("{wrong} counts differ from wc -w".format(wrong=len(wrong)))
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+    main()
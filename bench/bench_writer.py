@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+"""
+page writer micro-benchmark: the old per-character writer vs write_out()
+
+counts python-level write() calls and the write() syscalls that actually reach
+the file (via a counting FileIO underneath the buffers), and times writing a
+permalink page many times over. the new side goes through util.write_out()
+itself, so it measures the writer that ships, including its change check.
+needs /var/global to exist, like the rest of ttbp.
+
+    python bench/bench_writer.py [pages]
+"""
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+HOME = tempfile.mkdtemp(prefix="ttbp-bench-")
+os.environ["HOME"] = HOME
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ttbp import config
+from ttbp import core
+from ttbp import util
+
+ENTRY = "\n\n".join(["some **feels** about the town today, " * 12] * 6)
+
+
+class CountingFileIO(io.FileIO):
+    syscalls = 0
+
+    def write(self, data):
+        CountingFileIO.syscalls += 1
+        return io.FileIO.write(self, data)
+
+
+class CountingText(io.TextIOWrapper):
+    calls = 0
+
+    def write(self, text):
+        CountingText.calls += 1
+        return io.TextIOWrapper.write(self, text)
+
+
+class CountingBuffer(io.BufferedWriter):
+    calls = 0
+
+    def write(self, data):
+        CountingBuffer.calls += 1
+        return io.BufferedWriter.write(self, data)
+
+
+def old_write_page(lines, outurl):
+    """write_page() as it was: a text file, one write() per character of the
+    header and footer, and one per line of the entry"""
+
+    outfile = CountingText(io.BufferedWriter(CountingFileIO(outurl, "w")))
+
+    outfile.write("<!--generated by the tilde.town blogging platform on "+time.strftime("%d %B %y")+"\nhttp://tilde.town/~endorphant/ttbp/-->\n\n")
+
+    for line in core.HEADER:
+        outfile.write(line)
+
+    outfile.write("\n")
+
+    for line in lines:
+        outfile.write(line)
+
+    outfile.write("\n")
+
+    for line in core.FOOTER:
+        outfile.write(line)
+
+    outfile.close()
+
+REAL_FDOPEN = os.fdopen
+
+def counting_fdopen(fd, mode="r", buffering=-1, *args, **kwargs):
+    """os.fdopen() for util.write_out(): the same buffered binary file, with
+    counting layers for the buffer and the raw file underneath it"""
+
+    if "b" not in mode or "w" not in mode:
+        return REAL_FDOPEN(fd, mode, buffering, *args, **kwargs)
+
+    return CountingBuffer(CountingFileIO(fd, "w"), buffering)
+
+def new_write_page(chunk, outurl):
+    """write_page() now: the precompiled chunks through util.write_out()"""
+
+    util.write_out(outurl, [core.PAGE_HEAD, chunk, b"\n", core.PAGE_FOOT], core.PAGE_STAMP)
+
+def run(writer, variants, pages):
+    """times writer over pages pages, alternating between two versions of the
+    entry so write_out() never gets to skip a page as unchanged"""
+
+    outurl = os.path.join(config.WWW, "page.html")
+    CountingFileIO.syscalls = CountingText.calls = CountingBuffer.calls = 0
+
+    os.fdopen = counting_fdopen
+    try:
+        start = time.time()
+        for i in range(pages):
+            writer(variants[i % 2], outurl)
+        elapsed = time.time() - start
+    finally:
+        os.fdopen = REAL_FDOPEN
+
+    calls = CountingText.calls + CountingBuffer.calls
+    return elapsed / pages, calls / float(pages), CountingFileIO.syscalls / float(pages)
+
+def main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    try:
+        for path in [config.MAIN_FEELS, config.USER_CONFIG, config.WWW]:
+            os.makedirs(path)
+        with open(os.path.join(config.USER_CONFIG, "header.txt"), "w") as f:
+            f.write(config.DEFAULT_HEADER * 4)
+        with open(os.path.join(config.USER_CONFIG, "footer.txt"), "w") as f:
+            f.write(config.DEFAULT_FOOTER)
+        filename = os.path.join(config.MAIN_FEELS, "20200101.txt")
+        with open(filename, "w") as f:
+            f.write(ENTRY)
+
+        core.load({}, publish=False)
+
+        # markdown is rendered once up front for both, so the timings are
+        # just about getting the page onto disk
+        lines = core.write_entry(filename)
+        chunk = core.render_entry(filename)
+        old = run(old_write_page, [lines, lines + ["<!-- -->\n"]], pages)
+        new = run(new_write_page, [chunk, chunk + b"<!-- -->\n"], pages)
+
+        print("{pages} pages, {size} bytes each".format(pages=pages,
+            size=os.path.getsize(os.path.join(config.WWW, "page.html"))))
+        print("         per page    write() calls   write syscalls")
+        for name, (elapsed, calls, syscalls) in [("before", old), ("after", new)]:
+            print("{name:8} {ms:7.3f}ms   {calls:13.1f}   {syscalls:14.1f}".format(
+                name=name, ms=elapsed * 1000, calls=calls, syscalls=syscalls))
+    finally:
+        shutil.rmtree(HOME)
+
+
+if __name__ == "__main__":
+    main()
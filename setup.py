@@ -20,8 +20,10 @@ setup(
     include_package_data=True,
     entry_points={
         "console_scripts": [
-            "feels = ttbp.ttbp:main",
-            "ttbp = ttbp.ttbp:main",
+            "feels = ttbp.cli:main",
+            "ttbp = ttbp.cli:main",
+            "ttbp-feedd = ttbp.feedd:main",
+            "ttbp-admin = ttbp.admin:main",
         ]
     },
 )
@@ -0,0 +1,272 @@
+"""
+This module contains ttbp-admin, tools for whoever runs ttbp on the server.
+
+ttbp-admin rebuild
+    after an upgrade changes templates or the renderer, everyone's published
+    html stays stale until they log in. this rebuilds every publishing user's
+    html and gopher output by running `ttbp rebuild --full` as that user, so
+    it's the exact same rendering code as core.write_html(), with the same
+    file ownership and permissions as if they'd done it themselves.
+
+    users are rebuilt a few at a time by a pool of worker processes, at low
+    cpu and io priority. progress is saved to a state file after every user,
+    so an interrupted run picks up where it left off with --resume. failures
+    are collected into a per-user report at the end.
+
+running as root is needed to rebuild other users' pages; anyone else can only
+rebuild their own (or do a --dry-run of pages they can read).
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import pwd
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+from . import config
+
+STATE = os.path.join(config.VAR, "rebuild-state.json")
+
+
+def find_publishers(home="/home"):
+    """returns a sorted list of users with a ttbprc that has publishing on"""
+
+    users = []
+
+    try:
+        townies = os.listdir(home)
+    except OSError:
+        townies = []
+
+    for townie in townies:
+        rcfile = os.path.join(home, townie, ".ttbp", "config", "ttbprc")
+        try:
+            with open(rcfile) as f:
+                ttbprc = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if ttbprc.get("publishing"):
+            users.append(townie)
+
+    users.sort()
+
+    return users
+
+def load_state(path=STATE):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"done": {}, "failed": {}}
+
+def save_state(state, path=STATE):
+    temp = path + ".tmp"
+    with open(temp, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.rename(temp, path)
+
+def rebuild_command(dry_run=False, ionice=True, niceness=0):
+    """the command line each worker runs as the user being rebuilt"""
+
+    command = [sys.executable, "-m", "ttbp.cli", "rebuild", "--full", "--json"]
+    if dry_run:
+        command.append("--dry-run")
+
+    if niceness and shutil.which("nice"):
+        command = ["nice", "-n", str(niceness)] + command
+
+    if ionice and shutil.which("ionice"):
+        command = ["ionice", "-c", "3"] + command
+
+    return command
+
+def rebuild_user(user, home="/home", dry_run=False, niceness=10, timeout=600):
+    """rebuilds one user's pages in a child process running as that user.
+
+    returns (user, result dict or None, error string or None)."""
+
+    userhome = os.path.join(home, user)
+    env = {
+        "HOME": userhome,
+        "USER": user,
+        "LOGNAME": user,
+        "PATH": os.environ.get("PATH", "/usr/bin:/bin"),
+        "LANG": os.environ.get("LANG", "C.UTF-8"),
+    }
+    if os.environ.get("PYTHONPATH"):
+        env["PYTHONPATH"] = os.environ["PYTHONPATH"]
+
+    # switching users is left to subprocess itself rather than a preexec_fn,
+    # which isn't safe to run from the worker threads
+    identity = {}
+    if os.geteuid() == 0:
+        try:
+            pw = pwd.getpwnam(user)
+        except KeyError:
+            return user, None, "no such user"
+
+        identity = {"user": pw.pw_uid, "group": pw.pw_gid,
+                "extra_groups": os.getgrouplist(user, pw.pw_gid)}
+
+    # run from / rather than the user's home: `python -m` puts the working
+    # directory first on sys.path, so a ttbp/ there would be imported instead
+    # of the real one. (not -I, which would also drop PYTHONPATH)
+    try:
+        proc = subprocess.run(rebuild_command(dry_run, niceness=niceness), cwd="/", env=env,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout, **identity)
+    except subprocess.TimeoutExpired:
+        return user, None, "timed out after {timeout}s".format(timeout=timeout)
+    except OSError as e:
+        return user, None, str(e)
+
+    if proc.returncode != 0:
+        error = proc.stderr.decode(errors="replace").strip().splitlines()
+        return user, None, "exit {code}: {error}".format(code=proc.returncode,
+                error=error[-1] if error else "no output")
+
+    try:
+        return user, json.loads(proc.stdout.decode()), None
+    except ValueError:
+        return user, None, "couldn't understand rebuild output"
+
+def rebuild_all(users, home="/home", jobs=2, dry_run=False, niceness=10, pause=0,
+        state=None, state_path=STATE):
+    """rebuilds the given users in a pool of jobs workers, saving progress to
+    state (unless this is a dry run). returns the state dict."""
+
+    if state is None:
+        state = {"done": {}, "failed": {}}
+
+    lock = threading.Lock()
+    total = len(users)
+    count = [0]
+
+    def work(user):
+        result = rebuild_user(user, home, dry_run, niceness)
+        if pause:
+            time.sleep(pause)
+        return result
+
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+    futures = [pool.submit(work, user) for user in users]
+
+    try:
+        for future in concurrent.futures.as_completed(futures):
+            user, result, error = future.result()
+            with lock:
+                count[0] += 1
+                if error:
+                    state["failed"][user] = error
+                    status = "FAILED: " + error
+                else:
+                    state["failed"].pop(user, None)
+                    state["done"][user] = result
+                    if dry_run:
+                        status = "{changed} of {pages} pages would change".format(**result)
+                    else:
+                        status = "{pages} pages, {changed} changed".format(
+                                pages=result.get("pages", 0), changed=result.get("changed", "?"))
+                if not dry_run:
+                    save_state(state, state_path)
+                print("[{n}/{total}] ~{user}: {status}".format(n=count[0], total=total,
+                    user=user, status=status))
+    except KeyboardInterrupt:
+        # let the users already in progress finish, but don't start any more
+        pool.shutdown(wait=True, cancel_futures=True)
+        raise
+
+    pool.shutdown()
+
+    return state
+
+def report(state, dry_run=False):
+    done = state.get("done", {})
+    failed = state.get("failed", {})
+
+    print("")
+    if dry_run:
+        changed = sum(result.get("changed", 0) for result in done.values())
+        pages = sum(result.get("pages", 0) for result in done.values())
+        print("{changed} of {pages} pages across {users} users would change".format(
+            changed=changed, pages=pages, users=len(done)))
+    else:
+        print("rebuilt {users} users ({pages} pages, {changed} changed)".format(users=len(done),
+            pages=sum(result.get("pages", 0) for result in done.values()),
+            changed=sum(result.get("changed", 0) for result in done.values())))
+
+    if failed:
+        print("\n{count} users failed:".format(count=len(failed)))
+        for user in sorted(failed):
+            print("\t~{user}: {error}".format(user=user, error=failed[user]))
+
+def cmd_rebuild(args):
+    users = args.users or find_publishers(args.home)
+
+    state = {"done": {}, "failed": {}}
+    if args.resume and not args.dry_run:
+        state = load_state(args.state)
+        users = [user for user in users if user not in state["done"]]
+        print("resuming; {done} users already rebuilt".format(done=len(state["done"])))
+
+    if not users:
+        print("nobody left to rebuild!")
+        return 0
+
+    print("{action} {count} users with {jobs} workers...".format(
+        action="checking" if args.dry_run else "rebuilding", count=len(users),
+        jobs=args.jobs))
+
+    state = rebuild_all(users, args.home, args.jobs, args.dry_run, args.nice,
+            args.pause, state, args.state)
+    report(state, args.dry_run)
+
+    if state["failed"]:
+        return 1
+    if not args.dry_run and os.path.exists(args.state):
+        os.remove(args.state)
+
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="ttbp-admin",
+            description="server-side maintenance for ttbp")
+    subs = parser.add_subparsers(dest="command")
+
+    rebuild = subs.add_parser("rebuild",
+            help="rebuild every publishing user's html and gopher output")
+    rebuild.add_argument("users", nargs="*",
+            help="only rebuild these users (default: everyone publishing)")
+    rebuild.add_argument("--jobs", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+            help="how many users to rebuild at once")
+    rebuild.add_argument("--nice", type=int, default=10,
+            help="cpu niceness for the workers (io runs at idle priority if ionice is around)")
+    rebuild.add_argument("--pause", type=float, default=0,
+            help="seconds each worker rests between users")
+    rebuild.add_argument("--dry-run", action="store_true",
+            help="don't write anything; report how many pages would change")
+    rebuild.add_argument("--resume", action="store_true",
+            help="skip users finished by an interrupted run")
+    rebuild.add_argument("--state", default=STATE,
+            help="where to keep progress for --resume")
+    rebuild.add_argument("--home", default="/home",
+            help="directory containing townie home directories")
+    rebuild.set_defaults(func=cmd_rebuild)
+
+    args = parser.parse_args(argv)
+    if not getattr(args, "func", None):
+        parser.print_usage(sys.stderr)
+        return 2
+
+    try:
+        return args.func(args)
+    except KeyboardInterrupt:
+        print("\ninterrupted! run again with --resume to pick up where this left off.")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
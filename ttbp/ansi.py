@@ -0,0 +1,197 @@
+"""
+This module contains the terminal markdown renderer for reading feels.
+
+entries are parsed with mistune, the same parser core.write_entry() uses for
+html, but rendered to ANSI-formatted text for the terminal: bold and italics,
+highlighted headers, indented quotes and code, numbered lists, and links with
+their urls. html in entries is reduced to its text, and comments are hidden,
+like a browser would.
+
+rendering is cached by a hash of the entry's text, so opening the same entry
+again (or paging to one the pager already read ahead) costs nothing.
+"""
+import collections
+import hashlib
+import re
+import shutil
+import textwrap
+import threading
+from html import unescape
+
+import mistune
+
+from . import util
+
+BOLD = "\033[1m"
+DIM = "\033[2m"
+ITALIC = "\033[3m"
+UNDERLINE = "\033[4m"
+STRIKE = "\033[9m"
+CYAN = "\033[36m"
+RESET = "\033[0m"
+
+# how many rendered entries to keep; the least recently read go first
+CACHE_SIZE = 128
+# rendered text is wrapped to the terminal, but never wider than this
+MAX_WIDTH = 80
+
+COMMENTS = re.compile(r'<!--.*?-->', re.S)
+TAGS = re.compile(r'<[^>]*>')
+
+CACHE = collections.OrderedDict()
+LOCK = threading.Lock()
+
+
+def strip_html(html):
+    '''
+    text content of an html fragment, minus comments and tags
+    '''
+
+    return util.show_controls(unescape(TAGS.sub("", COMMENTS.sub("", html))))
+
+def indent(text, prefix):
+    return "".join(prefix + line if line.strip() else line
+            for line in text.splitlines(True))
+
+class AnsiRenderer(mistune.Renderer):
+    '''
+    mistune renderer that makes ANSI terminal text instead of html
+    '''
+
+    def __init__(self, width=MAX_WIDTH, **kwargs):
+        mistune.Renderer.__init__(self, **kwargs)
+        self.width = width
+
+    def wrap(self, text, prefix=""):
+        return "\n".join(textwrap.fill(line, self.width, initial_indent=prefix,
+            subsequent_indent=prefix) for line in text.split("\n"))
+
+    ## blocks
+
+    def block_code(self, code, lang=None):
+        return indent(DIM + code.rstrip("\n") + RESET, "    ") + "\n\n"
+
+    def block_quote(self, text):
+        return indent(text.rstrip("\n"), DIM + "| " + RESET) + "\n\n"
+
+    def block_html(self, html):
+        text = strip_html(html).strip()
+        if not text:
+            return ""
+        return self.wrap(text) + "\n\n"
+
+    def header(self, text, level, raw=None):
+        return BOLD + CYAN + "#" * level + " " + text + RESET + "\n\n"
+
+    def hrule(self):
+        return DIM + "-" * min(self.width, 40) + RESET + "\n\n"
+
+    def list(self, body, ordered=True):
+        if ordered:
+            items = body.split("\0")
+            body = items[0]
+            for number, item in enumerate(items[1:], 1):
+                body += "{number}. ".format(number=number) + item
+        else:
+            body = body.replace("\0", "* ")
+        # \1 marks where a list starts, so a list nested in an item goes on
+        # its own line; render() drops the ones left at the top level
+        return "\1" + indent(body, "  ") + "\n"
+
+    def list_item(self, text):
+        text = text.replace("\1", "\n").strip("\n")
+        lines = text.split("\n")
+        return "\0" + "\n".join([lines[0]] + ["   " + line for line in lines[1:]]) + "\n"
+
+    def paragraph(self, text):
+        return self.wrap(text.strip()) + "\n\n"
+
+    def table(self, header, body):
+        return header + DIM + "-" * min(self.width, 40) + RESET + "\n" + body + "\n"
+
+    def table_row(self, content):
+        return content.rstrip(" |") + "\n"
+
+    def table_cell(self, content, **flags):
+        if flags.get("header"):
+            content = BOLD + content + RESET
+        return content + " | "
+
+    ## inline
+
+    def double_emphasis(self, text):
+        return BOLD + text + RESET
+
+    def emphasis(self, text):
+        return ITALIC + text + RESET
+
+    def codespan(self, text):
+        return DIM + text + RESET
+
+    def linebreak(self):
+        return "\n"
+
+    def strikethrough(self, text):
+        return STRIKE + text + RESET
+
+    def text(self, text):
+        # entities like &#27; could spell out control characters again
+        return util.show_controls(unescape(text))
+
+    def escape(self, text):
+        return text
+
+    def autolink(self, link, is_email=False):
+        return UNDERLINE + link + RESET
+
+    def link(self, link, title, text):
+        if strip_html(text) == link:
+            return UNDERLINE + link + RESET
+        return UNDERLINE + text + RESET + " (" + link + ")"
+
+    def image(self, src, title, text):
+        return "[image: " + (text or src) + "] (" + src + ")"
+
+    def inline_html(self, html):
+        return strip_html(html)
+
+    def newline(self):
+        return ""
+
+def render(text, width=None):
+    '''
+    renders markdown text to ANSI terminal text, wrapped to width (the
+    terminal's width, up to MAX_WIDTH, if not given)
+
+    * the result is cached by a hash of the text and the width
+    '''
+
+    if width is None:
+        width = min(MAX_WIDTH, shutil.get_terminal_size().columns)
+
+    key = (hashlib.sha1(text.encode("utf-8")).hexdigest(), width)
+
+    with LOCK:
+        if key in CACHE:
+            CACHE.move_to_end(key)
+            return CACHE[key]
+
+    markdown = mistune.Markdown(renderer=AnsiRenderer(width, escape=False, hard_wrap=False))
+    rendered = markdown(text).replace("\1", "").rstrip("\n") + "\n"
+
+    with LOCK:
+        CACHE[key] = rendered
+        while len(CACHE) > CACHE_SIZE:
+            CACHE.popitem(last=False)
+
+    return rendered
+
+def render_file(filename):
+    '''
+    render() for an entry file; control characters in the entry are made
+    visible first (see util.show_controls()), so the only escapes that reach
+    the terminal are the renderer's own
+    '''
+
+    with open(filename, "r", errors="replace") as f:
+        return render(util.show_controls(f.read()))
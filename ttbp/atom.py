@@ -0,0 +1,208 @@
+"""
+This module contains the feed writers for published feels: each blog's Atom
+feed, the per-blog recent.json summary, and the town-wide Atom and JSON feeds.
+
+blog feeds are built from the html fragments core.render_entry() already made
+for the index, so a feed costs no extra markdown rendering. the town feeds are
+built by merging every blog's recent.json, so nobody's entries get reread.
+everything in a feed comes from the entries themselves (no "generated at"
+times), so the same entries always make the same bytes, and util.write_out()
+can skip rewriting feeds that haven't changed.
+"""
+import heapq
+import json
+import re
+import time
+from html import unescape
+from xml.sax.saxutils import escape, quoteattr
+
+from . import chatter
+from . import util
+
+ATOM_NS = "http://www.w3.org/2005/Atom"
+JSONFEED_VERSION = "https://jsonfeed.org/version/1.1"
+# excerpts are cut to about this many characters
+EXCERPT_LENGTH = 280
+TAGS = re.compile(r'<[^>]*>')
+
+
+def timestamp(mtime):
+    '''
+    RFC 3339 timestamp in utc for the given unix time
+    '''
+
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(mtime))
+
+def entry_body(chunk):
+    '''
+    takes a rendered entry chunk (bytes, from core.render_entry()) and returns
+    just the entry's html as a string, without the date heading and permalink
+    that wrap it on the blog page
+    '''
+
+    html = chunk.decode("utf-8")
+
+    start = html.find("</h5>")
+    if start != -1:
+        html = html[start+len("</h5>"):]
+
+    end = html.rfind("<p class=\"permalink\">")
+    if end != -1:
+        html = html[:end]
+
+    return html.strip()
+
+def excerpt(html, length=EXCERPT_LENGTH):
+    '''
+    plain text excerpt of an entry's html, cut at a word boundary
+    '''
+
+    text = " ".join(unescape(TAGS.sub(" ", html)).split())
+
+    if len(text) <= length:
+        return text
+
+    cut = text[:length].rsplit(" ", 1)[0]
+
+    return cut.rstrip(",.;:-")+"..."
+
+def entry_title(filename):
+    '''
+    "19 october 2026", like the heading on the blog page
+    '''
+
+    date = util.parse_date(filename)
+
+    return date[2]+" "+chatter.month(date[1])+" "+date[0]
+
+def user_feed(user, url, entries):
+    '''
+    atom feed generator
+
+    * user is the blog's owner, url is the blog's base url (ending in /)
+    * entries is a list of (filename, mtime, chunk) for the newest entries,
+      newest first
+    * returns the whole feed as utf-8 bytes
+    '''
+
+    updated = max([entry[1] for entry in entries] or [0])
+
+    feed = [
+        "<?xml version=\"1.0\" encoding=\"utf-8\"?>\n",
+        "<feed xmlns="+quoteattr(ATOM_NS)+" xml:base="+quoteattr(url)+">\n",
+        "\t<title>"+escape("~"+user+"'s feels")+"</title>\n",
+        "\t<id>"+escape(url)+"</id>\n",
+        "\t<link rel=\"alternate\" type=\"text/html\" href="+quoteattr(url)+" />\n",
+        "\t<link rel=\"self\" type=\"application/atom+xml\" href="+quoteattr(url+"feed.xml")+" />\n",
+        "\t<author><name>"+escape("~"+user)+"</name></author>\n",
+        "\t<updated>"+timestamp(updated)+"</updated>\n",
+    ]
+
+    for filename, mtime, chunk in entries:
+        permalink = url+"".join(util.parse_date(filename))+".html"
+        feed.extend([
+            "\t<entry>\n",
+            "\t\t<title>"+escape(entry_title(filename))+"</title>\n",
+            "\t\t<id>"+escape(permalink)+"</id>\n",
+            "\t\t<link rel=\"alternate\" type=\"text/html\" href="+quoteattr(permalink)+" />\n",
+            "\t\t<updated>"+timestamp(mtime)+"</updated>\n",
+            "\t\t<content type=\"html\">"+escape(entry_body(chunk))+"</content>\n",
+            "\t</entry>\n",
+        ])
+
+    feed.append("</feed>\n")
+
+    return "".join(feed).encode("utf-8")
+
+def recent_list(user, url, entries):
+    '''
+    summary of a blog's newest entries for the town feeds
+
+    * takes the same arguments as user_feed()
+    * returns utf-8 json: a list of {user, date, title, url, mtime, excerpt},
+      newest mtime first, which is the order merge_recent() needs
+    '''
+
+    recent = []
+    for filename, mtime, chunk in entries:
+        recent.append({
+            "user": user,
+            "date": "-".join(util.parse_date(filename)),
+            "title": entry_title(filename),
+            "url": url+"".join(util.parse_date(filename))+".html",
+            "mtime": mtime,
+            "excerpt": excerpt(entry_body(chunk)),
+            })
+
+    recent.sort(key=lambda entry: entry["mtime"], reverse=True)
+
+    return json.dumps(recent, indent=1, sort_keys=True).encode("utf-8")
+
+def merge_recent(lists, limit):
+    '''
+    merges per-blog recent lists into the newest limit entries across all of
+    them; each list is sorted newest first before merging, since they come
+    from files anyone could have edited
+    '''
+
+    key = lambda entry: -entry["mtime"]
+    merged = heapq.merge(*[sorted(entries, key=key) for entries in lists], key=key)
+
+    return [entry for i, entry in zip(range(limit), merged)]
+
+def town_atom(url, recent):
+    '''
+    town-wide atom feed of merged recent entries, with excerpts; url is the
+    town page's base url. returns utf-8 bytes
+    '''
+
+    updated = max([entry["mtime"] for entry in recent] or [0])
+
+    feed = [
+        "<?xml version=\"1.0\" encoding=\"utf-8\"?>\n",
+        "<feed xmlns="+quoteattr(ATOM_NS)+">\n",
+        "\t<title>tilde.town feels engine</title>\n",
+        "\t<id>"+escape(url)+"</id>\n",
+        "\t<link rel=\"alternate\" type=\"text/html\" href="+quoteattr(url)+" />\n",
+        "\t<link rel=\"self\" type=\"application/atom+xml\" href="+quoteattr(url+"feed.xml")+" />\n",
+        "\t<updated>"+timestamp(updated)+"</updated>\n",
+    ]
+
+    for entry in recent:
+        feed.extend([
+            "\t<entry>\n",
+            "\t\t<title>"+escape("~"+entry["user"]+": "+entry["title"])+"</title>\n",
+            "\t\t<id>"+escape(entry["url"])+"</id>\n",
+            "\t\t<link rel=\"alternate\" type=\"text/html\" href="+quoteattr(entry["url"])+" />\n",
+            "\t\t<author><name>"+escape("~"+entry["user"])+"</name></author>\n",
+            "\t\t<updated>"+timestamp(entry["mtime"])+"</updated>\n",
+            "\t\t<summary>"+escape(entry["excerpt"])+"</summary>\n",
+            "\t</entry>\n",
+        ])
+
+    feed.append("</feed>\n")
+
+    return "".join(feed).encode("utf-8")
+
+def town_json(url, recent):
+    '''
+    the same feed as town_atom(), as a JSON Feed. returns utf-8 bytes
+    '''
+
+    feed = {
+        "version": JSONFEED_VERSION,
+        "title": "tilde.town feels engine",
+        "home_page_url": url,
+        "feed_url": url+"feed.json",
+        "items": [{
+            "id": entry["url"],
+            "url": entry["url"],
+            "title": "~"+entry["user"]+": "+entry["title"],
+            "content_text": entry["excerpt"],
+            "summary": entry["excerpt"],
+            "date_modified": timestamp(entry["mtime"]),
+            "authors": [{"name": "~"+entry["user"]}],
+            } for entry in recent],
+    }
+
+    return json.dumps(feed, indent=1, sort_keys=True).encode("utf-8")
@@ -0,0 +1,271 @@
+"""
+This module contains the deduplicating backup store in config.BACKUPS.
+
+a backup used to be a whole tar.gz of the entries directory, every time. now
+a backup is a snapshot: a small json manifest (in SNAPSHOTS) listing each
+entry's name, mtime, and the sha256 of its contents. the contents themselves
+are stored once, zlib-compressed, as blobs named by that hash (in BLOBS), so
+an entry that hasn't changed since the last snapshot costs nothing to back up
+again.
+
+old snapshots are thinned out by a retention policy (see prune()): the newest
+few are always kept, plus the newest one from each of the last several days
+and weeks. blobs nobody refers to any more are deleted afterwards.
+
+any snapshot can be exported as a regular feels-backup tar.gz (with the same
+entries/ layout backups always had), or unpacked for core.process_backup() to
+load from.
+"""
+import datetime
+import hashlib
+import io
+import json
+import os
+import tarfile
+import time
+import zlib
+
+from . import config
+from . import util
+
+BLOBS = os.path.join(config.BACKUPS, "blobs")
+SNAPSHOTS = os.path.join(config.BACKUPS, "snapshots")
+MANIFEST_VERSION = 1
+
+# retention defaults; each can be changed in ttbprc
+KEEP_LAST = 5
+KEEP_DAILY = 7
+KEEP_WEEKLY = 8
+
+
+def setup():
+    for path in [config.BACKUPS, BLOBS, SNAPSHOTS]:
+        if not os.path.isdir(path):
+            os.mkdir(path)
+        os.chmod(path, 0o700)
+
+def blob_path(digest):
+    return os.path.join(BLOBS, digest[0:2], digest[2:])
+
+def manifest_path(snapshot):
+    return os.path.join(SNAPSHOTS, snapshot + ".json")
+
+def put_blob(data):
+    '''
+    stores data (bytes) if it isn't stored already; returns (digest, True if
+    it was new)
+    '''
+
+    digest = hashlib.sha256(data).hexdigest()
+    path = blob_path(digest)
+    if os.path.exists(path):
+        return digest, False
+
+    if not os.path.isdir(os.path.dirname(path)):
+        os.mkdir(os.path.dirname(path))
+    util.write_out(path, [zlib.compress(data, 9)])
+
+    return digest, True
+
+def get_blob(digest):
+    '''
+    the contents stored under digest; raises ValueError if the blob doesn't
+    match its name
+    '''
+
+    with open(blob_path(digest), "rb") as f:
+        data = zlib.decompress(f.read())
+
+    if hashlib.sha256(data).hexdigest() != digest:
+        raise ValueError("backup blob {digest} is damaged".format(digest=digest))
+
+    return data
+
+def snapshots():
+    '''
+    snapshot names, newest first
+    '''
+
+    try:
+        names = os.listdir(SNAPSHOTS)
+    except OSError:
+        return []
+
+    return sorted([os.path.splitext(name)[0] for name in names if name.endswith(".json")],
+            reverse=True)
+
+def load_manifest(snapshot):
+    with open(manifest_path(snapshot)) as f:
+        manifest = json.load(f)
+
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError("snapshot {snapshot} is from another version of ttbp".format(snapshot=snapshot))
+
+    return manifest
+
+def snapshot(source=config.MAIN_FEELS):
+    '''
+    backs up every file in source; returns (snapshot name, number of entries,
+    number of blobs that had to be stored). if nothing changed since the last
+    snapshot, no new one is made and the last one's name is returned
+    '''
+
+    setup()
+
+    entries = {}
+    stored = 0
+    for entry in sorted(os.scandir(source), key=lambda entry: entry.name):
+        if not entry.is_file():
+            continue
+        with open(entry.path, "rb") as f:
+            data = f.read()
+        digest, new = put_blob(data)
+        stored += new
+        entries[entry.name] = {"sha256": digest, "mtime": entry.stat().st_mtime, "size": len(data)}
+
+    previous = snapshots()
+    if previous:
+        try:
+            if load_manifest(previous[0])["entries"] == entries:
+                return previous[0], len(entries), 0
+        except (OSError, ValueError):
+            pass
+
+    name = time.strftime("%Y%m%d-%H%M%S")
+    count = 1
+    while os.path.exists(manifest_path(name)):
+        count += 1
+        name = time.strftime("%Y%m%d-%H%M%S") + "-" + str(count)
+
+    manifest = {"version": MANIFEST_VERSION, "time": time.time(), "entries": entries}
+    util.write_out(manifest_path(name), [json.dumps(manifest, indent=1, sort_keys=True).encode("utf-8")])
+
+    return name, len(entries), stored
+
+def extract(snapshot, dest):
+    '''
+    writes a snapshot's entries into dest (which is made if needed), with
+    their mtimes; returns the paths written
+    '''
+
+    manifest = load_manifest(snapshot)
+
+    if not os.path.isdir(dest):
+        os.makedirs(dest)
+    os.chmod(dest, 0o700)
+
+    written = []
+    for name, entry in sorted(manifest["entries"].items()):
+        path = os.path.join(dest, os.path.basename(name))
+        with open(path, "wb") as f:
+            f.write(get_blob(entry["sha256"]))
+        os.utime(path, (entry["mtime"], entry["mtime"]))
+        written.append(path)
+
+    return written
+
+def export(snapshot, tarball):
+    '''
+    writes a snapshot out as a tar.gz with everything under entries/, like
+    the backups `tar -C ~/.ttbp -czf ... entries` used to make
+    '''
+
+    manifest = load_manifest(snapshot)
+
+    with tarfile.open(tarball, "w:gz") as tar:
+        directory = tarfile.TarInfo("entries")
+        directory.type = tarfile.DIRTYPE
+        directory.mode = 0o700
+        directory.mtime = manifest["time"]
+        tar.addfile(directory)
+
+        for name, entry in sorted(manifest["entries"].items()):
+            data = get_blob(entry["sha256"])
+            info = tarfile.TarInfo("entries/" + os.path.basename(name))
+            info.size = len(data)
+            info.mtime = entry["mtime"]
+            info.mode = 0o600
+            tar.addfile(info, io.BytesIO(data))
+
+    os.chmod(tarball, 0o600)
+
+def kept(names, keep_last=KEEP_LAST, keep_daily=KEEP_DAILY, keep_weekly=KEEP_WEEKLY, today=None):
+    '''
+    which of the given snapshot names (newest first) a retention policy keeps:
+    the newest keep_last, plus the newest snapshot of each of the last
+    keep_daily days and keep_weekly weeks
+    '''
+
+    if today is None:
+        today = datetime.date.today()
+
+    keep = set(names[:keep_last])
+    days = set()
+    weeks = set()
+
+    for name in names:
+        try:
+            date = datetime.datetime.strptime(name[0:15], "%Y%m%d-%H%M%S").date()
+        except ValueError:
+            keep.add(name)
+            continue
+
+        if (today - date).days < keep_daily and date not in days:
+            days.add(date)
+            keep.add(name)
+
+        week = date - datetime.timedelta(days=date.weekday())
+        if (today - week).days < 7 * keep_weekly and week not in weeks:
+            weeks.add(week)
+            keep.add(name)
+
+    return keep
+
+def prune(settings={}):
+    '''
+    deletes the snapshots the retention policy doesn't keep, then the blobs
+    no snapshot uses any more; returns (snapshots deleted, blobs deleted)
+
+    * the policy comes from "backups kept", "daily backups kept", and
+      "weekly backups kept" in settings
+    '''
+
+    names = snapshots()
+    keep = kept(names, settings.get("backups kept", KEEP_LAST),
+            settings.get("daily backups kept", KEEP_DAILY),
+            settings.get("weekly backups kept", KEEP_WEEKLY))
+
+    dropped = 0
+    for name in names:
+        if name not in keep:
+            os.remove(manifest_path(name))
+            dropped += 1
+
+    used = set()
+    for name in snapshots():
+        try:
+            used.update(entry["sha256"] for entry in load_manifest(name)["entries"].values())
+        except (OSError, ValueError):
+            # can't tell what a damaged manifest needs, so keep everything
+            return dropped, 0
+
+    removed = 0
+    for prefix in os.listdir(BLOBS) if os.path.isdir(BLOBS) else []:
+        for rest in os.listdir(os.path.join(BLOBS, prefix)):
+            if prefix + rest not in used:
+                os.remove(os.path.join(BLOBS, prefix, rest))
+                removed += 1
+
+    return dropped, removed
+
+def store_size():
+    '''
+    bytes used by blobs and manifests
+    '''
+
+    total = 0
+    for path in [BLOBS, SNAPSHOTS]:
+        for root, dirs, files in os.walk(path):
+            total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+
+    return total
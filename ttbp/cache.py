@@ -0,0 +1,203 @@
+"""
+This module contains the shared cache that every ttbp session on the host
+reads from and fills in, under config.VAR.
+
+a lot of what a session works out is the same for everyone: who has a ttbp,
+what's in their ttbprc, which entry is their newest, the town page's rendered
+README. the cache keeps those in a few json tables in CACHE_DIR, one file per
+table, shared by all sessions:
+
+* each item in a table remembers the mtime and size of the files it was
+  worked out from; if any of those moved (or, for items with a max age, if
+  it's too old), the item is worked out again
+* a session that has to work something out takes the table's fcntl lock
+  first and then looks again, so when several sessions need the same thing
+  at once, one of them computes it and the rest reuse it
+* tables carry a version; a table from another version, or one that isn't
+  valid json, is treated as empty and gets rewritten, so any session repairs
+  a corrupt cache just by using it
+* anyone can write to the tables, so nothing read back is trusted: callers
+  pass a check that every value has to pass (anything else is worked out
+  again), and nothing that goes into a page as-is (like rendered html) is
+  kept here at all
+* if the cache can't be used at all (permissions, a full disk), everything
+  is just worked out directly, like before
+"""
+import fcntl
+import json
+import os
+import threading
+import time
+
+from . import config
+from . import util
+
+CACHE_DIR = os.path.join(config.VAR, "cache")
+# bump this when the shape of any table changes
+VERSION = 2
+
+# parsed tables, by name: (stamp of the table file, table)
+TABLES = {}
+LOCK = threading.Lock()
+
+
+def stamp(path):
+    '''
+    [mtime_ns, size] for path, or None if it can't be stat()ed
+    '''
+
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    return [st.st_mtime_ns, st.st_size]
+
+def table_path(name):
+    return os.path.join(CACHE_DIR, name + ".json")
+
+def setup():
+    '''
+    makes CACHE_DIR if it isn't there yet; it's writable by everyone, so any
+    session can refresh (or repair) any table, and sticky, so nobody can
+    delete or rename anyone else's files in it
+    '''
+
+    if not os.path.isdir(CACHE_DIR):
+        try:
+            os.mkdir(CACHE_DIR)
+        except FileExistsError:
+            pass
+
+    if os.stat(CACHE_DIR).st_mode & 0o7777 != 0o1777:
+        try:
+            os.chmod(CACHE_DIR, 0o1777)
+        except OSError:
+            # not ours; whoever made it can fix it
+            pass
+
+def load_table(name):
+    '''
+    the named table as a dict of item: {"stamp", "time", "value"}; empty if
+    it's missing, corrupt, or from another version
+    '''
+
+    path = table_path(name)
+    current = stamp(path)
+
+    with LOCK:
+        cached = TABLES.get(name)
+    if cached is not None and current is not None and cached[0] == current:
+        return cached[1]
+
+    try:
+        with open(path) as f:
+            table = json.load(f)
+    except (OSError, ValueError):
+        table = None
+
+    if (not isinstance(table, dict) or table.get("version") != VERSION or
+            not isinstance(table.get("items"), dict)):
+        table = {"version": VERSION, "items": {}}
+
+    with LOCK:
+        TABLES[name] = (current, table)
+
+    return table
+
+def fresh(entry, sources, max_age, check=None):
+    '''
+    checks a table item against the current stamps of its sources, and its
+    value against check, if there is one
+    '''
+
+    if not isinstance(entry, dict) or "value" not in entry:
+        return False
+
+    if check is not None and not check(entry["value"]):
+        return False
+
+    if entry.get("stamp") != [stamp(source) for source in sources]:
+        return False
+
+    if max_age is not None and time.time() - entry.get("time", 0) > max_age:
+        return False
+
+    return True
+
+def lookup_many(name, items, compute, max_age=None, check=None):
+    '''
+    returns a dict of item: value from the named table, working out (and
+    saving) the ones that are missing or stale
+
+    * items is a dict of item: the list of files its value depends on
+    * compute is called with an item and returns its value, which has to be
+      json-serializable
+    * items older than max_age seconds are stale too, if it's given
+    * check, if it's given, is called with each value read back from the
+      table and returns True if it's usable; since anyone can write to the
+      table, it should check everything the caller relies on
+    '''
+
+    try:
+        setup()
+        table = load_table(name)
+    except OSError:
+        return dict((item, compute(item)) for item in items)
+
+    values = {}
+    stale = []
+    for item, sources in items.items():
+        entry = table["items"].get(item)
+        if fresh(entry, sources, max_age, check):
+            values[item] = entry["value"]
+        else:
+            stale.append(item)
+
+    if not stale:
+        return values
+
+    try:
+        # opened read-only, so any session can lock a file another one made
+        lockfile = os.fdopen(os.open(os.path.join(CACHE_DIR, name + ".lock"),
+            os.O_RDONLY | os.O_CREAT, 0o666))
+    except OSError:
+        values.update((item, compute(item)) for item in stale)
+        return values
+
+    with lockfile:
+        fcntl.flock(lockfile, fcntl.LOCK_EX)
+
+        # someone else may have filled these in while we waited
+        table = load_table(name)
+        changed = False
+        for item in stale:
+            sources = items[item]
+            entry = table["items"].get(item)
+            if not fresh(entry, sources, max_age, check):
+                before = [stamp(source) for source in sources]
+                entry = {"stamp": before, "time": time.time(), "value": compute(item)}
+                table["items"][item] = entry
+                changed = True
+            values[item] = entry["value"]
+
+        if changed:
+            try:
+                util.write_out(table_path(name), [json.dumps(table, sort_keys=True).encode("utf-8")])
+                try:
+                    os.chmod(table_path(name), 0o666)
+                except OSError:
+                    pass
+            except OSError:
+                pass
+            with LOCK:
+                TABLES[name] = (stamp(table_path(name)), table)
+
+    return values
+
+def lookup(name, item, sources, compute, max_age=None, check=None):
+    '''
+    lookup_many() for a single item; compute takes no arguments here
+    '''
+
+    return lookup_many(name, {item: sources}, lambda item: compute(), max_age, check)[item]
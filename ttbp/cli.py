@@ -0,0 +1,496 @@
+"""
+This module contains ttbp's command line entry point.
+
+with no arguments, it starts the interactive feels engine as always. with a
+subcommand, it does one job without prompting and exits, so feels can be
+scripted or run from cron:
+
+    ttbp publish                 republish anything that changed
+    ttbp rebuild --full          rewrite every page
+    ttbp rebuild --dry-run       count pages a full rebuild would change
+    ttbp feed --json             recent town entries
+    ttbp neighbors --json        everyone on ttbp, by most recent post
+    ttbp onthisday --town        entries from this day in past years
+    ttbp history 2026-10-19      saved versions of an entry (and diff, restore)
+    ttbp backup                  snapshot your entries into the backup store
+    ttbp backup --export         write the newest snapshot out as a tar.gz
+    ttbp stats                   numbers about your own feels
+    ttbp stats --town            the same for everyone, with a heatmap
+    ttbp watch                   republish whenever entries change on disk
+
+the interactive interface is only imported when it's needed, so subcommands
+start up quickly.
+
+exit codes: 0 for success, 1 if the job couldn't be done, 2 for bad
+arguments, 3 if there's no ttbp account to work with.
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+
+from . import backup
+from . import config
+from . import core
+from . import revisions
+from . import stats as townstats
+from . import util
+from . import wordcount
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_NOACCOUNT = 3
+
+
+def load_settings(publish=False, dry_run=False):
+    """loads the user's ttbprc into core without publishing anything (or,
+    with dry_run=True, without writing anything at all); returns the
+    settings, or None if there's no usable account"""
+
+    try:
+        settings = json.load(open(config.TTBPRC))
+    except (OSError, ValueError):
+        sys.stderr.write("ttbp: no usable ttbprc at {path}; run ttbp to set up your feels.\n".format(
+            path=config.TTBPRC))
+        return None
+
+    core.load(settings, publish=publish, dry_run=dry_run)
+
+    return settings
+
+def parse_since(value):
+    """argparse type for YYYY-MM-DD or YYYYMMDD dates"""
+
+    for fmt in ("%Y-%m-%d", "%Y%m%d"):
+        try:
+            return datetime.datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+
+    raise argparse.ArgumentTypeError("expected a date like YYYY-MM-DD, got " + repr(value))
+
+def write_json(data):
+    json.dump(data, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write("\n")
+
+## subcommands
+
+def cmd_publish(args):
+    if load_settings() is None:
+        return EXIT_NOACCOUNT
+
+    if not core.publishing():
+        sys.stderr.write("ttbp: publishing is turned off; nothing to do.\n")
+        return EXIT_FAILED
+
+    util.reset_writes()
+    written = core.publish_stale()
+    print("republished {count} stale {pages}; {changed} files changed, {unchanged} unchanged".format(
+        count=len(written), pages="page" if len(written) == 1 else "pages",
+        **util.WRITES))
+
+    return EXIT_OK
+
+def cmd_rebuild(args):
+    if load_settings(dry_run=args.dry_run) is None:
+        return EXIT_NOACCOUNT
+
+    if not core.publishing():
+        sys.stderr.write("ttbp: publishing is turned off; nothing to do.\n")
+        return EXIT_FAILED
+
+    if args.dry_run:
+        changed = core.changed_pages()
+        if args.json:
+            write_json({"pages": len(core.FILES) + 1, "changed": len(changed)})
+        else:
+            print("{changed} of {pages} pages would change".format(
+                changed=len(changed), pages=len(core.FILES) + 1))
+        return EXIT_OK
+
+    if not args.full:
+        return cmd_publish(args)
+
+    util.reset_writes()
+    if core.publish_locked(full=True) is None:
+        sys.stderr.write("ttbp: another session is publishing right now; it'll do the rebuild next.\n")
+
+    if args.json:
+        write_json({"pages": len(core.FILES) + 1, "changed": util.WRITES["changed"],
+            "unchanged": util.WRITES["unchanged"]})
+    else:
+        print("rebuilt {count} pages; {changed} files changed, {unchanged} unchanged".format(
+            count=len(core.FILES), **util.WRITES))
+
+    return EXIT_OK
+
+def cmd_feed(args):
+    delta = 30
+    if args.since:
+        delta = (datetime.date.today() - args.since).days + 1
+        if delta < 1:
+            delta = 1
+
+    metas = core.town_feed(core.find_ttbps(), delta, args.limit)
+
+    if args.json:
+        write_json([{
+            "user": entry[5],
+            "date": entry[4],
+            "path": entry[0],
+            "mtime": entry[1],
+            "words": entry[2],
+        } for entry in metas])
+    else:
+        for entry in metas:
+            print("~{user}\t{date}\t{words} words\t{path}".format(
+                user=entry[5], date=entry[4], words=entry[2], path=entry[0]))
+
+    return EXIT_OK
+
+def cmd_onthisday(args):
+    if load_settings() is None:
+        return EXIT_NOACCOUNT
+
+    metas = core.on_this_day(args.date, town=args.town)
+
+    if args.json:
+        write_json([{
+            "user": entry[5],
+            "date": entry[4],
+            "path": entry[0],
+            "mtime": entry[1],
+            "words": entry[2],
+        } for entry in metas])
+    else:
+        for entry in metas:
+            print("~{user}\t{date}\t{words} words\t{path}".format(
+                user=entry[5], date=entry[4], words=entry[2], path=entry[0]))
+
+    return EXIT_OK
+
+def cmd_neighbors(args):
+    info = core.town_neighbors(core.find_ttbps())
+
+    neighbors = []
+    for user in sorted(info, key=lambda user: info[user].get("last", 0), reverse=True):
+        url = None
+        if info[user].get("publishing") and info[user].get("publish dir"):
+            url = config.LIVE + user + "/" + info[user].get("publish dir")
+        neighbors.append({"user": user, "url": url, "last": info[user].get("last", 0)})
+
+    if args.json:
+        write_json(neighbors)
+    else:
+        for neighbor in neighbors:
+            last = "never"
+            if neighbor["last"]:
+                last = time.strftime("%Y-%m-%d %H:%M", time.localtime(neighbor["last"]))
+            print("~{user}\t{last}\t{url}".format(user=neighbor["user"], last=last,
+                url=neighbor["url"] or ""))
+
+    return EXIT_OK
+
+def cmd_stats(args):
+    if load_settings() is None:
+        return EXIT_NOACCOUNT
+
+    if args.town:
+        return town_stats(args)
+
+    filenames = sorted(os.path.join(config.MAIN_FEELS, name)
+            for name in os.listdir(config.MAIN_FEELS) if core.valid(name))
+    words = [entry[2] for entry in core.meta(filenames) if isinstance(entry[2], int)]
+
+    buried = 0
+    if os.path.isdir(config.BURIED_FEELS):
+        buried = len(os.listdir(config.BURIED_FEELS))
+
+    stats = {
+        "user": config.USER,
+        "entries": len(filenames),
+        "words": sum(words),
+        "nopub": len([name for name in filenames if core.nopub(name)]),
+        "buried": buried,
+        "first": "-".join(util.parse_date(filenames[0])) if filenames else None,
+        "last": "-".join(util.parse_date(filenames[-1])) if filenames else None,
+        "publishing": bool(core.publishing()),
+        "gopher": bool(core.SETTINGS.get("gopher")),
+    }
+
+    today = datetime.date.today().toordinal()
+    index = townstats.update([config.USER], core.valid)
+    activity = townstats.Activity.from_index(index, [config.USER])
+    numbers = townstats.summarize(activity, today)
+    for key in ["current streak", "longest streak", "last 30 days"]:
+        stats[key] = numbers[key]
+
+    if args.json:
+        write_json(stats)
+    else:
+        for key in ["user", "entries", "words", "nopub", "buried", "first", "last",
+                "publishing", "gopher", "current streak", "longest streak", "last 30 days"]:
+            print("{key}:\t{value}".format(key=key, value=stats[key]))
+        print("")
+        print("\n".join(townstats.heatmap_lines(activity, today)))
+
+    return EXIT_OK
+
+def town_stats(args):
+    """'ttbp stats --town': the same numbers for everyone on ttbp"""
+
+    users = core.find_ttbps()
+    today = datetime.date.today().toordinal()
+    activity = townstats.Activity.from_index(townstats.update(users, core.valid), users)
+    town = townstats.summarize(activity, today)
+
+    if args.json:
+        town["writers"] = dict((user, townstats.summarize(activity.select(user), today))
+                for user in activity.users)
+        town["words per month"] = dict(townstats.monthly_words(activity, today))
+        write_json(town)
+        return EXIT_OK
+
+    for key in ["entries", "words", "days", "current streak", "longest streak",
+            "last 30 days", "first", "last"]:
+        print("{key}:\t{value}".format(key=key, value=town[key]))
+    print("")
+    print("\n".join(townstats.heatmap_lines(activity, today)))
+    print("")
+    for month, words in townstats.monthly_words(activity, today):
+        print("{month}\t{words}".format(month=month, words=words))
+
+    return EXIT_OK
+
+def entry_for(date):
+    """entry filename for a date from parse_since()"""
+
+    return os.path.join(config.MAIN_FEELS, date.strftime("%Y%m%d") + ".txt")
+
+def cmd_history(args):
+    if load_settings() is None:
+        return EXIT_NOACCOUNT
+
+    if args.date is None:
+        names = revisions.entries()
+        if args.json:
+            write_json({"entries": dict((name, len(revisions.versions(name))) for name in names),
+                "bytes": revisions.size()})
+            return EXIT_OK
+        for name in names:
+            print("{date}\t{count} versions".format(date="-".join(util.parse_date(name)),
+                count=len(revisions.versions(name))))
+        print("{count} entries with history, {size:.1f}KB stored".format(count=len(names),
+            size=revisions.size() / 1024.0))
+        return EXIT_OK
+
+    history = revisions.versions(entry_for(args.date))
+    if not history:
+        sys.stderr.write("ttbp: no history for {date}.\n".format(date=args.date))
+        return EXIT_FAILED
+
+    listing = [{
+        "version": number,
+        "time": when,
+        "words": wordcount.count_bytes("".join(lines).encode("utf-8"))[0],
+    } for number, (when, lines) in enumerate(history)]
+
+    if args.json:
+        write_json(listing)
+    else:
+        for entry in listing:
+            print("{version}\t{when}\t{words} words".format(version=entry["version"],
+                when=time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["time"])),
+                words=entry["words"]))
+
+    return EXIT_OK
+
+def cmd_diff(args):
+    if load_settings() is None:
+        return EXIT_NOACCOUNT
+
+    lines = revisions.diff(entry_for(args.date), args.old, args.new)
+    if lines is None:
+        sys.stderr.write("ttbp: {date} doesn't have versions {old} and {new}; see 'ttbp history {date}'.\n".format(
+            date=args.date, old=args.old, new=args.new))
+        return EXIT_FAILED
+
+    sys.stdout.writelines(line if line.endswith("\n") else line + "\n" for line in lines)
+
+    return EXIT_OK
+
+def cmd_restore(args):
+    if load_settings() is None:
+        return EXIT_NOACCOUNT
+
+    filename = entry_for(args.date)
+    if not revisions.restore(filename, args.version, core.SETTINGS):
+        sys.stderr.write("ttbp: {date} doesn't have a version {version}; see 'ttbp history {date}'.\n".format(
+            date=args.date, version=args.version))
+        return EXIT_FAILED
+
+    print("restored {date} to version {version}; the text it replaced is now version 1".format(
+        date=args.date, version=args.version))
+
+    if core.publishing():
+        core.publish_changes([os.path.basename(filename)])
+
+    return EXIT_OK
+
+def cmd_backup(args):
+    if load_settings() is None:
+        return EXIT_NOACCOUNT
+
+    if args.list:
+        names = backup.snapshots()
+        listing = []
+        for name in names:
+            manifest = backup.load_manifest(name)
+            listing.append({"snapshot": name, "entries": len(manifest["entries"]),
+                "bytes": sum(entry["size"] for entry in manifest["entries"].values())})
+        if args.json:
+            write_json({"snapshots": listing, "stored": backup.store_size()})
+            return EXIT_OK
+        for entry in listing:
+            print("{snapshot}\t{entries} entries\t{size:.1f}KB".format(snapshot=entry["snapshot"],
+                entries=entry["entries"], size=entry["bytes"] / 1024.0))
+        print("{count} snapshots, {size:.1f}KB stored".format(count=len(names),
+            size=backup.store_size() / 1024.0))
+        return EXIT_OK
+
+    if args.export is not None:
+        names = backup.snapshots()
+        name = args.export or (names[0] if names else None)
+        if name not in names:
+            sys.stderr.write("ttbp: no snapshot {name}; see 'ttbp backup --list'.\n".format(
+                name=name))
+            return EXIT_FAILED
+        tarball = os.path.join(os.path.expanduser("~"), "feels-backup-" + name + ".tar.gz")
+        backup.export(name, tarball)
+        print(tarball)
+        return EXIT_OK
+
+    name, count, stored = backup.snapshot()
+    dropped, removed = backup.prune(core.SETTINGS)
+
+    if args.json:
+        write_json({"snapshot": name, "entries": count, "stored": stored,
+            "pruned": dropped, "blobs removed": removed})
+    else:
+        print("snapshot {name}: {count} entries, {stored} new; pruned {dropped} old snapshots".format(
+            name=name, count=count, stored=stored, dropped=dropped))
+
+    return EXIT_OK
+
+def cmd_watch(argv):
+    from . import watch
+
+    return watch.main(argv)
+
+## parser
+
+def make_parser():
+    parser = argparse.ArgumentParser(prog="ttbp",
+            description="the tilde.town feels engine. run without a subcommand for the interactive menus.")
+    subs = parser.add_subparsers(dest="command")
+
+    publish = subs.add_parser("publish", help="republish entries that changed since the last publish")
+    publish.set_defaults(func=cmd_publish)
+
+    rebuild = subs.add_parser("rebuild", help="rebuild your published pages")
+    rebuild.add_argument("--full", action="store_true",
+            help="rewrite every page instead of just the changed ones")
+    rebuild.add_argument("--dry-run", action="store_true",
+            help="don't write anything, just count the pages a full rebuild would change")
+    rebuild.add_argument("--json", action="store_true", help="print json")
+    rebuild.set_defaults(func=cmd_rebuild)
+
+    feed = subs.add_parser("feed", help="list recent entries from around town")
+    feed.add_argument("--json", action="store_true", help="print json")
+    feed.add_argument("--since", type=parse_since,
+            help="only entries dated on or after YYYY-MM-DD (default: last 30 days)")
+    feed.add_argument("--limit", type=int, default=50,
+            help="at most this many entries (0 for no limit)")
+    feed.set_defaults(func=cmd_feed)
+
+    neighbors = subs.add_parser("neighbors", help="list everyone on ttbp by most recent post")
+    neighbors.add_argument("--json", action="store_true", help="print json")
+    neighbors.set_defaults(func=cmd_neighbors)
+
+    onthisday = subs.add_parser("onthisday", help="list your entries from this day in past years")
+    onthisday.add_argument("--json", action="store_true", help="print json")
+    onthisday.add_argument("--town", action="store_true",
+            help="include everyone's published entries too")
+    onthisday.add_argument("--date", type=parse_since,
+            help="look back from YYYY-MM-DD instead of today")
+    onthisday.set_defaults(func=cmd_onthisday)
+
+    history = subs.add_parser("history", help="list saved versions of your entries")
+    history.add_argument("date", nargs="?", type=parse_since,
+            help="the entry's date, YYYY-MM-DD (leave out to list every entry with history)")
+    history.add_argument("--json", action="store_true", help="print json")
+    history.set_defaults(func=cmd_history)
+
+    diff = subs.add_parser("diff", help="show what changed between two versions of an entry")
+    diff.add_argument("date", type=parse_since, help="the entry's date, YYYY-MM-DD")
+    diff.add_argument("old", type=int, nargs="?", default=1,
+            help="the older version (default 1, the one before the newest)")
+    diff.add_argument("new", type=int, nargs="?", default=0,
+            help="the newer version (default 0, the newest)")
+    diff.set_defaults(func=cmd_diff)
+
+    restore = subs.add_parser("restore", help="put an older version of an entry back")
+    restore.add_argument("date", type=parse_since, help="the entry's date, YYYY-MM-DD")
+    restore.add_argument("version", type=int, help="the version to restore (see 'ttbp history')")
+    restore.set_defaults(func=cmd_restore)
+
+    backups = subs.add_parser("backup", help="snapshot your entries into the backup store")
+    backups.add_argument("--list", action="store_true", help="list snapshots instead of making one")
+    backups.add_argument("--export", nargs="?", const="", metavar="SNAPSHOT",
+            help="write a snapshot (default: the newest) to a tar.gz in your home directory")
+    backups.add_argument("--json", action="store_true", help="print json")
+    backups.set_defaults(func=cmd_backup)
+
+    stats = subs.add_parser("stats", help="show numbers about your feels")
+    stats.add_argument("--json", action="store_true", help="print json")
+    stats.add_argument("--town", action="store_true",
+            help="numbers for everyone on ttbp instead of just you")
+    stats.set_defaults(func=cmd_stats)
+
+    # 'ttbp watch' has its own parser (see watch.main()); it's only listed
+    # here so it shows up in --help
+    subs.add_parser("watch", help="republish whenever your entries change on disk")
+
+    return parser
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if not argv:
+        from . import ttbp
+
+        return ttbp.main()
+
+    if argv[0] == "watch":
+        return cmd_watch(argv[1:])
+
+    args = make_parser().parse_args(argv)
+    if not getattr(args, "func", None):
+        make_parser().print_usage(sys.stderr)
+        return EXIT_USAGE
+
+    try:
+        return args.func(args)
+    except KeyboardInterrupt:
+        return EXIT_FAILED
+    except OSError as e:
+        sys.stderr.write("ttbp: {error}\n".format(error=e))
+        return EXIT_FAILED
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -28,7 +28,9 @@ FEEDBOX = "endorphant@tilde.town"
 USERFILE = os.path.join(VAR, "users.txt")
 GRAFF_DIR = os.path.join(VAR, "graffiti")
 WALL = os.path.join(GRAFF_DIR, "wall.txt")
-WALL_LOCK = os.path.join(GRAFF_DIR, ".lock")
+WALL_LOG = os.path.join(GRAFF_DIR, "wall.log")
+WALL_STATE = os.path.join(GRAFF_DIR, "wall.state")
+FEEDD_SOCKET = os.path.join(VAR, "feedd.sock")
 
 if not os.path.isdir(GRAFF_DIR):
     os.mkdir(GRAFF_DIR)
@@ -41,6 +43,7 @@ DEFAULT_HEADER = """
   <head>
     <title>$USER on TTBP</title>
     <link rel="stylesheet" href="style.css" />
+    <link rel="alternate" type="application/atom+xml" href="feed.xml" />
   </head>
   <body>
     <div id="meta">
@@ -75,7 +78,13 @@ MAIN_FEELS = os.path.join(PATH, "entries")
 BURIED_FEELS = os.path.join(PATH, "buried")
 NOPUB = os.path.join(USER_CONFIG, "nopub")
 BACKUPS = os.path.join(PATH, "backups")
+REVISIONS = os.path.join(PATH, "revisions")
+DB = os.path.join(PATH, "feels.db")
+STATS = os.path.join(PATH, "stats.json")
 SUBS = os.path.join(USER_CONFIG, "subs")
+SUBS_STATE = os.path.join(USER_CONFIG, "subs.json")
+PUBLISH_LOCK = os.path.join(PATH, ".publish.lock")
+PUBLISH_PENDING = os.path.join(PATH, ".publish.pending")
 
 ## UI
 
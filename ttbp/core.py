@@ -34,39 +34,116 @@ https://github.com/modgethanc/ttbp
 
 import os
 import time
+import datetime
+import concurrent.futures
+import gzip
+import html
 import subprocess
+import shutil
+import tempfile
+import threading
 import re
 import mistune
 import json
 
+from . import atom
+from . import backup
+from . import cache
 from . import chatter
 from . import config
+from . import dateindex
+from . import db
+from . import feedd
 from . import gopher
+from . import publock
+from . import revisions
+from . import stats
 from . import util
+from . import wordcount
 
 FEED = os.path.join("/home", "endorphant", "public_html", "ttbp", "index.html")
+FEED_URL = config.LIVE+"endorphant/ttbp/"
+# the town-wide feeds next to FEED carry this many entries, and the town page
+# shows the newest few of them
+TOWN_FEED_ENTRIES = 50
+TOWN_RECENT_SHOWN = 10
+# other users' recent.json fields are cut to these lengths (an excerpt ttbp
+# wrote is at most atom.EXCERPT_LENGTH plus "..."), and longer urls are skipped
+RECENT_TITLE_LENGTH = 100
+RECENT_EXCERPT_LENGTH = atom.EXCERPT_LENGTH + 3
+RECENT_URL_LENGTH = 2048
+# full rebuilds with at least this many entries get rendered in parallel; users
+# can override it with "parallel render threshold" in their ttbprc
+PARALLEL_THRESHOLD = 500
+# how many of the newest entries go in feed.xml; users can override it with
+# "feed entries" in their ttbprc (0 turns the feed off)
+FEED_ENTRIES = 20
+# the shared list of ttbp users is redone at least this often (seconds)
+USERS_MAX_AGE = 60
 SETTINGS = {}
 
 HEADER = ""
 FOOTER = ""
+PAGE_STAMP = None
+PAGE_HEAD = None
+PAGE_FOOT = None
 FILES = []
 NOPUBS = []
+RENDERED = {}
+# the sqlite metadata store, if "sqlite" is on in ttbprc (see db.py)
+DB = None
 
-def load(ttbprc={}):
+def load(ttbprc={}, publish=True, dry_run=False):
     '''
     get all them globals set up!!
+
+    * set publish=False to load everything without re-rendering html/gopher
+    * set dry_run=True to load without touching the disk at all: nopub pages
+      aren't taken down, and the sqlite store isn't opened
+    '''
+
+    global SETTINGS
+
+    load_layout()
+    SETTINGS = ttbprc
+
+    load_nopubs()
+    if not dry_run:
+        load_db()
+    load_files(publish=publish, dry_run=dry_run)
+
+def load_db():
+    '''
+    opens the sqlite metadata store if "sqlite" is on in ttbprc, or closes it
+    if it's been turned off
+
+    * if the store can't be opened, everything carries on from the filesystem
+    '''
+
+    global DB
+
+    if SETTINGS.get("sqlite"):
+        if DB is None:
+            try:
+                DB = db.Store(config.DB)
+            except db.sqlite3.Error:
+                DB = None
+    elif DB is not None:
+        DB.close()
+        DB = None
+
+def load_layout():
+    '''
+    (re)reads the user's html header and footer
     '''
 
     global HEADER
     global FOOTER
-    global SETTINGS
 
     HEADER = open(os.path.join(config.USER_CONFIG, "header.txt")).read()
     FOOTER = open(os.path.join(config.USER_CONFIG, "footer.txt")).read()
-    SETTINGS = ttbprc
 
-    load_nopubs()
-    load_files()
+    compile_layout()
 
 def reload_ttbprc(ttbprc={}):
     '''
@@ -77,42 +154,73 @@ def reload_ttbprc(ttbprc={}):
 
     SETTINGS = ttbprc
 
-def get_files(feelsdir=config.MAIN_FEELS):
+def sync_db():
+    '''
+    brings the sqlite store (if it's on) up to date with the entry
+    directories and the nopub list; done once per load or publish, so
+    get_files() and all_files() can just query it
+    '''
+
+    if DB is not None:
+        DB.reconcile(valid, NOPUBS, valid_buried)
+
+def get_files(feelsdir=config.MAIN_FEELS, unpublish=True):
     """Returns a list of user's feels in the given directory (defaults to main
-    feels dir)"""
+    feels dir), leaving out nopubs, and taking their pages down unless
+    unpublish=False. Uses the sqlite store, as of the last sync_db(), if it's
+    on."""
+
+    if DB is not None and feelsdir == config.MAIN_FEELS:
+        if unpublish:
+            for filename in DB.names(nopub=True):
+                unpublish_feel(filename)
+        return [os.path.join(feelsdir, filename) for filename in DB.names(nopub=False)]
 
     files = []
-    for filename in os.listdir(feelsdir):
+    for filename in dateindex.for_dir(feelsdir, valid).newest():
         if nopub(filename):
-            unpublish_feel(filename)
+            if unpublish:
+                unpublish_feel(filename)
         else:
             filename = os.path.join(feelsdir, filename)
-            if os.path.isfile(filename) and valid(filename):
+            if os.path.isfile(filename):
                 files.append(filename)
 
-    files.sort()
-    files.reverse()
-
     return files
 
-def load_files(feelsdir=config.MAIN_FEELS):
+def all_files():
+    """Returns every entry in the user's main feels dir, nopubs included,
+    newest first."""
+
+    if DB is not None:
+        return [os.path.join(config.MAIN_FEELS, filename) for filename in DB.names()]
+
+    return [os.path.join(config.MAIN_FEELS, filename)
+            for filename in dateindex.for_dir(config.MAIN_FEELS, valid).newest()]
+
+def load_files(feelsdir=config.MAIN_FEELS, publish=True, dry_run=False):
     '''
     file loader
 
     * reads user's nopub file
     * calls get_files() to load all files for given directory
-    * re-renders main html file and/or gopher if needed
+    * re-renders main html file and/or gopher if needed (unless publish=False);
+      the publish loads the files itself, so they're only loaded once
+    * dry_run=True only reads: the store isn't synced and nopub pages are
+      left up
     '''
 
     global FILES
 
     load_nopubs()
-    FILES = get_files(feelsdir)
 
-    if publishing():
-        write_html("index.html")
-        if SETTINGS.get('gopher'):
-            gopher.publish_gopher('feels', FILES)
+    if publish and not dry_run and publishing() and feelsdir == config.MAIN_FEELS:
+        if publish_locked(full=True) is not None:
+            return
+
+    if not dry_run:
+        sync_db()
+    FILES = get_files(feelsdir, unpublish=not dry_run)
 
 def load_nopubs():
     """Load a list of the user's nopub entries.
@@ -131,67 +239,312 @@ def load_nopubs():
 
 ## html outputting
 
-def write_html(outurl="default.html"):
+def compile_layout():
+    '''
+    page layout precompiler
+
+    * encodes the generated-on stamp, HEADER, and FOOTER into the byte chunks
+      every page starts and ends with
+    * called once per publish, since the stamp carries today's date
+    '''
+
+    global PAGE_STAMP
+    global PAGE_HEAD
+    global PAGE_FOOT
+
+    PAGE_STAMP = ("<!--generated by the tilde.town blogging platform on "+time.strftime("%d %B %y")+"\nhttp://tilde.town/~endorphant/ttbp/-->\n\n").encode("utf-8")
+    PAGE_HEAD = (HEADER+"\n").encode("utf-8")
+    PAGE_FOOT = FOOTER.encode("utf-8")
+
+def write_html(outurl="default.html", permalinks=True, www=None):
     '''
     main page renderer
 
     * takes everything currently in FILES and writes a single non-paginated html
     file
-    * calls write_page() on each file to make permalinks
+    * calls write_page() on each file to make permalinks (unless
+      permalinks=False, for when only the index needs to catch up)
+    * writes into config.WWW unless given another www directory
+    * full rebuilds of big blogs are rendered across a process pool (see
+      render_parallel()); the index keeps FILES order either way
+    * also refreshes feed.xml from the same rendered entries (see write_feed())
     '''
 
-    outfile = open(os.path.join(config.WWW, outurl), "w")
+    if www is None:
+        www = config.WWW
 
-    outfile.write("<!--generated by the tilde.town blogging platform on "+time.strftime("%d %B %y")+"\nhttp://tilde.town/~endorphant/ttbp/-->\n\n")
+    compile_layout()
 
-    for line in HEADER:
-        outfile.write(line)
+    rendered = None
+    if permalinks and len(FILES) >= SETTINGS.get("parallel render threshold", PARALLEL_THRESHOLD):
+        rendered = render_parallel(FILES, www)
 
-    outfile.write("\n")
+    def chunks():
+        yield PAGE_HEAD
+        for i, filename in enumerate(FILES):
+            if rendered is not None:
+                yield rendered[i]
+            else:
+                if permalinks:
+                    write_page(filename, www)
+                yield render_entry(filename)
+            yield b"\n"
+        yield PAGE_FOOT
 
-    for filename in FILES:
-        write_page(filename)
-        for line in write_entry(filename):
-            outfile.write(line)
+    write_published(os.path.join(www, outurl), chunks())
+    write_feed(www)
+
+    if permalinks and DB is not None and www == config.WWW:
+        DB.mark_published([os.path.basename(filename) for filename in FILES], time.time())
+
+    return blog_url()+outurl
+
+def blog_url():
+    '''
+    returns the public url of the blog, ending in /
+    '''
+
+    return config.LIVE+config.USER+"/"+os.path.basename(os.path.realpath(config.WWW))+"/"
+
+def write_feed(www=None):
+    '''
+    atom feed writer
+
+    * writes the newest "feed entries" published entries (nopubs are already
+      out of FILES) to feed.xml, from the render cache
+    * only rewritten when those entries or their content change, so feed
+      readers can rely on conditional GETs
+    * removes feed.xml if the feed is turned off
+    * also writes recent.json, the summary of the same entries that the town
+      feeds are merged from (see www_neighbors())
+    '''
+
+    if www is None:
+        www = config.WWW
+
+    path = os.path.join(www, "feed.xml")
+    recent = os.path.join(www, "recent.json")
+
+    try:
+        count = int(SETTINGS.get("feed entries", FEED_ENTRIES))
+    except (TypeError, ValueError):
+        count = FEED_ENTRIES
+
+    if count <= 0:
+        for old in [path, recent]:
+            if os.path.exists(old):
+                os.remove(old)
+        return
+
+    entries = []
+    for filename in FILES[:count]:
+        chunk = render_entry(filename)
+        mtime = RENDERED[os.path.join(config.MAIN_FEELS, filename)][0][0]
+        entries.append((filename, mtime, chunk))
+
+    util.write_out(path, [atom.user_feed(config.USER, blog_url(), entries)])
+    util.write_out(recent, [atom.recent_list(config.USER, blog_url(), entries)])
+
+def render_parallel(filenames, www):
+    '''
+    parallel renderer for full rebuilds
+
+    * fans write_page() out over a process pool, one worker per cpu
+    * returns the render_entry() chunk for each filename, in the same order,
+      and fills RENDERED with them so later index rewrites stay cheap
+    * renders serially on a single cpu, or if the pool can't be started
+    '''
 
-        outfile.write("\n")
+    workers = os.cpu_count() or 1
+    chunksize = max(1, len(filenames) // (workers * 4))
+    results = None
 
-    for line in FOOTER:
-        outfile.write(line)
+    if workers > 1:
+        try:
+            with concurrent.futures.ProcessPoolExecutor(workers, initializer=render_init,
+                    initargs=(SETTINGS, PAGE_STAMP, PAGE_HEAD, PAGE_FOOT)) as pool:
+                results = list(pool.map(render_worker, filenames,
+                    [www] * len(filenames), chunksize=chunksize))
+        except (OSError, concurrent.futures.BrokenExecutor):
+            results = None
+        else:
+            # the workers' writes were tallied in their own processes
+            for stamp, chunk, counts in results:
+                for key, count in counts.items():
+                    util.WRITES[key] += count
+
+    if results is None:
+        results = [render_worker(filename, www) for filename in filenames]
+
+    entries = []
+    for filename, (stamp, chunk, counts) in zip(filenames, results):
+        RENDERED[os.path.join(config.MAIN_FEELS, filename)] = (stamp, chunk)
+        entries.append(chunk)
+
+    return entries
+
+def render_init(settings, stamp, head, foot):
+    '''
+    sets up the settings and precompiled layout in a render_parallel() worker
+    '''
+
+    global SETTINGS
+    global PAGE_STAMP
+    global PAGE_HEAD
+    global PAGE_FOOT
 
-    outfile.close()
+    SETTINGS = settings
+    PAGE_STAMP = stamp
+    PAGE_HEAD = head
+    PAGE_FOOT = foot
 
-    return os.path.join(config.LIVE+config.USER,os.path.basename(os.path.realpath(config.WWW)),outurl)
+def render_worker(filename, www):
+    '''
+    writes one permalink page; returns its (stamp, chunk) from RENDERED,
+    plus what writing it added to util.WRITES
+    '''
+
+    before = dict(util.WRITES)
+    write_page(filename, www)
+    counts = dict((key, util.WRITES[key] - before[key]) for key in before)
+
+    stamp, chunk = RENDERED[os.path.join(config.MAIN_FEELS, filename)]
+
+    return stamp, chunk, counts
 
-def write_page(filename):
+def write_page(filename, www=None):
     '''
     permalink generator
 
     * makes a page out of a single entry for permalinking, using filename/date as
     url
+    * writes into config.WWW unless given another www directory
     '''
 
-    outurl = os.path.join(config.WWW, "".join(util.parse_date(filename))+".html")
-    outfile = open(outurl, "w")
+    if www is None:
+        www = config.WWW
 
-    outfile.write("<!--generated by the tilde.town blogging platform on "+time.strftime("%d %B %y")+"\nhttp://tilde.town/~endorphant/ttbp/-->\n\n")
+    if PAGE_HEAD is None:
+        compile_layout()
 
-    for line in HEADER:
-        outfile.write(line)
+    outurl = os.path.join(www, "".join(util.parse_date(filename))+".html")
 
-    outfile.write("\n")
+    if not write_published(outurl, [PAGE_HEAD, render_entry(filename), b"\n", PAGE_FOOT]):
+        # the entry was touched without its page changing; catch the page's
+        # mtime up, or stale_files() would keep picking it
+        entry = os.path.join(config.MAIN_FEELS, filename)
+        try:
+            if os.path.getmtime(outurl) < os.path.getmtime(entry):
+                os.utime(outurl)
+        except OSError:
+            pass
 
-    for line in write_entry(filename):
-        outfile.write(line)
+    return outurl
 
-    outfile.write("\n")
+def write_published(path, chunks):
+    '''
+    output stage for published html
+
+    * minifies the page first if "minify html" is on in ttbprc
+    * writes it with util.write_out(), which leaves unchanged pages alone
+    * if "gzip level" (1-9) is set in ttbprc, keeps a precompressed path.gz
+      next to the page for the web server's gzip_static. it's only
+      recompressed when the page changed or the .gz is missing, and it's
+      removed again if gzip is turned off
+    * returns True if the page changed
+    '''
 
-    for line in FOOTER:
-        outfile.write(line)
+    level = gzip_level()
 
-    outfile.close()
+    if SETTINGS.get("minify html"):
+        chunks = [util.minify_html(b"".join(chunks))]
+    elif level:
+        chunks = [b"".join(chunks)]
 
-    return outurl
+    changed = util.write_out(path, chunks, PAGE_STAMP)
+
+    compressed = path+".gz"
+    if level:
+        if changed or not os.path.exists(compressed):
+            util.write_out(compressed, [gzip.compress(PAGE_STAMP+chunks[0], level, mtime=0)])
+    elif os.path.exists(compressed):
+        os.remove(compressed)
+
+    return changed
+
+def gzip_level():
+    '''
+    returns the "gzip level" from ttbprc as 1-9, or 0 if it's off
+    '''
+
+    try:
+        level = int(SETTINGS.get("gzip level") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+    return max(0, min(9, level))
+
+def changed_pages():
+    '''
+    dry run of a full rebuild
+
+    * renders everything into a scratch directory with write_html(), then
+    returns the names of pages whose content differs from what's published
+    (ignoring the generated-on comment at the top)
+    '''
+
+    scratch = tempfile.mkdtemp(prefix="ttbp-")
+    changed = []
+
+    try:
+        write_html("index.html", www=scratch)
+        for page in sorted(os.listdir(scratch)):
+            if not page.endswith(".html"):
+                continue
+            new = unstamped(open(os.path.join(scratch, page)).read())
+            try:
+                old = unstamped(open(os.path.join(config.WWW, page)).read())
+            except OSError:
+                old = None
+            if new != old:
+                changed.append(page)
+    finally:
+        shutil.rmtree(scratch)
+
+    return changed
+
+def unstamped(html):
+    '''
+    strips the leading generated-on comment from a page written by ttbp
+    '''
+
+    if html.startswith("<!--generated by"):
+        end = html.find("-->")
+        if end != -1:
+            return html[end+3:]
+
+    return html
+
+def render_entry(filename):
+    '''
+    cached entry renderer
+
+    * returns write_entry() for the given file as one utf-8 chunk
+    * chunks are kept in RENDERED until the file's mtime or size changes, so
+      rewriting the index doesn't re-parse every entry
+    '''
+
+    path = os.path.join(config.MAIN_FEELS, filename)
+    stat = os.stat(path)
+    stamp = (stat.st_mtime, stat.st_size)
+    cached = RENDERED.get(path)
+    if cached and cached[0] == stamp:
+        return cached[1]
+
+    chunk = "".join(write_entry(filename)).encode("utf-8")
+    RENDERED[path] = (stamp, chunk)
+
+    return chunk
 
 def write_entry(filename):
     '''
@@ -230,20 +583,203 @@ def write_entry(filename):
 
     return entry
 
-def write_global_feed(blogList):
+def stale_files():
+    '''
+    returns the entries in FILES whose permalink page is missing or older than
+    the entry itself
+    '''
+
+    if DB is not None:
+        return stale_db()
+
+    stale = []
+
+    for filename in FILES:
+        page = os.path.join(config.WWW, "".join(util.parse_date(filename))+".html")
+        try:
+            if os.path.getmtime(page) >= os.path.getmtime(filename):
+                continue
+        except OSError:
+            pass
+        stale.append(filename)
+
+    return stale
+
+def stale_db():
+    '''
+    stale_files() from the sqlite store: entries edited since their page was
+    last published. entries the store hasn't seen published yet fall back to
+    comparing mtimes, once
+    '''
+
+    stale = []
+    fresh = []
+
+    for name in DB.stale():
+        filename = os.path.join(config.MAIN_FEELS, name)
+        page = os.path.join(config.WWW, "".join(util.parse_date(name))+".html")
+        try:
+            if os.path.getmtime(page) >= os.path.getmtime(filename):
+                fresh.append(name)
+                continue
+        except OSError:
+            pass
+        stale.append(filename)
+
+    DB.mark_published(fresh, time.time())
+
+    return stale
+
+def publish_stale():
+    '''
+    catches published html up with the entries directory without a full
+    rebuild: rewrites permalinks older than their entry, removes pages whose
+    entry is gone, and rewrites the index and gophermap.
+
+    * returns a list of the permalink pages written
+    '''
+
+    changed = [os.path.basename(filename) for filename in stale_files()]
+
+    live = set(os.path.basename(filename) for filename in FILES)
+    try:
+        pages = os.listdir(config.WWW)
+    except OSError:
+        pages = []
+    for page in pages:
+        name = os.path.splitext(page)[0]+".txt"
+        if page.endswith(".html") and valid(name) and name not in live:
+            changed.append(name)
+
+    return publish_changes(changed)
+
+def publish_locked(full=False, changed=[], nopubs=False, layout=False):
+    '''
+    publishes under the per-user publish lock (see publock.py)
+
+    * full=True rebuilds everything, like load_files(); otherwise the
+      arguments are the same as publish_changes()
+    * if another session is already publishing, the request is merged into
+      its next pass instead, and None is returned
+    * otherwise returns the permalink pages written
+    '''
+
+    return publock.publish({"full": full, "changed": [os.path.basename(filename)
+        for filename in changed], "nopubs": nopubs, "layout": layout}, run_publish)
+
+def run_publish(request):
+    '''
+    publock job: carries out a (possibly merged) publish request. the nopub
+    file is always reread, since a request merged in from another session
+    may have come with nopub changes this one hasn't seen
+    '''
+
+    global FILES
+
+    if request.get("full"):
+        load_nopubs()
+        sync_db()
+        FILES = get_files()
+        write_html("index.html")
+        if SETTINGS.get('gopher'):
+            gopher.publish_gopher('feels', FILES)
+        return []
+
+    return publish_now(request.get("changed", []), True, request.get("layout", False))
+
+def publish_changes(changed=[], nopubs=False, layout=False):
+    '''
+    incremental publisher; publish_now() under the publish lock. returns the
+    permalink pages written ([] if another session took the request)
+    '''
+
+    if not publishing():
+        return []
+
+    return publish_locked(changed=changed, nopubs=nopubs, layout=layout) or []
+
+def publish_now(changed=[], nopubs=False, layout=False):
+    '''
+    incremental publisher
+
+    * changed is a list of entry filenames that were added, edited, or removed
+    * nopubs=True re-reads the nopub file and (un)publishes whatever moved
+    * layout=True means the header or footer changed, which touches every page
+    * only the affected permalinks are rewritten; the index is always rewritten
+      from the render cache, and the gophermap is regenerated
+    * returns a list of the permalink pages written
+    '''
+
+    global FILES
+
+    if not publishing():
+        return []
+
+    if layout:
+        load_layout()
+    else:
+        compile_layout()
+
+    before = set(NOPUBS)
+    if nopubs:
+        load_nopubs()
+
+    pages = set()
+    for filename in changed:
+        filename = os.path.basename(filename)
+        if os.path.isfile(os.path.join(config.MAIN_FEELS, filename)):
+            pages.add(filename)
+        else:
+            unpublish_feel(filename)
+
+    for filename in before - set(NOPUBS):
+        pages.add(filename)
+
+    sync_db()
+    FILES = get_files()
+
+    written = []
+    for filename in FILES:
+        if layout or os.path.basename(filename) in pages:
+            written.append(write_page(filename))
+
+    if DB is not None:
+        DB.mark_published([os.path.splitext(os.path.basename(page))[0]+".txt"
+            for page in written], time.time())
+
+    write_html("index.html", permalinks=False)
+
+    if SETTINGS.get('gopher'):
+        gopher.publish_gopher('feels', FILES)
+
+    return written
+
+def readme_html():
+    '''
+    README.md rendered for the town page. it's rendered right here rather than
+    kept in the shared cache, which anyone can write to
+    '''
+
+    with open(os.path.join(config.INSTALL_PATH, "..", "README.md"), "r") as f:
+        return mistune.markdown(f.read())
+
+def write_global_feed(blogList, recent=[]):
     '''
     main ttbp index printer
 
     * sources README.md for documentation
     * takes incoming list of formatted blog links for all publishing blogs and
       prints to blog feed
+    * recent is the merged list of recent entries from write_town_feeds(); the
+      newest few are listed above the blogs
+    * the feed is only rewritten (atomically) if it actually changed
     '''
 
     try: 
-        outfile = open(FEED, "w")
+        page = []
 
         ## header
-        outfile.write("""\
+        page.append("""\
     <!DOCTYPE html PUBLIC \"-//W3C//DTD HTML 3.2//EN\">
     <html>
         <head>
@@ -257,39 +793,55 @@ def write_global_feed(blogList):
             <h2><a href="https://github.com/modgethanc/ttbp">github
             repo</a> | <a
             href="http://tilde.town/~endorphant/blog/20160510.html">state
-            of the ttbp</a></h2>
+            of the ttbp</a> | <a href="stats.html">town stats</a></h2>
             <!--<p>curious? run <b>~endorphant/bin/ttbp</b> while logged in to tilde.town.</p>
             <p>it's still a little volatile. let me know if anything breaks.</p>---></div>
             <p>&nbsp;</p>
     """)
 
         ## docs
-        outfile.write("""\
+        page.append("""\
             <div class="docs">""")
-        outfile.write(mistune.markdown(open(os.path.join(config.INSTALL_PATH, "..", "README.md"), "r").read()))
-        outfile.write("""\
+        page.append(readme_html())
+        page.append("""\
+            </div>""")
+
+        ## recent entries
+        if recent:
+            page.append("""\
+            <p>&nbsp;</p>
+            <div class=\"recent\">
+            <h3>recent feels (<a href="feed.xml">atom</a> | <a
+            href="feed.json">json feed</a>):</h3>
+                <ul>""")
+            for entry in recent[:TOWN_RECENT_SHOWN]:
+                page.append("""
+                    <li><a href=\""""+html.escape(entry["url"])+"""\">~"""+html.escape(entry["user"])+": "+html.escape(entry["title"])+"""</a><br />
+                        """+html.escape(entry["excerpt"])+"""</li>""")
+            page.append("""
+                </ul>
             </div>""")
 
         ## feed
-        outfile.write("""\
+        page.append("""\
             <p>&nbsp;</p>
             <div class=\"feed\">
             <h3>live feels-sharing:</h3>
                 <ul>""")
         for blog in blogList:
-            outfile.write("""
+            page.append("""
                     <li>"""+blog+"""</li>\
                         """)
 
         ## footer
-        outfile.write("""
+        page.append("""
                 </ul>
             </div>
       </body>
     </html>
     """)
 
-        outfile.close()
+        util.write_out(FEED, ["".join(page).encode("utf-8")])
         #subprocess.call(['chmod', 'a+w', FEED])
     except FileNotFoundError:
         pass
@@ -313,11 +865,19 @@ def meta(entries = FILES):
 
     meta = []
 
+    mtimes = dict((filename, os.path.getmtime(filename)) for filename in entries)
+    counts = {}
+    if DB is not None:
+      for filename in entries:
+        if os.path.dirname(filename) == config.MAIN_FEELS:
+          counts[filename] = DB.words(os.path.basename(filename), mtimes[filename])
+    counts.update(wordcount.count_files([filename for filename in entries
+        if counts.get(filename) is None]))
+
     for filename in entries:
-      mtime = os.path.getmtime(filename)
-      try:
-        wc = int(subprocess.check_output(["wc","-w",filename], stderr=subprocess.STDOUT).split()[0])
-      except subprocess.CalledProcessError:
+      mtime = mtimes[filename]
+      wc = counts.get(filename)
+      if wc is None:
         wc = "???"
       timestamp = time.strftime("%Y-%m-%d at %H:%M", time.localtime(mtime))
       date = "-".join(util.parse_date(filename))
@@ -330,6 +890,88 @@ def meta(entries = FILES):
 
     return meta
 
+class LazyMetas(object):
+    '''
+    meta() for a list of entry files, worked out one page at a time
+
+    * sorted newest date first, from the filenames alone, so the length and
+      order are known without opening anything
+    * indexing gives the meta() row for one entry; slicing gives a list of
+      rows. rows are computed the first time they're asked for and kept
+    * after a slice is computed, the slices of the same size on either side of
+      it are filled in by a background thread, so turning the page is quick
+    '''
+
+    def __init__(self, filenames):
+        self.filenames = sorted(filenames, key=lambda filename: os.path.basename(filename),
+                reverse=True)
+        self.rows = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def __iter__(self):
+        for index in range(len(self.filenames)):
+            yield self[index]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            indexes = range(*index.indices(len(self.filenames)))
+            self.compute(indexes)
+            rows = [self.row(i) for i in indexes]
+            if len(indexes) and index.step in (None, 1):
+                self.prefetch(indexes.start, indexes.stop)
+            return rows
+
+        if index < 0:
+            index += len(self.filenames)
+        if not 0 <= index < len(self.filenames):
+            raise IndexError("metas index out of range")
+
+        return self.row(index)
+
+    def row(self, index):
+        with self.lock:
+            row = self.rows.get(index)
+        if row is None:
+            row = meta([self.filenames[index]])[0]
+            with self.lock:
+                self.rows[index] = row
+
+        return row
+
+    def compute(self, indexes):
+        '''
+        works out the rows for indexes that aren't known yet in one meta()
+        call, so their words are counted as a batch
+        '''
+
+        with self.lock:
+            missing = [i for i in indexes if i not in self.rows]
+        if not missing:
+            return
+
+        rows = meta([self.filenames[i] for i in missing])
+        with self.lock:
+            self.rows.update(zip(missing, rows))
+
+    def prefetch(self, start, stop):
+        size = stop - start
+        wanted = [i for i in list(range(stop, stop + size)) + list(range(start - size, start))
+                if 0 <= i < len(self.filenames) and i not in self.rows]
+
+        if wanted:
+            thread = threading.Thread(target=self.fill, args=(wanted,))
+            thread.daemon = True
+            thread.start()
+
+    def fill(self, indexes):
+        try:
+            self.compute(indexes)
+        except OSError:
+            pass
+
 def valid(filename):
     '''
     filename validator
@@ -349,19 +991,131 @@ def valid(filename):
 
     return True
 
+def valid_buried(filename):
+    '''
+    buried filename validator
+
+    * check if the filename is YYYYMMDD-<timestamp>.txt, the name bury_feel()
+      gives it
+    '''
+
+    name, ext = os.path.splitext(os.path.basename(filename))
+    date, dash, stamp = name.partition("-")
+
+    return bool(dash) and stamp.isdigit() and valid(date + ext)
+
 def find_ttbps():
     '''
     returns a list of users with a ttbp by checking for a valid ttbprc
+
+    * shared by every session through the cache (see cache.py); it's redone
+      when /home or the users file changes, or after USERS_MAX_AGE seconds,
+      which catches accounts set up or wiped without touching either
+    '''
+
+    return cache.lookup("town", "users", ["/home", config.USERFILE], scan_ttbps,
+            USERS_MAX_AGE, lambda users: isinstance(users, list) and all(has_ttbp(user)
+                for user in users))
+
+def scan_ttbps():
+    '''
+    find_ttbps() without the cache
     '''
 
     users = []
 
     for townie in os.listdir("/home"):
-        if os.path.exists(os.path.join("/home", townie, ".ttbp", "config", "ttbprc")):
+        if has_ttbp(townie):
             users.append(townie)
 
     return users
 
+def has_ttbp(user):
+    '''
+    checks that user is a plain name in /home with a ttbprc
+    '''
+
+    if not isinstance(user, str) or user in ["", ".", ".."] or "/" in user:
+        return False
+
+    return os.path.exists(os.path.join("/home", user, ".ttbp", "config", "ttbprc"))
+
+def read_rc(user):
+    '''
+    the given user's parsed ttbprc, or {} if it's missing or broken
+    '''
+
+    try:
+        with open(os.path.join("/home", user, ".ttbp", "config", "ttbprc")) as f:
+            ttbprc = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    return ttbprc if isinstance(ttbprc, dict) else {}
+
+def valid_publish_dir(name):
+    '''
+    checks that a "publish dir" is a single directory name that's safe to put
+    in a url on the town page
+    '''
+
+    return isinstance(name, str) and bool(re.match('^[^/.<>"\'&\\s][^/<>"\'&\\x00-\\x1f]*$', name))
+
+def town_rc(user):
+    '''
+    the parts of the given user's ttbprc the town pages use: whether they're
+    publishing, and where (None if they haven't set a usable publish dir)
+    '''
+
+    ttbprc = read_rc(user)
+    publish_dir = ttbprc.get("publish dir")
+
+    return {
+        "publishing": bool(ttbprc.get("publishing")),
+        "publish dir": publish_dir if valid_publish_dir(publish_dir) else None,
+    }
+
+def valid_town_rc(ttbprc):
+    '''
+    checks a town_rc() value read back from the shared cache
+    '''
+
+    return (isinstance(ttbprc, dict) and set(ttbprc) == set(["publishing", "publish dir"]) and
+            isinstance(ttbprc["publishing"], bool) and
+            (ttbprc["publish dir"] is None or valid_publish_dir(ttbprc["publish dir"])))
+
+def user_rcs(users):
+    '''
+    returns a dict of user: town settings (see town_rc()) for the given
+    users, through the shared cache; each one is reread when its file changes
+    '''
+
+    return cache.lookup_many("ttbprc", dict((user, [os.path.join("/home", user,
+        ".ttbp", "config", "ttbprc")]) for user in users), town_rc, check=valid_town_rc)
+
+def newest_entry(user):
+    '''
+    filename of the given user's newest entry, or "" if they have none
+    '''
+
+    newest = dateindex.for_dir(os.path.join("/home", user, ".ttbp", "entries"), valid).newest(1)
+
+    return newest[0] if newest else ""
+
+def last_entries(users):
+    '''
+    returns a dict of user: path to their newest entry ("" if they have none),
+    through the shared cache; each one is looked up again when the user's
+    entries directory changes
+    '''
+
+    names = cache.lookup_many("latest", dict((user, [os.path.join("/home", user,
+        ".ttbp", "entries")]) for user in users), newest_entry,
+        check=lambda name: name == "" or (isinstance(name, str) and "/" not in name and valid(name)))
+
+    return dict((user, os.path.join("/home", user, ".ttbp", "entries", name) if name else "")
+            for user, name in names.items())
+
 def publishing(username=config.USER):
     '''
     checks .ttbprc for whether or not user opted for www publishing
@@ -373,7 +1127,7 @@ def publishing(username=config.USER):
         ttbprc = SETTINGS
 
     else:
-        ttbprc = json.load(open(os.path.join("/home", username, ".ttbp", "config", "ttbprc")))
+        ttbprc = user_rcs([username])[username]
 
     return ttbprc.get("publishing")
 
@@ -383,26 +1137,26 @@ def www_neighbors():
     '''
 
     userList = []
+    recentLists = []
+    publishers = []
 
-    for user in find_ttbps():
-        if not publishing(user):
+    users = find_ttbps()
+    rcs = user_rcs(users)
+    lastfiles = last_entries(users)
+
+    for user in users:
+        userRC = rcs[user]
+        if not userRC.get("publishing"):
             continue
 
-        userRC = json.load(open(os.path.join("/home", user, ".ttbp", "config", "ttbprc")))
+        publishers.append(user)
+        recentLists.append(load_recent(user))
 
         url = ""
-        if userRC["publish dir"]:
+        if userRC.get("publish dir"):
             url = config.LIVE+user+"/"+userRC["publish dir"]
 
-        lastfile = ""
-        try:
-            files = os.listdir(os.path.join("/home", user, ".ttbp", "entries"))
-        except OSError:
-            files = []
-        files.sort()
-        for filename in files:
-            if valid(filename):
-                lastfile = os.path.join("/home", user, ".ttbp", "entries", filename)
+        lastfile = lastfiles[user]
 
         if lastfile:
             last = os.path.getctime(lastfile)
@@ -411,7 +1165,7 @@ def www_neighbors():
             timestamp = ""
             last = 0
 
-        userList.append(["<a href=\""+url+"\">~"+user+"</a> "+timestamp, last])
+        userList.append(["<a href=\""+html.escape(url)+"\">~"+html.escape(user)+"</a> "+timestamp, last])
 
     # sort user by most recent entry
     userList.sort(key = lambda userdata:userdata[1])
@@ -420,7 +1174,304 @@ def www_neighbors():
     for user in userList:
         sortedUsers.append(user[0])
 
-    write_global_feed(sortedUsers)
+    recent = write_town_feeds(recentLists)
+    write_global_feed(sortedUsers, recent)
+    write_town_stats(publishers)
+
+def load_recent(user):
+    '''
+    returns the given user's recent.json list (see write_feed()), or an empty
+    list if they don't have a usable one
+
+    * the file is the user's to edit, so every field of every entry is
+      checked, and entries that don't pass are skipped
+    * "user" is always set to the owner of the file, so nobody can post as
+      someone else
+    * date, title, and excerpt are cut short, so one file can't bloat the
+      town feeds or page
+    '''
+
+    try:
+        with open(os.path.join("/home", user, ".ttbp", "www", "recent.json")) as f:
+            recent = json.load(f)
+    except (OSError, ValueError):
+        return []
+
+    if not isinstance(recent, list):
+        return []
+
+    entries = []
+    for entry in recent:
+        if not isinstance(entry, dict):
+            continue
+        mtime = entry.get("mtime")
+        # the range check also keeps out nan and anything time.gmtime() can't take
+        if (isinstance(mtime, bool) or not isinstance(mtime, (int, float)) or
+                not 0 <= mtime < 253402300800):
+            continue
+        if not all(isinstance(entry.get(key), str) for key in ["date", "title", "url", "excerpt"]):
+            continue
+        if (not entry["url"].startswith(("http://", "https://")) or
+                len(entry["url"]) > RECENT_URL_LENGTH):
+            continue
+        entries.append({
+            "user": user,
+            "date": entry["date"][:RECENT_TITLE_LENGTH],
+            "title": entry["title"][:RECENT_TITLE_LENGTH],
+            "url": entry["url"],
+            "mtime": mtime,
+            "excerpt": entry["excerpt"][:RECENT_EXCERPT_LENGTH],
+            })
+
+    return entries
+
+def write_town_feeds(recentLists):
+    '''
+    town-wide feed writer
+
+    * merges every publishing user's recent list into the newest
+      TOWN_FEED_ENTRIES entries
+    * writes them as feed.xml (atom) and feed.json (json feed) next to FEED,
+      only if they changed
+    * returns the merged list
+    '''
+
+    recent = atom.merge_recent(recentLists, TOWN_FEED_ENTRIES)
+    town = os.path.dirname(FEED)
+
+    for name, feed in [("feed.xml", atom.town_atom), ("feed.json", atom.town_json)]:
+        try:
+            util.write_out(os.path.join(town, name), [feed(FEED_URL, recent)])
+        except OSError:
+            pass
+
+    return recent
+
+def write_town_stats(users):
+    '''
+    town stats writer
+
+    * brings the stats records up to date for the given (publishing) users
+    * writes stats.html, the town's activity heatmap, next to FEED, counting
+      only published entries, and only if it changed
+    '''
+
+    activity = stats.Activity.from_index(stats.update(users, valid), users, public=True)
+    today = datetime.date.today().toordinal()
+
+    try:
+        util.write_out(os.path.join(os.path.dirname(FEED), "stats.html"),
+                [stats.heatmap_page(activity, today)])
+    except OSError:
+        pass
+
+def town_feed(townies, delta=30, limit=50):
+    '''
+    given a list of townies, returns metas (see meta()) for their most recent
+    entries within delta days (0 for no limit), most recent first. validates
+    against townies with ttbp config files.
+
+    * asks ttbp-feedd if it's running, otherwise scans each directory
+    '''
+
+    metas = feedd.query("feed", users=townies, delta=delta, limit=limit)
+    if metas is not None:
+        return metas
+
+    feedList = []
+    all_users = set(find_ttbps())
+
+    for townie in townies:
+        if townie not in all_users:
+            continue
+
+        entryDir = os.path.join("/home", townie, ".ttbp", "entries")
+        index = dateindex.for_dir(entryDir, valid)
+
+        if delta > 0:
+            filenames = index.since(datetime.date.today() - datetime.timedelta(days=delta))
+        else:
+            filenames = index.newest()
+
+        feedList.extend(os.path.join(entryDir, entry) for entry in filenames)
+
+    metas = meta(feedList)
+    metas.sort(key = lambda entry:entry[3])
+    metas.reverse()
+
+    if limit:
+        metas = metas[0:limit]
+
+    return metas
+
+def on_this_day(date=None, town=False):
+    '''
+    returns metas (see meta()) for entries written on date's month and day
+    (today's if not given) in earlier years, newest first
+
+    * your own entries, plus everyone else's published entries if town
+    * each directory is looked up in its date index (see dateindex.py), or
+      ttbp-feedd answers for the town if it's running
+    '''
+
+    if date is None:
+        date = datetime.date.today()
+
+    filenames = [os.path.join(config.MAIN_FEELS, name) for name in
+            dateindex.for_dir(config.MAIN_FEELS, valid).on_this_day(date.month, date.day, date.year)]
+    metas = meta(filenames)
+
+    if town:
+        users = [user for user in find_ttbps() if user != config.USER and publishing(user)]
+
+        townMetas = feedd.query("onthisday", users=users, month=date.month, day=date.day,
+                before=date.year)
+        if townMetas is None:
+            townFiles = []
+            for user in users:
+                entryDir = os.path.join("/home", user, ".ttbp", "entries")
+                townFiles.extend(os.path.join(entryDir, name) for name in
+                        dateindex.for_dir(entryDir, valid).on_this_day(date.month, date.day, date.year))
+            townMetas = meta(townFiles)
+
+        # only published entries; nopub lists are read just for the users
+        # who turned something up
+        nopubs = {}
+        for entry in townMetas:
+            if entry[5] not in nopubs:
+                nopubs[entry[5]] = stats.load_user_nopubs(entry[5])
+            if os.path.basename(entry[0]) not in nopubs[entry[5]]:
+                metas.append(entry)
+
+    metas.sort(key=lambda entry: (entry[4], entry[5] == config.USER), reverse=True)
+
+    return metas
+
+def subscribed_feed(subs, summaries, seen, limit=50):
+    '''
+    subscription feed assembler
+
+    * summaries is {user: {"dir", "entries"}} from the last call, updated in
+      place: "dir" is the mtime of the user's entries directory, and
+      "entries" maps filenames to [mtime, word count]
+    * a user's entries directory is only relisted if it changed, but every
+      entry is restat()ed, since editing one in place doesn't touch the
+      directory. only new or edited entries get word counted
+    * seen is {user: {filename: mtime}} as of the last visit; an entry is
+      unread if it's new or its mtime changed since. (an older state's
+      {user: mtime} still works: entries edited after it are unread)
+    * returns metas (see meta()) for the newest limit entries across subs,
+      most recent first, each with [6] True if it's unread
+    '''
+
+    metas = []
+
+    for user in subs:
+        entryDir = os.path.join("/home", user, ".ttbp", "entries")
+        try:
+            dirtime = os.stat(entryDir).st_mtime
+        except OSError:
+            summaries.pop(user, None)
+            continue
+
+        summary = summaries.get(user) or {"dir": None, "entries": {}}
+        entries = summary["entries"]
+
+        if dirtime != summary["dir"]:
+            names = [name for name in os.listdir(entryDir) if valid(name)]
+            entries = dict((name, entries.get(name)) for name in names)
+        else:
+            names = list(entries)
+
+        for name in names:
+            filename = os.path.join(entryDir, name)
+            try:
+                mtime = os.path.getmtime(filename)
+            except OSError:
+                entries.pop(name, None)
+                continue
+            if not entries.get(name) or entries[name][0] != mtime:
+                entries[name] = [mtime, meta([filename])[0][2]]
+
+        summaries[user] = {
+            "dir": dirtime,
+            "entries": entries
+        }
+
+        last = seen.get(user, 0)
+        for name, (mtime, wc) in entries.items():
+            metas.append([
+                os.path.join(entryDir, name),
+                mtime,
+                wc,
+                time.strftime("%Y-%m-%d at %H:%M", time.localtime(mtime)),
+                "-".join(util.parse_date(name)),
+                user,
+                last.get(name) != mtime if isinstance(last, dict) else mtime > last
+            ])
+
+    metas.sort(key = lambda entry:entry[1])
+    metas.reverse()
+
+    if limit:
+        metas = metas[0:limit]
+
+    return metas
+
+def town_neighbors(users):
+    '''
+    returns a dict of user: {"publish dir", "last"} for the given users, where
+    last is the ctime of their most recent entry (0 if they've never posted).
+
+    * asks ttbp-feedd if it's running, otherwise scans each user directly
+    * assumes list of users passed in all have valid config files
+    '''
+
+    info = feedd.query("neighbors", users=users)
+    if info is not None:
+        return info
+
+    info = {}
+    rcs = user_rcs(users)
+    lastfiles = last_entries(users)
+
+    for user in users:
+        userRC = rcs[user]
+        lastfile = lastfiles[user]
+
+        last = 0
+        if lastfile:
+            try:
+                last = os.path.getctime(lastfile)
+            except OSError:
+                pass
+
+        info[user] = {
+            "publish dir": userRC.get("publish dir"),
+            "publishing": userRC.get("publishing"),
+            "last": last
+        }
+
+    return info
+
+def town_stamp(users):
+    '''
+    returns a cheap fingerprint of the given users' ttbp data: the mtimes of
+    their entries directories and ttbprc files. if it hasn't changed,
+    town_neighbors() would say the same thing as last time.
+    '''
+
+    stamp = []
+
+    for user in users:
+        for path in [os.path.join("/home", user, ".ttbp", "entries"),
+                os.path.join("/home", user, ".ttbp", "config", "ttbprc")]:
+            try:
+                stamp.append(os.stat(path).st_mtime)
+            except OSError:
+                stamp.append(None)
+
+    return tuple(stamp)
 
 def nopub(filename):
     '''
@@ -468,6 +1519,9 @@ def bury_feel(filename):
     filename collisions.
     
     creates buried feels dir if it doesn't exist.
+
+    the entry's revision history is dropped too, so its old versions can't be
+    listed or restored from under its old name.
     
     regenerates feels list and republishes."""
 
@@ -479,6 +1533,7 @@ def bury_feel(filename):
 
     subprocess.call(["mv", os.path.join(config.MAIN_FEELS, filename), os.path.join(config.BURIED_FEELS, buryname)])
     subprocess.call(["chmod", "600", os.path.join(config.BURIED_FEELS, buryname)])
+    revisions.forget(filename)
 
     if publishing():
         unpublish_feel(filename)
@@ -494,6 +1549,7 @@ def delete_feel(filename):
     feel = os.path.join(config.MAIN_FEELS, filename)
     if os.path.exists(feel):
         subprocess.call(["rm", feel])
+        revisions.forget(filename)
         unpublish_feel(filename)
         load_files(config.MAIN_FEELS)
 
@@ -505,13 +1561,16 @@ def unpublish_feel(filename):
             os.path.splitext(os.path.basename(filename))[0]+".html")
     if os.path.exists(live_html):
         subprocess.call(["rm", live_html])
+    if os.path.exists(live_html+".gz"):
+        os.remove(live_html+".gz")
     live_gopher = os.path.join(config.GOPHER_PATH, filename)
     if os.path.exists(live_gopher):
         subprocess.call(["rm", live_gopher])
 
 def process_backup(filename):
-    """takes given filename and unpacks it into a temp directory, then returns a
-    list of filenames with collisions filtered out.
+    """takes given filename (a tar.gz, or a snapshot manifest from the backup
+    store) and unpacks it into a temp directory, then returns a list of
+    filenames with collisions filtered out.
 
     ignores any invalidly named files or files that already exist, to avoid
     clobbering current feels. ignored files are left in the archive directory
@@ -519,13 +1578,16 @@ def process_backup(filename):
 
     backup_dir = os.path.splitext(os.path.splitext(os.path.basename(filename))[0])[0]
     backup_path = os.path.join(config.BACKUPS, backup_dir)
+    backup_entries = os.path.join(backup_path, "entries")
 
     if not os.path.exists(backup_path):
         subprocess.call(["mkdir", backup_path])
 
     subprocess.call(["chmod", "700", backup_path])
-    subprocess.call(["tar", "-C", backup_path, "-xf", filename])
-    backup_entries = os.path.join(backup_path, "entries")
+    if filename.endswith(".json"):
+        backup.extract(backup_dir, backup_entries)
+    else:
+        subprocess.call(["tar", "-C", backup_path, "-xf", filename])
 
     backups = os.listdir(backup_entries)
     current = os.listdir(config.MAIN_FEELS)
@@ -0,0 +1,134 @@
+"""
+This module contains the date index for a directory of feels.
+
+entry filenames are dates (YYYYMMDD.txt), so everything that asks "which
+entries fall in this stretch of time" can be answered from a sorted array of
+dates instead of a listing that gets parsed and filtered every time. a
+DateIndex keeps each entry's date as an ordinal (date.toordinal()) in a
+sorted array, with the filenames alongside, so a date range is two bisects
+plus the entries in it. a second array, sorted by month and day, does the same
+for "on this day" across years.
+
+for_dir() keeps one index per directory and only relists the directory when
+its mtime moves.
+"""
+import bisect
+import datetime
+import os
+import threading
+from array import array
+
+CACHE = {}
+LOCK = threading.Lock()
+
+
+def ordinal(date):
+    '''
+    a date, or an ordinal already, as an ordinal
+    '''
+
+    if isinstance(date, datetime.date):
+        return date.toordinal()
+
+    return date
+
+class DateIndex(object):
+    '''
+    the entries in one directory, by date
+
+    * names are entry filenames, oldest first; days[i] is the ordinal date of
+      names[i]
+    * monthdays is every entry's month * 100 + day, sorted (then by year), and
+      offsets[i] is where the entry for monthdays[i] is in names
+    * queries return filenames, newest first
+    '''
+
+    def __init__(self, names=[]):
+        dated = []
+        for name in names:
+            try:
+                date = datetime.date(int(name[0:4]), int(name[4:6]), int(name[6:8]))
+            except ValueError:
+                continue
+            dated.append((date.toordinal(), date.month * 100 + date.day, name))
+        dated.sort()
+
+        self.names = [entry[2] for entry in dated]
+        self.days = array("i", [entry[0] for entry in dated])
+
+        byday = sorted(range(len(dated)), key=lambda i: (dated[i][1], dated[i][0]))
+        self.monthdays = array("i", [dated[i][1] for i in byday])
+        self.offsets = array("i", byday)
+
+    def __len__(self):
+        return len(self.names)
+
+    def between(self, start=None, stop=None):
+        '''
+        entries dated from start up to (not including) stop; either can be a
+        date or an ordinal, or None for no limit
+        '''
+
+        low = 0 if start is None else bisect.bisect_left(self.days, ordinal(start))
+        high = len(self.days) if stop is None else bisect.bisect_left(self.days, ordinal(stop))
+
+        return self.names[low:high][::-1]
+
+    def since(self, cutoff):
+        '''
+        entries dated after cutoff (a date or an ordinal)
+        '''
+
+        return self.between(ordinal(cutoff) + 1)
+
+    def newest(self, limit=None):
+        '''
+        the newest limit entries (all of them if None)
+        '''
+
+        start = 0 if limit is None else max(0, len(self.names) - limit)
+
+        return self.names[start:][::-1]
+
+    def on_this_day(self, month, day, before=None):
+        '''
+        entries written on month/day in any year, or only in years before
+        before (a year) if given
+        '''
+
+        key = month * 100 + day
+        low = bisect.bisect_left(self.monthdays, key)
+        high = bisect.bisect_right(self.monthdays, key)
+
+        names = [self.names[self.offsets[i]] for i in range(low, high)]
+        if before is not None:
+            names = [name for name in names if int(name[0:4]) < before]
+
+        return names[::-1]
+
+def for_dir(path, valid):
+    '''
+    the DateIndex for the entries in path that pass valid (core.valid),
+    reusing the last one made for path if the directory hasn't changed
+    '''
+
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return DateIndex()
+
+    with LOCK:
+        cached = CACHE.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    try:
+        names = [name for name in os.listdir(path) if valid(name)]
+    except OSError:
+        return DateIndex()
+
+    index = DateIndex(names)
+    with LOCK:
+        CACHE[path] = (mtime, index)
+
+    return index
@@ -0,0 +1,204 @@
+"""
+This module contains the optional sqlite metadata store for a user's feels.
+
+the store mirrors ~/.ttbp/entries and ~/.ttbp/buried: one row per entry with
+its date, size, mtime, sha1, word count, nopub flag, and when its page was
+last published. the text files stay the source of truth; the store is brought
+up to date with one scandir() pass over each directory (see reconcile()), and
+only entries whose mtime or size changed get read again. after that, listing
+entries, word counts, and "which pages are stale" are indexed queries instead
+of a walk over the filesystem.
+
+it's turned on with "sqlite": true in ttbprc. deleting the database file is
+always safe; it's rebuilt on the next start.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+
+from . import config
+from . import wordcount
+
+SCHEMA_VERSION = 1
+SCHEMA = """
+create table if not exists entries (
+    dir text not null,
+    name text not null,
+    date text not null,
+    mtime real not null,
+    size integer not null,
+    sha1 text not null,
+    words integer not null,
+    nopub integer not null default 0,
+    published real,
+    primary key (dir, name)
+);
+create index if not exists entries_date on entries (dir, date);
+create index if not exists entries_stale on entries (dir, nopub, published);
+"""
+
+## the directories mirrored, by the name they're stored under
+DIRS = {
+    "entries": config.MAIN_FEELS,
+    "buried": config.BURIED_FEELS,
+}
+
+
+def summarize(path):
+    '''
+    returns (sha1, word count) for an entry file; words are counted like
+    `wc -w` (see wordcount.py)
+    '''
+
+    with open(path, "rb") as f:
+        data = f.read()
+
+    return hashlib.sha1(data).hexdigest(), wordcount.count_bytes(data)[0]
+
+class Store(object):
+    '''
+    a user's entry metadata in sqlite, in WAL mode so readers never wait on
+    the publisher
+    '''
+
+    def __init__(self, path=config.DB):
+        self.path = path
+        self.lock = threading.Lock()
+
+        # sqlite gives the -wal and -shm files the database's mode, so making
+        # it private first keeps all three private
+        os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+        os.chmod(path, 0o600)
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("pragma journal_mode=wal")
+        self.conn.execute("pragma synchronous=normal")
+
+        version = self.conn.execute("pragma user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self.conn.execute("drop table if exists entries")
+            self.conn.execute("pragma user_version={version}".format(version=SCHEMA_VERSION))
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+        # and in case they were made before the database was private
+        for suffix in ["-wal", "-shm"]:
+            try:
+                os.chmod(path + suffix, 0o600)
+            except OSError:
+                pass
+
+    def close(self):
+        self.conn.close()
+
+    def reconcile(self, valid, nopubs=[], valid_buried=None):
+        '''
+        brings the store up to date with the entry directories
+
+        * valid is the filename check to use for entries (core.valid), and
+          valid_buried the one for buried entries (core.valid_buried), which
+          have a timestamp after the date; it defaults to valid
+        * one scandir() pass per directory; files whose mtime and size match
+          their row aren't opened
+        * rows for files that are gone are dropped, and nopub flags are set
+          from the given nopub list
+        * returns the number of rows added or changed
+        '''
+
+        nopubs = set(nopubs)
+        checks = {"entries": valid, "buried": valid_buried or valid}
+        changed = 0
+
+        with self.lock, self.conn:
+            for dirname, path in DIRS.items():
+                known = dict((row[0], (row[1], row[2])) for row in self.conn.execute(
+                    "select name, mtime, size from entries where dir = ?", (dirname,)))
+
+                try:
+                    scan = list(os.scandir(path))
+                except OSError:
+                    scan = []
+
+                seen = set()
+                for entry in scan:
+                    if not checks[dirname](entry.name) or not entry.is_file():
+                        continue
+                    seen.add(entry.name)
+
+                    st = entry.stat()
+                    if known.get(entry.name) == (st.st_mtime, st.st_size):
+                        continue
+
+                    try:
+                        sha1, words = summarize(entry.path)
+                    except OSError:
+                        continue
+                    name = os.path.splitext(entry.name)[0]
+                    self.conn.execute("""insert into entries
+                        (dir, name, date, mtime, size, sha1, words) values (?, ?, ?, ?, ?, ?, ?)
+                        on conflict (dir, name) do update set mtime = excluded.mtime,
+                        size = excluded.size, sha1 = excluded.sha1, words = excluded.words""",
+                        (dirname, entry.name, name[0:4]+"-"+name[4:6]+"-"+name[6:8],
+                            st.st_mtime, st.st_size, sha1, words))
+                    changed += 1
+
+                for name in set(known) - seen:
+                    self.conn.execute("delete from entries where dir = ? and name = ?",
+                            (dirname, name))
+                    changed += 1
+
+            self.conn.execute("update entries set nopub = 0 where nopub = 1")
+            self.conn.executemany("update entries set nopub = 1 where dir = 'entries' and name = ?",
+                    [(name,) for name in nopubs])
+            # nopub pages get taken down, so they'll need publishing again
+            self.conn.execute("update entries set published = null where nopub = 1")
+
+        return changed
+
+    def names(self, dirname="entries", nopub=None):
+        '''
+        entry filenames in dirname, newest date first; nopub=False leaves out
+        nopubs, nopub=True gives only nopubs
+        '''
+
+        query = "select name from entries where dir = ?"
+        args = [dirname]
+        if nopub is not None:
+            query += " and nopub = ?"
+            args.append(int(nopub))
+        query += " order by date desc"
+
+        with self.lock:
+            return [row[0] for row in self.conn.execute(query, args)]
+
+    def words(self, name, mtime, dirname="entries"):
+        '''
+        word count for an entry, or None if the store doesn't have it as of
+        the given mtime
+        '''
+
+        with self.lock:
+            row = self.conn.execute("select words from entries where dir = ? and name = ? and mtime = ?",
+                    (dirname, name, mtime)).fetchone()
+
+        return row[0] if row else None
+
+    def stale(self):
+        '''
+        published entries whose page is older than the entry, newest first
+        '''
+
+        with self.lock:
+            return [row[0] for row in self.conn.execute("""select name from entries
+                where dir = 'entries' and nopub = 0 and (published is null or published < mtime)
+                order by date desc""")]
+
+    def mark_published(self, names, when):
+        '''
+        records that the pages for names were written at unix time when
+        '''
+
+        with self.lock, self.conn:
+            self.conn.executemany("update entries set published = ? where dir = 'entries' and name = ?",
+                    [(when, name) for name in names])
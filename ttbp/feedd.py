@@ -0,0 +1,438 @@
+"""
+This module contains the town feed daemon (ttbp-feedd).
+
+the daemon keeps an in-memory index of every townie's feels, refreshes it by
+polling directory mtimes, and answers feed/neighbors/search/last-post/on-this-day queries
+over a local unix socket, so every ttbp session doesn't have to rescan the
+whole town by itself.
+
+the protocol is one json object per line in each direction:
+
+    > {"query": "feed", "users": ["endorphant"], "delta": 30, "limit": 50}
+    < {"ok": true, "result": [...]}
+
+running the daemon is optional; query() returns None if it isn't reachable,
+and callers fall back to scanning the filesystem directly.
+"""
+import argparse
+import datetime
+import json
+import os
+import signal
+import socket
+import socketserver
+import threading
+import time
+
+from . import config
+from . import core
+from . import dateindex
+
+## how long a client waits on the daemon before falling back to scanning
+TIMEOUT = 2
+## biggest request line the daemon will read
+MAX_REQUEST = 64 * 1024
+
+
+class TownIndex(object):
+    """in-memory index of everyone's feels under a home directory root.
+
+    for each user with a ttbprc, keeps the parsed ttbprc and a metadata list
+    for every file in their entries directory (see core.meta()). refresh()
+    only relists a user's entries when the directory mtime moves, and only
+    recomputes metadata for files whose mtime moved."""
+
+    def __init__(self, home="/home"):
+        self.home = home
+        self.users = {}
+        self.lock = threading.Lock()
+        self.refreshed = 0
+
+    def user_paths(self, user):
+        base = os.path.join(self.home, user, ".ttbp")
+        return (os.path.join(base, "config", "ttbprc"),
+                os.path.join(base, "entries"))
+
+    def refresh(self, only=None):
+        """rescans the town (or just the named user), touching only what
+        changed since the last pass."""
+
+        if only is None:
+            try:
+                townies = os.listdir(self.home)
+            except OSError:
+                townies = []
+        else:
+            townies = [only]
+
+        found = set()
+        for user in townies:
+            record = self.refresh_user(user)
+            if record is not None:
+                found.add(user)
+                with self.lock:
+                    self.users[user] = record
+            elif only is not None:
+                with self.lock:
+                    self.users.pop(user, None)
+
+        if only is None:
+            with self.lock:
+                for user in list(self.users):
+                    if user not in found:
+                        del self.users[user]
+            self.refreshed = time.time()
+
+    def refresh_user(self, user):
+        """returns an updated record for the given user, or None if they
+        don't have a ttbp."""
+
+        rcfile, entrydir = self.user_paths(user)
+
+        try:
+            rcstat = os.stat(rcfile)
+        except OSError:
+            return None
+
+        with self.lock:
+            old = self.users.get(user, {})
+
+        record = {
+            "rc_mtime": old.get("rc_mtime"),
+            "rc": old.get("rc", {}),
+            "dir_mtime": old.get("dir_mtime"),
+            "names": old.get("names", []),
+            "index": old.get("index", dateindex.DateIndex()),
+            "entries": old.get("entries", {}),
+        }
+
+        if record["rc_mtime"] != rcstat.st_mtime:
+            try:
+                with open(rcfile) as f:
+                    record["rc"] = json.load(f)
+            except (OSError, ValueError):
+                record["rc"] = {}
+            record["rc_mtime"] = rcstat.st_mtime
+
+        try:
+            dir_mtime = os.stat(entrydir).st_mtime
+        except OSError:
+            dir_mtime = None
+
+        if dir_mtime is None:
+            record["names"] = []
+            record["index"] = dateindex.DateIndex()
+        elif dir_mtime != record["dir_mtime"]:
+            try:
+                record["names"] = sorted(os.listdir(entrydir))
+            except OSError:
+                record["names"] = []
+            record["index"] = dateindex.DateIndex(name for name in record["names"]
+                    if core.valid(name))
+        record["dir_mtime"] = dir_mtime
+
+        entries = {}
+        for name in record["names"]:
+            filename = os.path.join(entrydir, name)
+            try:
+                st = os.stat(filename)
+            except OSError:
+                continue
+            if not os.path.isfile(filename):
+                continue
+            cached = record["entries"].get(name)
+            if cached and cached["mtime"] == st.st_mtime:
+                cached["ctime"] = st.st_ctime
+                entries[name] = cached
+            else:
+                entries[name] = {
+                    "mtime": st.st_mtime,
+                    "ctime": st.st_ctime,
+                    "valid": core.valid(name),
+                    "meta": core.meta([filename])[0],
+                }
+        record["entries"] = entries
+
+        return record
+
+    ## queries
+
+    def feed(self, users=None, delta=30, limit=50):
+        """same selection as ttbp.feed_list(): entries from the given users
+        (everyone if None) within delta days (0 for no limit), most recent
+        first."""
+
+        cutoff = None
+        if delta > 0:
+            cutoff = datetime.date.today() - datetime.timedelta(days=delta)
+
+        metas = []
+        with self.lock:
+            if users is None:
+                users = list(self.users)
+            for user in users:
+                record = self.users.get(user)
+                if record is None:
+                    continue
+                if cutoff is not None:
+                    names = record["index"].since(cutoff)
+                else:
+                    names = record["index"].newest()
+                for name in names:
+                    entry = record["entries"].get(name)
+                    if entry is not None:
+                        metas.append(entry["meta"])
+
+        metas.sort(key=lambda entry: entry[3])
+        metas.reverse()
+
+        if limit:
+            metas = metas[0:limit]
+
+        return metas
+
+    def neighbors(self, users=None):
+        """returns a dict of user: {publish dir, last} where last is the ctime
+        of their latest valid entry (0 if they've never posted)."""
+
+        result = {}
+        with self.lock:
+            if users is None:
+                users = list(self.users)
+            for user in users:
+                record = self.users.get(user)
+                if record is None:
+                    continue
+                last = 0
+                for name in reversed(record["names"]):
+                    entry = record["entries"].get(name)
+                    if entry and entry["valid"]:
+                        last = entry["ctime"]
+                        break
+                result[user] = {
+                    "publish dir": record["rc"].get("publish dir"),
+                    "publishing": record["rc"].get("publishing"),
+                    "last": last,
+                }
+
+        return result
+
+    def last(self, user):
+        """metadata for the given user's latest valid entry, or None"""
+
+        with self.lock:
+            record = self.users.get(user)
+            if record is None:
+                return None
+            for name in reversed(record["names"]):
+                entry = record["entries"].get(name)
+                if entry and entry["valid"]:
+                    return entry["meta"]
+
+        return None
+
+    def on_this_day(self, month, day, before=None, users=None):
+        """metadata for entries written on month/day (in years before before,
+        if given) by the given users (everyone if None), newest first."""
+
+        metas = []
+        with self.lock:
+            if users is None:
+                users = list(self.users)
+            for user in users:
+                record = self.users.get(user)
+                if record is None:
+                    continue
+                for name in record["index"].on_this_day(month, day, before):
+                    entry = record["entries"].get(name)
+                    if entry is not None:
+                        metas.append(entry["meta"])
+
+        metas.sort(key=lambda entry: entry[4], reverse=True)
+
+        return metas
+
+    def search(self, term, users=None, limit=50):
+        """metadata for entries containing term (case-insensitive), most
+        recent first. entry text isn't kept in memory, so this reads files."""
+
+        term = term.lower()
+        with self.lock:
+            if users is None:
+                users = list(self.users)
+            candidates = []
+            for user in users:
+                record = self.users.get(user)
+                if record is None:
+                    continue
+                for entry in record["entries"].values():
+                    if entry["valid"]:
+                        candidates.append(entry["meta"])
+
+        candidates.sort(key=lambda entry: entry[3])
+        candidates.reverse()
+
+        metas = []
+        for meta in candidates:
+            try:
+                with open(meta[0], errors="replace") as f:
+                    if term in f.read().lower():
+                        metas.append(meta)
+            except OSError:
+                continue
+            if limit and len(metas) >= limit:
+                break
+
+        return metas
+
+    def answer(self, request):
+        """dispatches a decoded request dict, returning the result"""
+
+        query = request.get("query")
+
+        if query == "ping":
+            return self.refreshed
+        elif query == "feed":
+            return self.feed(request.get("users"), int(request.get("delta", 30)),
+                    int(request.get("limit", 50)))
+        elif query == "neighbors":
+            return self.neighbors(request.get("users"))
+        elif query == "last":
+            return self.last(request.get("user"))
+        elif query == "onthisday":
+            before = request.get("before")
+            return self.on_this_day(int(request.get("month")), int(request.get("day")),
+                    int(before) if before is not None else None, request.get("users"))
+        elif query == "search":
+            return self.search(str(request.get("term", "")), request.get("users"),
+                    int(request.get("limit", 50)))
+        elif query == "refresh":
+            user = request.get("user")
+            if user and os.path.basename(user) == user:
+                self.refresh(user)
+            return True
+
+        raise ValueError("unknown query: {query}".format(query=query))
+
+
+class FeedHandler(socketserver.StreamRequestHandler):
+    """answers newline-delimited json requests until the client hangs up"""
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline(MAX_REQUEST)
+            if not line:
+                return
+            try:
+                request = json.loads(line.decode("utf-8"))
+                reply = {"ok": True, "result": self.server.index.answer(request)}
+            except Exception as e:
+                reply = {"ok": False, "error": str(e)}
+            self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+
+
+class FeedServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, index):
+        self.index = index
+        socketserver.UnixStreamServer.__init__(self, socket_path, FeedHandler)
+
+
+## client side
+
+def query(name, socket_path=None, timeout=TIMEOUT, **args):
+    """asks the daemon a question; returns the result, or None if the daemon
+    isn't running or something went wrong (callers should fall back to
+    scanning for themselves)."""
+
+    if socket_path is None:
+        socket_path = config.FEEDD_SOCKET
+
+    if not os.path.exists(socket_path):
+        return None
+
+    request = dict(args)
+    request["query"] = name
+
+    try:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(socket_path)
+            sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+            data = b""
+            while not data.endswith(b"\n"):
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                data += chunk
+        finally:
+            sock.close()
+        reply = json.loads(data.decode("utf-8"))
+    except (OSError, ValueError):
+        return None
+
+    if not reply.get("ok"):
+        return None
+
+    return reply.get("result")
+
+def notify(user=config.USER):
+    """asks the daemon to rescan a single user right away (eg, after they
+    write an entry), so they don't wait for the next poll"""
+
+    return query("refresh", user=user)
+
+## daemon side
+
+def serve(socket_path, home="/home", interval=30):
+    """builds the index, then serves queries while a background thread keeps
+    polling for changes every interval seconds."""
+
+    if os.path.exists(socket_path):
+        if query("ping", socket_path=socket_path) is not None:
+            raise SystemExit("ttbp-feedd is already running on " + socket_path)
+        os.remove(socket_path)
+
+    index = TownIndex(home)
+    index.refresh()
+
+    server = FeedServer(socket_path, index)
+    os.chmod(socket_path, 0o666)
+
+    def poll():
+        while True:
+            time.sleep(interval)
+            index.refresh()
+
+    poller = threading.Thread(target=poll)
+    poller.daemon = True
+    poller.start()
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+def main():
+    parser = argparse.ArgumentParser(prog="ttbp-feedd",
+            description="serve town feed queries for ttbp over a unix socket")
+    parser.add_argument("--socket", default=config.FEEDD_SOCKET,
+            help="path of the unix socket to listen on")
+    parser.add_argument("--home", default="/home",
+            help="directory containing townie home directories")
+    parser.add_argument("--interval", type=int, default=30,
+            help="seconds between rescans")
+    args = parser.parse_args()
+
+    serve(args.socket, args.home, args.interval)
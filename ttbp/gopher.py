@@ -64,20 +64,21 @@ def publish_gopher(gopher_path, entry_filenames):
         print('\n\tERROR: something is wrong. your gopher directory is missing. re-enable gopher publishing from the settings menu to fix this up!')
         return
 
-    with open(os.path.join(ttbp_gopher, 'gophermap'), 'w') as gophermap:
-        gophermap.write(GOPHERMAP_HEADER.format(
-                        user=getpass.getuser()))
-        for entry_filename in entry_filenames:
-            filename = os.path.basename(entry_filename)
-
-            gopher_entry_symlink = os.path.join(ttbp_gopher, os.path.basename(entry_filename))
-            if not os.path.exists(gopher_entry_symlink):
-                subprocess.call(["ln", "-s", entry_filename, gopher_entry_symlink])
-
-            label = "-".join(util.parse_date(entry_filename))
-            gophermap.write('0{file_label}\t{filename}\n'.format(
-                file_label=label,
-                filename=filename))
+    gophermap = [GOPHERMAP_HEADER.format(user=getpass.getuser())]
+    for entry_filename in entry_filenames:
+        filename = os.path.basename(entry_filename)
+
+        gopher_entry_symlink = os.path.join(ttbp_gopher, os.path.basename(entry_filename))
+        if not os.path.exists(gopher_entry_symlink):
+            subprocess.call(["ln", "-s", entry_filename, gopher_entry_symlink])
+
+        label = "-".join(util.parse_date(entry_filename))
+        gophermap.append('0{file_label}\t{filename}\n'.format(
+            file_label=label,
+            filename=filename))
+
+    util.write_out(os.path.join(ttbp_gopher, 'gophermap'),
+            ["".join(gophermap).encode("utf-8")])
 
 def setup_gopher(gopher_path):
     """Given a path relative to ~/public_gopher, this function:
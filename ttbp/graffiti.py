@@ -0,0 +1,221 @@
+"""
+This module contains the graffiti wall engine.
+
+the wall used to be one file that each visitor opened in their editor while
+everyone else was locked out. now any number of people can be at the wall at
+once:
+
+* a visitor edits a private copy of the wall as it was when they arrived
+* when they're done, the difference between that copy and what they started
+  from is appended to the wall's log (WALL_LOG) as one json line, under an
+  fcntl lock so appends never interleave
+* wall.txt is rebuilt from the log incrementally: the offset into the log
+  it's caught up to is kept in WALL_STATE, so only new contributions get
+  applied (see compact())
+* a contribution made while nobody else changed the wall applies exactly;
+  one made alongside someone else's finds its spot again by its surrounding
+  lines, and if that spot is gone, whatever it added goes at the bottom of
+  the wall instead of getting lost
+
+fcntl locks go away with the process holding them, so a session that dies at
+the wall never keeps anyone else out.
+"""
+import difflib
+import fcntl
+import json
+import os
+import time
+
+from . import config
+from . import util
+
+# lines of context kept around each change, for finding its spot again
+CONTEXT = 2
+
+
+def make_hunks(old, new):
+    '''
+    the changes from old to new (lists of lines), as a list of
+    [position, before, removed, after, added], where position is where the
+    change starts in old and before/after are up to CONTEXT lines around it
+    '''
+
+    hunks = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old, new, autojunk=False).get_opcodes():
+        if tag == "equal":
+            continue
+        hunks.append([i1, old[max(0, i1 - CONTEXT):i1], old[i1:i2],
+            old[i2:i2 + CONTEXT], new[j1:j2]])
+
+    return hunks
+
+def find(lines, hunk):
+    '''
+    where hunk's removed lines start in lines, found by their context and
+    nearest to where they were; None if they aren't there any more
+    '''
+
+    position, before, removed, after, added = hunk
+    pattern = before + removed + after
+    size = len(pattern)
+
+    if not pattern:
+        return min(position, len(lines))
+
+    found = [start + len(before) for start in range(len(lines) - size + 1)
+            if lines[start:start + size] == pattern]
+
+    if not found:
+        return None
+
+    return min(found, key=lambda start: abs(start - position))
+
+def apply_record(lines, record, seq):
+    '''
+    applies one logged contribution to the wall's lines; seq is how many
+    contributions the wall already has
+    '''
+
+    hunks = record.get("hunks", [])
+    exact = record.get("base") == seq
+    leftover = []
+
+    # hunks are applied from the bottom up, so earlier positions stay put
+    for hunk in reversed(hunks):
+        position, before, removed, after, added = hunk
+        if exact and lines[position:position + len(removed)] == removed:
+            start = position
+        else:
+            start = find(lines, hunk)
+
+        if start is None:
+            leftover = added + leftover
+        else:
+            lines[start:start + len(removed)] = added
+
+    if leftover:
+        lines.extend(leftover)
+
+    return lines
+
+def open_log(flags):
+    '''
+    opens WALL_LOG, making it (writable by everyone) if it isn't there yet
+    '''
+
+    fd = os.open(config.WALL_LOG, flags | os.O_CREAT, 0o666)
+    try:
+        os.fchmod(fd, 0o666)
+    except OSError:
+        # someone else made it, and already opened it up
+        pass
+
+    return fd
+
+def append(record):
+    '''
+    appends one contribution to the log, under an exclusive lock
+    '''
+
+    line = (json.dumps(record, sort_keys=True) + "\n").encode("utf-8")
+
+    fd = open_log(os.O_WRONLY | os.O_APPEND)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+def load_state():
+    try:
+        with open(config.WALL_STATE) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+
+    if not isinstance(state, dict):
+        state = {}
+
+    return state.get("offset", 0), state.get("seq", 0)
+
+def read_wall():
+    try:
+        with open(config.WALL, "r") as f:
+            return f.read().splitlines(True)
+    except OSError:
+        return []
+
+def compact():
+    '''
+    brings wall.txt up to date with the log; returns (seq, lines), where seq
+    is how many contributions are in the wall
+
+    * only the part of the log after the saved offset is read
+    * runs under the log's lock, so it takes turns with appends; wall.txt
+      is replaced atomically, so reading it never has to wait
+    '''
+
+    try:
+        fd = open_log(os.O_RDONLY)
+    except OSError:
+        return 0, read_wall()
+
+    with os.fdopen(fd, "rb") as log:
+        fcntl.flock(log, fcntl.LOCK_EX)
+
+        offset, seq = load_state()
+        lines = read_wall()
+
+        log.seek(0, os.SEEK_END)
+        if log.tell() < offset:
+            # the log was cleared out; start counting over
+            offset = seq = 0
+        log.seek(offset)
+
+        applied = 0
+        for raw in log:
+            if not raw.endswith(b"\n"):
+                break
+            offset += len(raw)
+            try:
+                record = json.loads(raw.decode("utf-8"))
+            except ValueError:
+                continue
+            lines = apply_record(lines, record, seq)
+            seq += 1
+            applied += 1
+
+        if applied:
+            for path, data in [(config.WALL, "".join(lines).encode("utf-8")),
+                    (config.WALL_STATE, json.dumps({"offset": offset, "seq": seq}).encode("utf-8"))]:
+                # someone else's wall.txt can't be replaced in the sticky
+                # graffiti dir, so write_out() rewrites it in place instead
+                try:
+                    util.write_out(path, [data])
+                except OSError:
+                    # the state only moves on once the wall has, so the next
+                    # compact() replays what this one couldn't save
+                    break
+                try:
+                    os.chmod(path, 0o666)
+                except OSError:
+                    # not ours; whoever made it already opened it up
+                    pass
+
+    return seq, lines
+
+def contribute(base, old, new, user=config.USER):
+    '''
+    records the changes from old to new (the wall's text as a visitor found
+    it, at contribution number base, and as they left it); returns False if
+    there weren't any
+    '''
+
+    hunks = make_hunks(old.splitlines(True), new.splitlines(True))
+    if not hunks:
+        return False
+
+    append({"user": user, "time": time.time(), "base": base, "hunks": hunks})
+    compact()
+
+    return True
@@ -0,0 +1,148 @@
+"""
+This module contains ttbp's built-in pager for reading feels.
+
+instead of starting `less` for every entry, the pager shows entries right
+inside ttbp and can step to the next or previous entry in the list without
+going back to the menu. while one entry is on screen, the ones on either side
+of it are read (and rendered, if there's a renderer) in a background thread,
+so paging to them doesn't have to wait.
+
+it's turned on with "builtin pager": true in ttbprc.
+"""
+import shutil
+import sys
+import threading
+from six.moves import input
+
+from . import util
+
+# rendered entries kept around this far either side of the one on screen
+KEEP = 2
+# cursor home, then erase the screen
+CLEAR = "\033[H\033[2J"
+COMMANDS = "<enter> more, 'b' back up, 'n' next entry, 'p' previous entry, 'q' back to the list"
+
+
+def read_plain(filename):
+    '''
+    default renderer: the entry's text, with control characters made visible
+    (see util.show_controls()) so an entry can't mess with the terminal
+    '''
+
+    with open(filename, "r", errors="replace") as f:
+        return util.show_controls(f.read())
+
+class Pager(object):
+    '''
+    pages through a list of entry files, starting from any of them
+
+    * render is a function taking a filename and returning the text to show
+    * title is a function taking an index into filenames and returning a
+      heading for that entry
+    '''
+
+    def __init__(self, filenames, render=read_plain, title=None):
+        self.filenames = filenames
+        self.render = render
+        self.title = title
+        self.rendered = {}
+        self.lock = threading.Lock()
+
+    def get(self, index):
+        '''
+        returns the rendered lines for filenames[index], rendering them now if
+        the read-ahead hasn't gotten there yet
+        '''
+
+        with self.lock:
+            lines = self.rendered.get(index)
+        if lines is not None:
+            return lines
+
+        try:
+            lines = self.render(self.filenames[index]).rstrip("\n").split("\n")
+        except (OSError, UnicodeDecodeError) as e:
+            lines = ["(couldn't read this entry: {error})".format(error=e)]
+
+        with self.lock:
+            self.rendered[index] = lines
+
+        return lines
+
+    def prefetch(self, index):
+        '''
+        renders the entries next to index in a background thread, and forgets
+        the ones that are far away
+        '''
+
+        with self.lock:
+            for old in [i for i in self.rendered if abs(i - index) > KEEP]:
+                del self.rendered[old]
+            wanted = [i for i in [index + 1, index - 1]
+                    if 0 <= i < len(self.filenames) and i not in self.rendered]
+
+        if wanted:
+            thread = threading.Thread(target=self.fill, args=(wanted,))
+            thread.daemon = True
+            thread.start()
+
+    def fill(self, indexes):
+        for index in indexes:
+            self.get(index)
+
+    def show(self, index):
+        '''
+        reads entries starting at filenames[index] until the reader quits;
+        returns the index of the last entry shown
+        '''
+
+        while True:
+            lines = self.get(index)
+            self.prefetch(index)
+
+            action = self.page(index, lines)
+            if action == "q":
+                return index
+            elif action == "n":
+                if index + 1 < len(self.filenames):
+                    index += 1
+                else:
+                    return index
+            elif action == "p" and index > 0:
+                index -= 1
+
+    def page(self, index, lines):
+        '''
+        shows one entry a screenful at a time; returns "n", "p", or "q"
+        '''
+
+        height = max(5, shutil.get_terminal_size().lines - 5)
+        top = 0
+
+        while True:
+            sys.stdout.write(CLEAR)
+            sys.stdout.flush()
+            if self.title:
+                print(self.title(index))
+            print("({count} of {total})\n".format(count=index + 1,
+                total=len(self.filenames)))
+            print("\n".join(lines[top:top + height]))
+
+            end = top + height >= len(lines)
+            where = "end of entry" if end else "{percent}%".format(
+                percent=int(100 * (top + height) / len(lines)))
+
+            try:
+                choice = input("\n[{where}] {commands}: ".format(where=where,
+                    commands=COMMANDS)).strip().lower()
+            except EOFError:
+                return "q"
+
+            if choice in ["q", "n", "p"]:
+                return choice
+            elif choice == "b":
+                top = max(0, top - height)
+            elif choice == "":
+                if end:
+                    return "n"
+                top += height
@@ -0,0 +1,116 @@
+"""
+This module contains the per-user publish lock, which keeps two sessions
+(two ssh windows, or a session and `ttbp watch`) from publishing at once.
+
+publishing goes through publish(): the request is merged into a pending
+marker (config.PUBLISH_PENDING), and then whoever holds the fcntl lock on
+config.PUBLISH_LOCK takes the marker and runs it. a session that finds the
+lock taken just leaves its request in the marker and goes on; the session
+publishing picks it up when it finishes its current pass, so any number of
+requests made during a rebuild turn into one more rebuild, not one each.
+
+the lock goes away with the process holding it, so a session that dies
+mid-publish doesn't keep the next one out.
+"""
+import fcntl
+import json
+import os
+
+from . import config
+
+
+def merge(old, new):
+    '''
+    one request that covers both; requests are dicts of "full", "layout",
+    "nopubs" (booleans), and "changed" (a list of entry filenames)
+    '''
+
+    return {
+        "full": bool(old.get("full") or new.get("full")),
+        "layout": bool(old.get("layout") or new.get("layout")),
+        "nopubs": bool(old.get("nopubs") or new.get("nopubs")),
+        "changed": sorted(set(old.get("changed", [])) | set(new.get("changed", []))),
+    }
+
+def open_marker():
+    return os.fdopen(os.open(config.PUBLISH_PENDING, os.O_RDWR | os.O_CREAT, 0o600), "r+")
+
+def read_marker(marker):
+    marker.seek(0)
+    try:
+        request = json.loads(marker.read() or "null")
+    except ValueError:
+        # a half-written request; rebuilding everything covers it
+        request = {"full": True}
+
+    return request if isinstance(request, dict) else None
+
+def put(request):
+    '''
+    merges request into the pending marker
+    '''
+
+    with open_marker() as marker:
+        fcntl.flock(marker, fcntl.LOCK_EX)
+        old = read_marker(marker)
+        if old is not None:
+            request = merge(old, request)
+        marker.seek(0)
+        marker.truncate()
+        marker.write(json.dumps(request, sort_keys=True))
+
+def take():
+    '''
+    empties the pending marker; returns the request that was in it, or None
+    '''
+
+    with open_marker() as marker:
+        fcntl.flock(marker, fcntl.LOCK_EX)
+        request = read_marker(marker)
+        marker.seek(0)
+        marker.truncate()
+
+    return request
+
+def pending():
+    try:
+        return os.path.getsize(config.PUBLISH_PENDING) > 0
+    except OSError:
+        return False
+
+def publish(request, job):
+    '''
+    asks for request to be published by job (a function taking a request
+    and returning a list of pages written)
+
+    * returns the pages written, or None if another session is publishing
+      right now and will run the request for us
+    * if more requests come in while job is running, they're merged and run
+      once more before the lock is let go
+    '''
+
+    put(request)
+    written = None
+
+    # checking again after letting go of the lock catches requests that came
+    # in just as we were finishing
+    while pending():
+        lockfile = os.fdopen(os.open(config.PUBLISH_LOCK, os.O_RDONLY | os.O_CREAT, 0o600))
+        with lockfile:
+            try:
+                fcntl.flock(lockfile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return written
+
+            while True:
+                request = take()
+                if request is None:
+                    break
+                try:
+                    written = (written or []) + job(request)
+                except BaseException:
+                    # leave it for the next publish to try again
+                    put(request)
+                    raise
+
+    return written
@@ -0,0 +1,254 @@
+"""
+This module contains the revision history for entries.
+
+every time an entry is saved through ttbp, the version it replaces is kept in
+config.REVISIONS, one file per entry. each file holds the newest version in
+full (the head) and a reverse delta for every version before it: the line
+changes that turn a version back into the one it replaced. the whole file is
+zlib-compressed, so a small edit to a long entry costs a few bytes of
+history, not another copy of the entry.
+
+because the deltas run backwards from the head, the oldest versions are at
+the end of the list and can be dropped without touching anything newer;
+that's how the store is kept under its size cap (see prune()).
+
+versions are numbered by how many saves ago they were: 0 is the newest one
+recorded, 1 the one before it, and so on.
+
+history is on unless "revisions": false is set in ttbprc; the cap is
+"revision cap" in ttbprc, in megabytes.
+"""
+import difflib
+import json
+import os
+import time
+import zlib
+
+from . import config
+from . import util
+
+STORE_VERSION = 1
+# default size cap for the whole store, in megabytes
+CAP = 10
+SUFFIX = ".rev"
+
+
+def store_path(filename):
+    return os.path.join(config.REVISIONS, os.path.splitext(os.path.basename(filename))[0] + SUFFIX)
+
+def load(filename):
+    '''
+    the revision record for an entry: {"head", "time", "revs"}, where revs is
+    a list of {"time", "delta"}, newest first; None if there isn't one
+    '''
+
+    try:
+        with open(store_path(filename), "rb") as f:
+            record = json.loads(zlib.decompress(f.read()).decode("utf-8"))
+    except (OSError, ValueError, zlib.error):
+        return None
+
+    if not isinstance(record, dict) or record.get("version") != STORE_VERSION:
+        return None
+
+    return record
+
+def store(filename, record):
+    if not os.path.isdir(config.REVISIONS):
+        os.mkdir(config.REVISIONS)
+        os.chmod(config.REVISIONS, 0o700)
+
+    data = zlib.compress(json.dumps(record, sort_keys=True).encode("utf-8"), 9)
+    util.write_out(store_path(filename), [data])
+
+def make_delta(new, old):
+    '''
+    the changes that turn new into old (lists of lines), as a list of
+    [start, end, lines]: replace new[start:end] with lines
+    '''
+
+    return [[i1, i2, old[j1:j2]] for tag, i1, i2, j1, j2 in
+            difflib.SequenceMatcher(None, new, old, autojunk=False).get_opcodes()
+            if tag != "equal"]
+
+def apply_delta(lines, delta):
+    lines = list(lines)
+    for start, end, replacement in reversed(delta):
+        lines[start:end] = replacement
+
+    return lines
+
+def save(filename, settings={}):
+    '''
+    records the entry's current text as its newest version, keeping the one
+    it replaces as a delta; returns True if a new version was recorded
+
+    * does nothing if history is turned off, or the text hasn't changed
+    * prunes the store afterwards if it's over the cap
+    '''
+
+    if settings.get("revisions", True) is False:
+        return False
+
+    try:
+        with open(filename, "r") as f:
+            text = f.read()
+        mtime = os.path.getmtime(filename)
+    except OSError:
+        return False
+
+    record = load(filename)
+    if record is None:
+        record = {"version": STORE_VERSION, "head": text, "time": mtime, "revs": []}
+    elif record["head"] == text:
+        return False
+    else:
+        delta = make_delta(text.splitlines(True), record["head"].splitlines(True))
+        record["revs"].insert(0, {"time": record["time"], "delta": delta})
+        record["head"] = text
+        record["time"] = mtime
+
+    store(filename, record)
+    prune(settings.get("revision cap", CAP))
+
+    return True
+
+def versions(filename):
+    '''
+    every recorded version of an entry, newest first, as a list of
+    (time, lines)
+    '''
+
+    record = load(filename)
+    if record is None:
+        return []
+
+    lines = record["head"].splitlines(True)
+    history = [(record["time"], lines)]
+    for rev in record["revs"]:
+        lines = apply_delta(lines, rev["delta"])
+        history.append((rev["time"], lines))
+
+    return history
+
+def version(filename, number):
+    '''
+    the text of version number (0 is the newest), or None if there's no such
+    version
+    '''
+
+    history = versions(filename)
+    if not 0 <= number < len(history):
+        return None
+
+    return "".join(history[number][1])
+
+def diff(filename, old, new=0):
+    '''
+    unified diff from version old to version new, as a list of lines; None
+    if either version doesn't exist
+    '''
+
+    history = versions(filename)
+    if not (0 <= old < len(history) and 0 <= new < len(history)):
+        return None
+
+    name = os.path.basename(filename)
+    stamp = lambda number: "{name} (version {number}, {when})".format(name=name,
+            number=number, when=time.strftime("%Y-%m-%d %H:%M", time.localtime(history[number][0])))
+
+    return list(difflib.unified_diff(history[old][1], history[new][1],
+        stamp(old), stamp(new)))
+
+def restore(filename, number, settings={}):
+    '''
+    puts version number back as the entry's text, recording the current text
+    first so the restore can be undone; returns False if there's no such
+    version
+    '''
+
+    text = version(filename, number)
+    if text is None:
+        return False
+
+    save(filename, settings)
+    with open(filename, "w") as f:
+        f.write(text)
+    save(filename, settings)
+
+    return True
+
+def entries():
+    '''
+    filenames of entries with a history, newest date first
+    '''
+
+    try:
+        names = os.listdir(config.REVISIONS)
+    except OSError:
+        return []
+
+    return sorted([os.path.splitext(name)[0] + ".txt" for name in names
+        if name.endswith(SUFFIX)], reverse=True)
+
+def size():
+    '''
+    bytes used by the store
+    '''
+
+    total = 0
+    for name in entries():
+        try:
+            total += os.path.getsize(store_path(name))
+        except OSError:
+            pass
+
+    return total
+
+def forget(filename):
+    '''
+    drops an entry's whole history, for when the entry is deleted for good
+    '''
+
+    try:
+        os.remove(store_path(filename))
+    except OSError:
+        pass
+
+def prune(cap=CAP):
+    '''
+    drops the oldest revisions across all entries until the store is under
+    cap megabytes; heads are never dropped. returns how many were dropped
+    '''
+
+    limit = cap * 1024 * 1024
+    total = size()
+    if total <= limit:
+        return 0
+
+    records = dict((name, load(name)) for name in entries())
+    records = dict((name, record) for name, record in records.items() if record is not None)
+
+    # oldest revisions first; each is the last one left in its entry's list
+    oldest = sorted((rev["time"], name) for name, record in records.items()
+            for rev in record["revs"])
+
+    dropped = 0
+    touched = set()
+    for when, name in oldest:
+        if total <= limit:
+            break
+        records[name]["revs"].pop()
+        touched.add(name)
+        dropped += 1
+        # re-measure every so often; compressed sizes don't add up exactly
+        if dropped % 20 == 0:
+            for changed in touched:
+                store(changed, records[changed])
+            touched = set()
+            total = size()
+
+    for changed in touched:
+        store(changed, records[changed])
+
+    return dropped
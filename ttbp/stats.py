@@ -0,0 +1,510 @@
+"""
+This module contains the town posting statistics: entries per day, words per
+month, posting streaks, and rolling activity, for one user or the whole town.
+
+every entry becomes one row of (user, date, words), kept column-wise in typed
+arrays (see Activity), so the numbers are worked out in bulk instead of entry
+by entry. numpy does the bulk work if it's installed; otherwise the same
+results come from plain python over the arrays.
+
+rows come from a record per user, kept in their own ~/.ttbp/stats.json
+(config.STATS) and brought up to date incrementally (see update()): a user
+whose entries directory and nopub list haven't changed only has their newest
+entry looked at again, and otherwise only entries whose mtime or size changed
+get their words counted. everyone saves only their own record; other people's
+are read (and checked, since they're other people's files) and brought up to
+date in memory, and catch up for good the next time their owner runs ttbp.
+
+the results are published as a heatmap page next to the town page (see
+core.write_town_stats()) and shown in the terminal by `ttbp stats`.
+"""
+import bisect
+import datetime
+import json
+import os
+import re
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from . import config
+from . import util
+from . import wordcount
+
+RECORD_VERSION = 1
+# the heatmap covers this many weeks, ending with the current one
+WEEKS = 53
+# rolling activity is summed over this many days
+WINDOW = 30
+# heatmap colors, from no entries up to the busiest days
+LEVELS = ["#ebedf0", "#c6e48b", "#7bc96f", "#239a3b", "#196127"]
+# terminal heatmap characters, same levels
+SHADES = " .:*#"
+WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+
+## the records
+
+def record_path(user):
+    if user == config.USER:
+        return config.STATS
+
+    return os.path.join("/home", user, ".ttbp", "stats.json")
+
+def valid_row(filename, row, valid):
+    '''
+    checks one entry of a record: a valid entry filename, and [mtime, size,
+    words, nopub] of the right types
+    '''
+
+    if not valid(filename) or "/" in filename:
+        return False
+
+    if not isinstance(row, list) or len(row) != 4:
+        return False
+
+    mtime, size, words, nopub = row
+
+    return (isinstance(mtime, (int, float)) and not isinstance(mtime, bool) and
+            isinstance(size, int) and not isinstance(size, bool) and
+            isinstance(words, int) and not isinstance(words, bool) and words >= 0 and
+            isinstance(nopub, bool))
+
+def load_record(user, valid):
+    '''
+    the user's saved record (see update_user()), with anything malformed left
+    out; an empty one if it's missing, unreadable, or from another version
+    '''
+
+    try:
+        with open(record_path(user)) as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        saved = None
+
+    if not isinstance(saved, dict) or saved.get("version") != RECORD_VERSION:
+        return {}
+
+    record = {}
+    for key in ["mtime", "nopub"]:
+        if isinstance(saved.get(key), (int, float)) and not isinstance(saved.get(key), bool):
+            record[key] = saved[key]
+
+    entries = saved.get("entries")
+    if isinstance(entries, dict):
+        record["entries"] = dict((filename, row) for filename, row in entries.items()
+                if valid_row(filename, row, valid))
+
+    return record
+
+def save_record(record):
+    '''
+    writes the current user's record back; returns True if it was saved
+    '''
+
+    saved = dict(record, version=RECORD_VERSION)
+    try:
+        util.write_out(config.STATS, [json.dumps(saved, sort_keys=True).encode("utf-8")])
+    except OSError:
+        return False
+
+    return True
+
+def load_user_nopubs(user):
+    '''
+    the given user's nopub list, like core.load_nopubs()
+    '''
+
+    nopubs = set()
+    try:
+        with open(os.path.join("/home", user, ".ttbp", "config", "nopub")) as f:
+            for line in f:
+                if not re.match("^# ", line):
+                    nopubs.add(line.rstrip())
+    except OSError:
+        pass
+
+    return nopubs
+
+def stamp(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+def update_user(record, user, valid):
+    '''
+    brings one user's index record up to date; returns True if it changed
+
+    * record is {"mtime", "nopub", "entries": {filename: [mtime, size, words,
+      nopub]}}, where mtime and nopub are the mtimes of the entries directory
+      and nopub file as of the last full look
+    * if neither changed, only the newest entry is checked, since that's the
+      one that gets edited in place
+    '''
+
+    entryDir = os.path.join("/home", user, ".ttbp", "entries")
+    nopubFile = os.path.join("/home", user, ".ttbp", "config", "nopub")
+    entries = record.setdefault("entries", {})
+
+    dirStamp = stamp(entryDir)
+    nopubStamp = stamp(nopubFile)
+
+    if record.get("mtime") == dirStamp and record.get("nopub") == nopubStamp:
+        if not entries:
+            return False
+        newest = max(entries)
+        try:
+            st = os.stat(os.path.join(entryDir, newest))
+        except OSError:
+            return False
+        if entries[newest][:2] == [st.st_mtime, st.st_size]:
+            return False
+        counts = wordcount.count_files([os.path.join(entryDir, newest)])
+        entries[newest] = [st.st_mtime, st.st_size,
+                counts[os.path.join(entryDir, newest)] or 0, entries[newest][3]]
+        return True
+
+    try:
+        scan = [entry for entry in os.scandir(entryDir)
+                if valid(entry.name) and entry.is_file()]
+    except OSError:
+        scan = []
+
+    nopubs = load_user_nopubs(user)
+    fresh = {}
+    recount = []
+    for entry in scan:
+        st = entry.stat()
+        old = entries.get(entry.name)
+        if old and old[:2] == [st.st_mtime, st.st_size]:
+            fresh[entry.name] = old[:3] + [entry.name in nopubs]
+        else:
+            fresh[entry.name] = [st.st_mtime, st.st_size, 0, entry.name in nopubs]
+            recount.append(entry.path)
+
+    for path, words in wordcount.count_files(recount).items():
+        fresh[os.path.basename(path)][2] = words or 0
+
+    record["mtime"] = dirStamp
+    record["nopub"] = nopubStamp
+    record["entries"] = fresh
+
+    return True
+
+def update(users, valid):
+    '''
+    brings the records for the given users up to date and returns them, as
+    {"users": {user: record}}
+
+    * valid is the entry filename check to use (core.valid)
+    * users whose ttbp is gone are left out
+    * only the current user's record is written back, and only if it changed
+    '''
+
+    index = {"users": {}}
+
+    for user in users:
+        if not os.path.isdir(os.path.join("/home", user, ".ttbp")):
+            continue
+        record = load_record(user, valid)
+        changed = update_user(record, user, valid)
+        if changed and user == config.USER:
+            save_record(record)
+        index["users"][user] = record
+
+    return index
+
+## rows
+
+class Activity(object):
+    '''
+    (user, date, words) rows for a set of entries, column-wise
+
+    * users is the list of usernames; user holds indexes into it
+    * day is the entry's date as a proleptic ordinal (date.toordinal()), and
+      month is year * 12 + month - 1, so both are plain integers to bin by
+    * rows are sorted by user and then day, so one user's rows are a
+      contiguous run (see select())
+    '''
+
+    def __init__(self):
+        self.users = []
+        self.user = array("i")
+        self.day = array("i")
+        self.month = array("i")
+        self.words = array("i")
+
+    def __len__(self):
+        return len(self.day)
+
+    @classmethod
+    def from_index(cls, index, users=None, public=False):
+        '''
+        rows for the given users (everyone in the index if None); public
+        leaves out nopub entries
+        '''
+
+        activity = cls()
+        records = index["users"]
+
+        for user in sorted(records if users is None else set(users) & set(records)):
+            number = len(activity.users)
+            activity.users.append(user)
+            for filename, row in sorted(records[user].get("entries", {}).items()):
+                if not isinstance(row, list) or len(row) != 4:
+                    continue
+                mtime, size, words, nopub = row
+                if public and nopub:
+                    continue
+                try:
+                    date = util.parse_date(filename)
+                    year, month, day = int(date[0]), int(date[1]), int(date[2])
+                    activity.day.append(datetime.date(year, month, day).toordinal())
+                except (ValueError, TypeError, IndexError):
+                    continue
+                activity.user.append(number)
+                activity.month.append(year * 12 + month - 1)
+                activity.words.append(words)
+
+        return activity
+
+    def select(self, user):
+        '''
+        the rows for one user, as a new Activity
+        '''
+
+        selected = Activity()
+        if user not in self.users:
+            return selected
+
+        number = self.users.index(user)
+        start = bisect.bisect_left(self.user, number)
+        stop = bisect.bisect_right(self.user, number)
+
+        selected.users = [user]
+        selected.user = array("i", [0]) * (stop - start)
+        selected.day = self.day[start:stop]
+        selected.month = self.month[start:stop]
+        selected.words = self.words[start:stop]
+
+        return selected
+
+## bulk numbers
+
+def histogram(keys, start, stop, weights=None):
+    '''
+    counts of keys (an array) in each bin from start up to stop, or sums of
+    weights (an array the same length) if given
+    '''
+
+    size = max(0, stop - start)
+
+    if numpy is not None:
+        values = numpy.frombuffer(keys, dtype=numpy.int32)
+        mask = (values >= start) & (values < stop)
+        if weights is not None:
+            weights = numpy.frombuffer(weights, dtype=numpy.int32)[mask]
+        counts = numpy.bincount(values[mask] - start, weights=weights, minlength=size)
+        return [int(count) for count in counts]
+
+    counts = [0] * size
+    if weights is None:
+        for value in keys:
+            if start <= value < stop:
+                counts[value - start] += 1
+    else:
+        for value, weight in zip(keys, weights):
+            if start <= value < stop:
+                counts[value - start] += weight
+
+    return counts
+
+def rolling(counts, window=WINDOW):
+    '''
+    sum of the window counts up to and including each one
+    '''
+
+    if numpy is not None:
+        sums = numpy.concatenate(([0], numpy.cumsum(counts, dtype=numpy.int64)))
+        ends = numpy.arange(1, len(counts) + 1)
+        return [int(total) for total in sums[ends] - sums[numpy.maximum(0, ends - window)]]
+
+    totals = []
+    total = 0
+    for i, count in enumerate(counts):
+        total += count
+        if i >= window:
+            total -= counts[i - window]
+        totals.append(total)
+
+    return totals
+
+def streaks(days, today):
+    '''
+    returns (current, longest): the longest run of consecutive days with an
+    entry, and the run ending today or yesterday (0 if there isn't one)
+    '''
+
+    if numpy is not None:
+        unique = numpy.unique(numpy.frombuffer(days, dtype=numpy.int32))
+        if not len(unique):
+            return 0, 0
+        breaks = numpy.flatnonzero(numpy.diff(unique) != 1)
+        ends = numpy.concatenate((breaks, [len(unique) - 1]))
+        runs = numpy.diff(numpy.concatenate(([-1], ends)))
+        current = int(runs[-1]) if unique[-1] >= today - 1 else 0
+        return current, int(runs.max())
+
+    unique = sorted(set(days))
+    if not unique:
+        return 0, 0
+    longest = run = 1
+    for previous, day in zip(unique, unique[1:]):
+        run = run + 1 if day == previous + 1 else 1
+        longest = max(longest, run)
+    current = run if unique[-1] >= today - 1 else 0
+
+    return current, longest
+
+def heat_start(today):
+    '''
+    the monday WEEKS - 1 weeks before this week's, as an ordinal
+    '''
+
+    return today - datetime.date.fromordinal(today).weekday() - 7 * (WEEKS - 1)
+
+def level(count, busiest):
+    '''
+    heatmap level (index into LEVELS) for a day's entry count
+    '''
+
+    if not count:
+        return 0
+
+    return 1 + min(3, (4 * (count - 1)) // max(1, busiest))
+
+def summarize(activity, today):
+    '''
+    the headline numbers for a set of rows, as a dict
+    '''
+
+    current, longest = streaks(activity.day, today)
+    recent = histogram(activity.day, today - WINDOW + 1, today + 1)
+
+    return {
+        "entries": len(activity),
+        "words": sum(activity.words),
+        "days": len(set(activity.day)),
+        "current streak": current,
+        "longest streak": longest,
+        "last {window} days".format(window=WINDOW): rolling(recent)[-1] if recent else 0,
+        "first": datetime.date.fromordinal(min(activity.day)).isoformat() if len(activity) else None,
+        "last": datetime.date.fromordinal(max(activity.day)).isoformat() if len(activity) else None,
+    }
+
+def monthly_words(activity, today, months=12):
+    '''
+    [("YYYY-MM", words)] for the last months months, oldest first
+    '''
+
+    date = datetime.date.fromordinal(today)
+    stop = date.year * 12 + date.month
+    words = histogram(activity.month, stop - months, stop, activity.words)
+
+    return [("{year}-{month:02}".format(year=(stop - months + i) // 12,
+        month=(stop - months + i) % 12 + 1), total) for i, total in enumerate(words)]
+
+## output
+
+def heatmap_page(activity, today):
+    '''
+    the town stats page: an entries-per-day heatmap for the last year, words
+    per month, and a table of writers. returns utf-8 bytes
+    '''
+
+    start = heat_start(today)
+    daily = histogram(activity.day, start, today + 1)
+    busiest = max(daily or [0])
+    town = summarize(activity, today)
+
+    page = ["""\
+<!DOCTYPE html PUBLIC \"-//W3C//DTD HTML 3.2//EN\">
+<html>
+    <head>
+        <title>tilde.town feels engine: stats</title>
+        <link rel=\"stylesheet\" href=\"style.css\" />
+    </head>
+    <body>
+        <div class="meta">
+        <h1>tilde.town feels engine: stats</h1>
+        <h2><a href="index.html">back to the feels engine</a></h2>
+        </div>
+        <p>{entries} published entries and {words} words from {writers} writers.
+        the town's current streak is {current} days; the longest was {longest}.</p>
+        <table class="heatmap" style="border-spacing: 2px">
+""".format(entries=town["entries"], words=town["words"], writers=len(activity.users),
+    current=town["current streak"], longest=town["longest streak"])]
+
+    for weekday in range(7):
+        page.append("            <tr><td>"+WEEKDAYS[weekday]+"</td>")
+        for week in range(WEEKS):
+            offset = week * 7 + weekday
+            if offset >= len(daily):
+                page.append("<td></td>")
+                continue
+            page.append("<td style=\"width: 10px; height: 10px; background: {color}\" title=\"{date}: {count}\"></td>".format(
+                color=LEVELS[level(daily[offset], busiest)],
+                date=datetime.date.fromordinal(start + offset).isoformat(),
+                count=daily[offset]))
+        page.append("</tr>\n")
+
+    page.append("""\
+        </table>
+        <h3>words per month</h3>
+        <table>
+""")
+    for month, words in monthly_words(activity, today):
+        page.append("            <tr><td>"+month+"</td><td>"+str(words)+"</td></tr>\n")
+
+    page.append("""\
+        </table>
+        <h3>writers</h3>
+        <table>
+            <tr><th>writer</th><th>entries</th><th>words</th><th>streak</th><th>longest</th><th>last {window} days</th></tr>
+""".format(window=WINDOW))
+    for user in activity.users:
+        numbers = summarize(activity.select(user), today)
+        page.append("            <tr><td>~{user}</td><td>{entries}</td><td>{words}</td><td>{current}</td><td>{longest}</td><td>{recent}</td></tr>\n".format(
+            user=user, entries=numbers["entries"], words=numbers["words"],
+            current=numbers["current streak"], longest=numbers["longest streak"],
+            recent=numbers["last {window} days".format(window=WINDOW)]))
+
+    page.append("""\
+        </table>
+    </body>
+</html>
+""")
+
+    return "".join(page).encode("utf-8")
+
+def heatmap_lines(activity, today, weeks=26):
+    '''
+    a terminal heatmap of entries per day for the last weeks weeks, one line
+    per weekday
+    '''
+
+    start = today - datetime.date.fromordinal(today).weekday() - 7 * (weeks - 1)
+    daily = histogram(activity.day, start, today + 1)
+    busiest = max(daily or [0])
+
+    lines = []
+    for weekday in range(7):
+        row = [SHADES[level(daily[offset], busiest)]
+                for offset in range(weekday, len(daily), 7)]
+        lines.append(WEEKDAYS[weekday]+" "+"".join(row))
+
+    return lines
@@ -45,10 +45,16 @@ from six.moves import input
 
 import inflect
 
+from . import ansi
+from . import backup
 from . import chatter
 from . import config
 from . import core
+from . import feedd
 from . import gopher
+from . import graffiti
+from . import pager
+from . import revisions
 from . import util
 
 __version__ = "0.12.3"
@@ -126,21 +132,24 @@ def page_helper(options, prompt, pagify, rainbow, page, total, top):
     'top' is displyed after the banner redraw
     """
 
-    ## make short list
-    x = 0 + page * pagify
-    y = x + pagify
-    optPage = options[x:y]
+    while True:
+        ## make short list
+        x = 0 + page * pagify
+        y = x + pagify
+        optPage = options[x:y]
 
-    util.print_menu(optPage, SETTINGS.get("rainbows", False))
-    print(
-        "\n\t( page {page} of {total}; type 'u' or 'd' to scroll up and down)".format(
-            page=page + 1, total=total + 1
+        util.print_menu(optPage, SETTINGS.get("rainbows", False))
+        print(
+            "\n\t( page {page} of {total}; type 'u' or 'd' to scroll up and down)".format(
+                page=page + 1, total=total + 1
+            )
         )
-    )
 
-    ans = util.list_select(optPage, prompt)
+        ans = util.list_select(optPage, prompt)
+
+        if ans not in util.NAVS:
+            break
 
-    if ans in util.NAVS:
         error = ""
         if ans == "u":
             if page == 0:
@@ -153,17 +162,15 @@ def page_helper(options, prompt, pagify, rainbow, page, total, top):
             else:
                 page = page + 1
         redraw(error + top)
-        return page_helper(options, prompt, pagify, rainbow, page, total, top)
 
-    elif ans is False:
+    if ans is False:
         return ans
 
-    else:
-        # shift answer to refer to index from original list
-        ans = ans + page * pagify
-        # return the (shifted) answer and the current page
-        # alternatively, we can recompute the current page at a call site
-        return (page, ans)
+    # shift answer to refer to index from original list
+    ans = ans + page * pagify
+    # return the (shifted) answer and the current page
+    # alternatively, we can recompute the current page at a call site
+    return (page, ans)
 
 
 def redraw(leftover=""):
@@ -615,65 +622,65 @@ def main_menu():
         "read documentation",
     ]
 
-    print(
-        "you're at ttbp home. remember, you can always press <ctrl-c> to come back here.\n"
-    )
-    util.print_menu(menuOptions, SETTINGS.get("rainbows", False))
-
-    try:
-        choice = input("\ntell me about your feels (or type 'q' to exit): ")
-    except KeyboardInterrupt:
-        redraw(EJECT)
-        return main_menu()
-
-    if choice == "0":
-        redraw()
-        today = time.strftime("%Y%m%d")
-        write_entry(os.path.join(config.MAIN_FEELS, today + ".txt"))
-        core.www_neighbors()
-    elif choice == "1":
-        intro = "here are some options for managing your feels:"
-        redraw(intro)
-        review_menu(intro)
-        core.load_files()
-    elif choice == "2":
-        users = core.find_ttbps()
-        prompt = "the following {usercount} {are} recording feels on ttbp:".format(
-            usercount=p.no("user", len(users)), are=p.plural("is", len(users))
-        )
-        redraw(prompt)
-        view_neighbors(users, prompt)
-    elif choice == "3":
-        redraw("most recent global entries")
-        view_global_feed()
-    elif choice == "4":
-        intro = "your subscriptions list is private; no one but you will know who you're following.\n\n> here are some options for your subscriptions:"
-        redraw(intro)
-        subscription_handler(intro)
-    elif choice == "5":
-        graffiti_handler()
-    elif choice == "6":
-        redraw(
-            "now changing your settings. press <ctrl-c> if you didn't mean to do this."
-        )
-        core.load(setup())  # reload settings to core
-    elif choice == "7":
-        redraw("you're about to send mail to ~endorphant about ttbp")
-        feedback_menu()
-    elif choice == "8":
-        redraw()
-        show_credits()
-    elif choice == "9":
-        subprocess.call(
-            ["lynx", os.path.join(config.INSTALL_PATH, "..", "doc", "manual.html")]
+    while True:
+        print(
+            "you're at ttbp home. remember, you can always press <ctrl-c> to come back here.\n"
         )
-        redraw()
-    elif choice in QUITS:
-        return stop()
-    else:
-        redraw(INVALID)
+        util.print_menu(menuOptions, SETTINGS.get("rainbows", False))
 
-    return main_menu()
+        try:
+            choice = input("\ntell me about your feels (or type 'q' to exit): ")
+        except KeyboardInterrupt:
+            redraw(EJECT)
+            continue
+
+        if choice == "0":
+            redraw()
+            today = time.strftime("%Y%m%d")
+            write_entry(os.path.join(config.MAIN_FEELS, today + ".txt"))
+            feedd.notify()
+            core.www_neighbors()
+        elif choice == "1":
+            intro = "here are some options for managing your feels:"
+            redraw(intro)
+            review_menu(intro)
+            core.load_files()
+        elif choice == "2":
+            users = core.find_ttbps()
+            prompt = "the following {usercount} {are} recording feels on ttbp:".format(
+                usercount=p.no("user", len(users)), are=p.plural("is", len(users))
+            )
+            redraw(prompt)
+            view_neighbors(users, prompt)
+        elif choice == "3":
+            redraw("most recent global entries")
+            view_global_feed()
+        elif choice == "4":
+            intro = "your subscriptions list is private; no one but you will know who you're following.\n\n> here are some options for your subscriptions:"
+            redraw(intro)
+            subscription_handler(intro)
+        elif choice == "5":
+            graffiti_handler()
+        elif choice == "6":
+            redraw(
+                "now changing your settings. press <ctrl-c> if you didn't mean to do this."
+            )
+            core.load(setup())  # reload settings to core
+        elif choice == "7":
+            redraw("you're about to send mail to ~endorphant about ttbp")
+            feedback_menu()
+        elif choice == "8":
+            redraw()
+            show_credits()
+        elif choice == "9":
+            subprocess.call(
+                ["lynx", os.path.join(config.INSTALL_PATH, "..", "doc", "manual.html")]
+            )
+            redraw()
+        elif choice in QUITS:
+            return stop()
+        else:
+            redraw(INVALID)
 
 
 def feedback_menu():
@@ -684,31 +691,30 @@ def feedback_menu():
     * calls feedback writing function
     """
 
-    util.print_menu(SUBJECTS, SETTINGS.get("rainbows", False))
-    choice = input("\npick a category for your feedback (or type 'q' to exit): ")
+    while True:
+        util.print_menu(SUBJECTS, SETTINGS.get("rainbows", False))
+        choice = input("\npick a category for your feedback (or type 'q' to exit): ")
 
-    cat = ""
-    if choice in ["0", "1", "2", "3"]:
-        cat = SUBJECTS[int(choice)]
-        entered = input(
-            """
+        cat = ""
+        if choice in ["0", "1", "2", "3"]:
+            cat = SUBJECTS[int(choice)]
+            entered = input(
+                """
 composing a {mail_category} to ~endorphant.
 
 press <enter> to open an external text editor. mail will be sent once you save and quit.
 
 """.format(
-                mail_category=cat
+                    mail_category=cat
+                )
             )
-        )
-        redraw(send_feedback(entered, cat))
-        return
-    elif choice in QUITS:
-        redraw()
-        return stop()
-    else:
-        redraw(INVALID)
-
-    return feedback_menu()
+            redraw(send_feedback(entered, cat))
+            return
+        elif choice in QUITS:
+            redraw()
+            return stop()
+        else:
+            redraw(INVALID)
 
 
 def review_menu(intro=""):
@@ -718,6 +724,7 @@ def review_menu(intro=""):
 
     menuOptions = [
         "read over feels",
+        "feels on this day",
         "modify feels publishing",
         "backup your feels",
         "import a feels backup",
@@ -727,68 +734,71 @@ def review_menu(intro=""):
         "wipe feels account",
     ]
 
-    util.print_menu(menuOptions, SETTINGS.get("rainbows", False))
+    while True:
+        util.print_menu(menuOptions, SETTINGS.get("rainbows", False))
 
-    choice = util.list_select(
-        menuOptions,
-        "what would you like to do with your feels? (or 'q' to return home) ",
-    )
+        choice = util.list_select(
+            menuOptions,
+            "what would you like to do with your feels? (or 'q' to return home) ",
+        )
 
-    top = ""
-    hasfeels = len(os.listdir(config.MAIN_FEELS)) > 0
-    nofeels = (
-        "you don't have any feels to work with, " + chatter.say("friend") + "\n\n> "
-    )
+        top = ""
+        hasfeels = len(os.listdir(config.MAIN_FEELS)) > 0
+        nofeels = (
+            "you don't have any feels to work with, " + chatter.say("friend") + "\n\n> "
+        )
 
-    if choice is not False:
-        if choice == 0:
-            if hasfeels:
-                redraw("your recorded feels, listed by date:")
-                view_feels(config.USER)
-            else:
-                top = nofeels
-        elif choice == 1:
-            if hasfeels:
-                redraw("publishing status of your feels:")
-                list_nopubs(config.USER)
-            else:
-                top = nofeels
-        elif choice == 2:
-            if hasfeels:
-                redraw("FEELS BACKUP")
-                backup_feels()
-            else:
-                top = nofeels
-        elif choice == 3:
-            redraw("loading feels backup")
-            load_backup()
-        elif choice == 4:
-            if hasfeels:
-                redraw("burying feels")
-                bury_feels()
-            else:
-                top = nofeels
-        elif choice == 5:
-            if hasfeels:
-                redraw("deleting feels")
-                delete_feels()
-            else:
-                top = nofeels
-        elif choice == 6:
-            if hasfeels:
-                redraw("!!!PURGING ALL FEELS!!!")
-                purge_feels()
-            else:
-                top = nofeels
-        elif choice == 7:
-            redraw("!!! WIPING FEELS ACCOUNT !!!")
-            wipe_account()
-    else:
-        redraw()
-        return
+        if choice is not False:
+            if choice == 0:
+                if hasfeels:
+                    redraw("your recorded feels, listed by date:")
+                    view_feels(config.USER)
+                else:
+                    top = nofeels
+            elif choice == 1:
+                redraw("feels on this day")
+                view_on_this_day()
+            elif choice == 2:
+                if hasfeels:
+                    redraw("publishing status of your feels:")
+                    list_nopubs(config.USER)
+                else:
+                    top = nofeels
+            elif choice == 3:
+                if hasfeels:
+                    redraw("FEELS BACKUP")
+                    backup_feels()
+                else:
+                    top = nofeels
+            elif choice == 4:
+                redraw("loading feels backup")
+                load_backup()
+            elif choice == 5:
+                if hasfeels:
+                    redraw("burying feels")
+                    bury_feels()
+                else:
+                    top = nofeels
+            elif choice == 6:
+                if hasfeels:
+                    redraw("deleting feels")
+                    delete_feels()
+                else:
+                    top = nofeels
+            elif choice == 7:
+                if hasfeels:
+                    redraw("!!!PURGING ALL FEELS!!!")
+                    purge_feels()
+                else:
+                    top = nofeels
+            elif choice == 8:
+                redraw("!!! WIPING FEELS ACCOUNT !!!")
+                wipe_account()
+        else:
+            redraw()
+            return
 
-    redraw(top + intro)
-    return review_menu(intro)
+        redraw(top + intro)
 
 
 def subscription_handler(intro=""):
@@ -800,46 +810,46 @@ def subscription_handler(intro=""):
         subprocess.call(["touch", config.SUBS])
         subprocess.call(["chmod", "600", config.SUBS])
 
-    subs_raw = []
-    if os.path.isfile(config.SUBS):
-        for line in open(config.SUBS, "r"):
-            subs_raw.append(line.rstrip())
-
-    subs = []
-    all_users = core.find_ttbps()
-    for name in subs_raw:
-        if name in all_users:
-            subs.append(name)
-
+    all_users = set(core.find_ttbps())
     menuOptions = ["view subscribed feed", "manage subscriptions"]
 
-    util.print_menu(menuOptions, SETTINGS.get("rainbows", False))
+    while True:
+        subs_raw = []
+        if os.path.isfile(config.SUBS):
+            for line in open(config.SUBS, "r"):
+                subs_raw.append(line.rstrip())
 
-    choice = util.list_select(
-        menuOptions,
-        "what would you like to do with your subscriptions? (or 'q' to return home) ",
-    )
+        subs = []
+        for name in subs_raw:
+            if name in all_users:
+                subs.append(name)
 
-    top = ""
+        util.print_menu(menuOptions, SETTINGS.get("rainbows", False))
+
+        choice = util.list_select(
+            menuOptions,
+            "what would you like to do with your subscriptions? (or 'q' to return home) ",
+        )
 
-    if choice is not False:
-        if choice == 0:
-            if len(subs) > 0:
-                prompt = "most recent entries from your subscribed pals:"
+        top = ""
+
+        if choice is not False:
+            if choice == 0:
+                if len(subs) > 0:
+                    prompt = "most recent entries from your subscribed pals:"
+                    redraw(prompt)
+                    view_subscribed_feed(subs, prompt)
+                else:
+                    intro = "it doesn't look like you have any subscriptions to see! add pals with 'manage subscriptions' here."
+            elif choice == 1:
+                prompt = "options for managing your subscriptions:"
                 redraw(prompt)
-                view_subscribed_feed(subs, prompt)
-            else:
-                intro = "it doesn't look like you have any subscriptions to see! add pals with 'manage subscriptions' here."
-        elif choice == 1:
-            prompt = "options for managing your subscriptions:"
-            redraw(prompt)
-            subscription_manager(subs, prompt)
-    else:
-        redraw()
-        return
+                subscription_manager(subs, prompt)
+        else:
+            redraw()
+            return
 
-    redraw(top + intro)
-    return subscription_handler(intro)
+        redraw(top + intro)
 
 
 def view_neighbors(users, prompt, page=0):
@@ -847,40 +857,60 @@ def view_neighbors(users, prompt, page=0):
     generates list of all users on ttbp, sorted by most recent post
 
     * if user is publishing, list publish directory
+    * the list is only rebuilt when someone's entries or settings have changed
+      since it was last shown
     """
 
-    userList = []
+    stamp = None
 
-    ## assumes list of users passed in all have valid config files
-    for user in users:
-        userRC = json.load(
-            open(os.path.join("/home", user, ".ttbp", "config", "ttbprc"))
+    while True:
+        if stamp != core.town_stamp(users):
+            stamp = core.town_stamp(users)
+            sortedUsers, userIndex = neighbor_list(users)
+
+        ans = menu_handler(
+            sortedUsers,
+            "pick a townie to browse their feels, or type 'q' to go home: ",
+            15,
+            page,
+            SETTINGS.get("rainbows", False),
+            prompt,
         )
 
+        if ans is False:
+            redraw()
+            return
+
+        (page, choice) = ans
+        redraw(
+            "~{user}'s recorded feels, listed by date: \n".format(
+                user=userIndex[choice]
+            )
+        )
+        view_feels(userIndex[choice])
+
+
+def neighbor_list(users):
+    """
+    formats the neighbors list for view_neighbors()
+
+    returns a tuple of (display lines, usernames), sorted by most recent post
+    """
+
+    userList = []
+
+    for user, info in core.town_neighbors(users).items():
         ## retrieve publishing url, if it exists
         url = "\t\t\t"
-        if userRC.get("publish dir"):
-            url = config.LIVE + user + "/" + userRC.get("publish dir")
-
-        ## find last entry
-        try:
-            files = os.listdir(os.path.join("/home", user, ".ttbp", "entries"))
-        except OSError:
-            files = []
-        files.sort()
-        lastfile = ""
-        for filename in files:
-            if core.valid(filename):
-                lastfile = os.path.join("/home", user, ".ttbp", "entries", filename)
+        if info.get("publish dir"):
+            url = config.LIVE + user + "/" + info.get("publish dir")
 
         ## generate human-friendly timestamp
         ago = "never"
-        if lastfile:
-            last = os.path.getctime(lastfile)
+        last = info.get("last", 0)
+        if last:
             since = time.time() - last
             ago = util.pretty_time(int(since)) + " ago"
-        else:
-            last = 0
 
         ## some formatting handwavin
         urlpad = ""
@@ -910,27 +940,7 @@ def view_neighbors(users, prompt, page=0):
         sortedUsers.append(user[0])
         userIndex.append(user[2])
 
-    ans = menu_handler(
-        sortedUsers,
-        "pick a townie to browse their feels, or type 'q' to go home: ",
-        15,
-        page,
-        SETTINGS.get("rainbows", False),
-        prompt,
-    )
-
-    if ans is not False:
-        (page, choice) = ans
-        redraw(
-            "~{user}'s recorded feels, listed by date: \n".format(
-                user=userIndex[choice]
-            )
-        )
-        view_feels(userIndex[choice])
-        view_neighbors(users, prompt, page)
-    else:
-        redraw()
-        return
+    return sortedUsers, userIndex
 
 
 def view_feels(townie):
@@ -942,46 +952,86 @@ def view_feels(townie):
     metas, owner = generate_feels_list(townie)
 
     if len(metas) > 0:
-        entries = []
-        for entry in metas:
-            pub = ""
-            if core.nopub(entry[0]):
-                pub = "(nopub)"
-            entries.append(
-                "" + entry[4] + " (" + p.no("word", entry[2]) + ") " + "\t" + pub
-            )
+        entries = util.LazyMap(entry_line, metas)
 
         return list_entries(metas, entries, owner + " recorded feels, listed by date: ")
     else:
         redraw("no feels recorded by ~" + townie)
 
 
+def view_on_this_day():
+    """
+    lists your feels from today's date in past years (and optionally
+    everyone's published feels from today's date) for reading.
+    """
+
+    town = util.input_yn("include published feels from around town?")
+    metas = core.on_this_day(town=town)
+
+    if not metas:
+        redraw("nothing was written on this day in past years. maybe next year!")
+        return
+
+    today = datetime.date.today()
+    entries = [day_line(entry, today) for entry in metas]
+
+    return list_entries(metas, entries, "feels written on {month} {day} in past years:".format(
+        month=chatter.month("{month:02}".format(month=today.month)), day=today.day))
+
+
+def day_line(entry, today):
+    """
+    formats one meta for the on-this-day list: how long ago, who, and
+    word count
+    """
+
+    years = today.year - int(entry[4][0:4])
+
+    return "{ago} ({year})\t~{user} ({wordcount})".format(
+        ago=p.no("year", years) + " ago", year=entry[4][0:4], user=entry[5],
+        wordcount=p.no("word", entry[2]))
+
+
+def entry_line(entry):
+    """
+    formats one meta for an entries list: date, word count, and nopub status
+    """
+
+    pub = ""
+    if core.nopub(entry[0]):
+        pub = "(nopub)"
+
+    return "" + entry[4] + " (" + p.no("word", entry[2]) + ") " + "\t" + pub
+
+
 def generate_feels_list(user):
-    """create a list of feels for display from the named user."""
+    """create a list of feels for display from the named user.
+
+    the list is a core.LazyMetas, so only the entries actually shown get
+    stat()ed and word counted."""
 
     filenames = []
     showpub = False
 
     if user == config.USER:
-        entryDir = config.MAIN_FEELS
         owner = "your"
         if core.publishing():
             showpub = True
+        filenames = core.all_files()
     else:
         owner = "~" + user + "'s"
         entryDir = os.path.join("/home", user, ".ttbp", "entries")
 
-    for entry in os.listdir(entryDir):
-        filenames.append(os.path.join(entryDir, entry))
-    metas = core.meta(filenames)
-    metas.sort(key=lambda entry: entry[4])
-    metas.reverse()
+        for entry in os.listdir(entryDir):
+            if core.valid(entry):
+                filenames.append(os.path.join(entryDir, entry))
 
-    return metas, owner
+    return core.LazyMetas(filenames), owner
 
 
 def backup_feels():
-    """creates a tar.gz of user's entries directory"""
+    """snapshots user's entries into the backup store, and exports that
+    snapshot as a tar.gz"""
 
     backupfile = os.path.join(
         os.path.expanduser("~"),
@@ -1013,21 +1063,18 @@ please enter"""
     )
 
     if ans:
-        if not subprocess.call(
-            ["tar", "-C", config.PATH, "-czf", backupfile, "entries"]
-        ):
-            subprocess.call(["chmod", "600", backupfile])
-            if not os.path.exists(config.BACKUPS):
-                subprocess.call(["mkdir", config.BACKUPS])
-            subprocess.call(["chmod", "700", config.BACKUPS])
-            subprocess.call(["cp", backupfile, config.BACKUPS])
+        try:
+            snapshot, count, stored = backup.snapshot()
+            backup.export(snapshot, backupfile)
+            backup.prune(SETTINGS)
+        except (OSError, ValueError):
+            print(config.mystery_error)
+        else:
             print(
-                "\nbackup saved! i also put a copy at {backup_dir} for you.".format(
-                    backup_dir=config.BACKUPS
+                "\nbackup saved! i also kept a snapshot of your {count} at {backup_dir} for you.".format(
+                    count=p.no("entry", count), backup_dir=config.BACKUPS
                 )
             )
-        else:
-            print(config.mystery_error)
     else:
         print(
             "no problem, {friend}; come back whenever if you want a backup!".format(
@@ -1146,6 +1193,7 @@ type the following purge code:
             unpublish()
 
             if not subprocess.call(["rm", "-rf", config.MAIN_FEELS]):
+                subprocess.call(["rm", "-rf", config.REVISIONS])
                 subprocess.call(["mkdir", config.MAIN_FEELS])
                 core.load_files()
                 print("ALL FEELS PURGED! you're ready to start fresh!")
@@ -1233,11 +1281,17 @@ def load_backup():
     print("...\n")
 
     backups = []
+    labels = []
+
+    for snapshot in backup.snapshots():
+        backups.append(backup.manifest_path(snapshot))
+        labels.append("snapshot " + snapshot)
 
     try:
-        for filename in os.listdir(config.BACKUPS):
+        for filename in sorted(os.listdir(config.BACKUPS), reverse=True):
             if "feels-backup" in filename and ".tar" in filename:
-                backups.append(filename)
+                backups.append(os.path.join(config.BACKUPS, filename))
+                labels.append(filename)
     except FileNotFoundError:
         subprocess.call(["mkdir", config.BACKUPS])
 
@@ -1253,7 +1307,7 @@ move it to {directory} and try running this tool again.\
     else:
         print("backup files found:\n")
         ans = menu_handler(
-            backups,
+            labels,
             "pick a backup file to load (or 'q' to cancel): ",
             15,
             0,
@@ -1263,7 +1317,7 @@ move it to {directory} and try running this tool again.\
 
         if ans is not False:
             (page, choice) = ans
-            imports = core.process_backup(os.path.join(config.BACKUPS, backups[choice]))
+            imports = core.process_backup(backups[choice])
             for feel in imports:
                 print("importing {entry}".format(entry="-".join(util.parse_date(feel))))
                 subprocess.call(["mv", feel, config.MAIN_FEELS])
@@ -1388,12 +1442,18 @@ def write_entry(entry=os.path.join(config.MAIN_FEELS, "test.txt")):
 
     entered = input(config.recording)
 
+    # keeps the version about to be edited (including any changes made
+    # outside ttbp) in the entry's history
+    revisions.save(entry, SETTINGS)
+
     if entered:
         entryFile = open(entry, "a")
         entryFile.write("\n" + entered + "\n")
         entryFile.close()
     subprocess.call([SETTINGS.get("editor"), entry])
 
+    revisions.save(entry, SETTINGS)
+
     left = ""
 
     core.load_files()
@@ -1402,7 +1462,7 @@ def write_entry(entry=os.path.join(config.MAIN_FEELS, "test.txt")):
         core.toggle_nopub(os.path.basename(entry))
     else:
         if core.publishing():
-            core.write_html("index.html")
+            # core.load_files() just published it
             left = "posted to {url}/index.html\n\n> ".format(
                 url="/".join(
                     [config.LIVE + config.USER, str(SETTINGS.get("publish dir"))]
@@ -1443,25 +1503,22 @@ def set_nopubs(metas, user, prompt, page=0):
 none of your feels will be viewable outside of this server)"""
         print(nopub_note + "\n")
 
-    entries = []
-    for entry in metas:
-        pub = ""
-        if core.nopub(entry[0]):
-            pub = "(nopub)"
-        entries.append(
-            "" + entry[4] + " (" + p.no("word", entry[2]) + ") " + "\t" + pub
+    entries = util.LazyMap(entry_line, metas)
+
+    while True:
+        ans = menu_handler(
+            entries,
+            "pick an entry from the list to toggle nopub status, or type 'q' to go back: ",
+            10,
+            page,
+            SETTINGS.get("rainbows", False),
+            prompt + "\n\n" + nopub_note,
         )
 
-    ans = menu_handler(
-        entries,
-        "pick an entry from the list to toggle nopub status, or type 'q' to go back: ",
-        10,
-        page,
-        SETTINGS.get("rainbows", False),
-        prompt + "\n\n" + nopub_note,
-    )
+        if ans is False:
+            redraw()
+            return
 
-    if ans is not False:
         (page, choice) = ans
         target = os.path.basename(metas[choice][0])
         action = core.toggle_nopub(target)
@@ -1470,11 +1527,8 @@ none of your feels will be viewable outside of this server)"""
         if SETTINGS["gopher"]:
             gopher.publish_gopher("feels", core.get_files())
 
-        return set_nopubs(metas, user, prompt, page)
-
-    else:
-        redraw()
-        return
+        if nopub_note:
+            print(nopub_note + "\n")
 
 
 def send_feedback(entered, subject="none"):
@@ -1525,17 +1579,28 @@ def list_entries(metas, entries, prompt, page=0):
     one for display.
     """
 
-    ans = menu_handler(
-        entries,
-        "pick an entry from the list, or type 'q' to go back: ",
-        10,
-        page,
-        SETTINGS.get("rainbows", False),
-        prompt,
-    )
+    while True:
+        ans = menu_handler(
+            entries,
+            "pick an entry from the list, or type 'q' to go back: ",
+            10,
+            page,
+            SETTINGS.get("rainbows", False),
+            prompt,
+        )
+
+        if ans is False:
+            redraw()
+            return
 
-    if ans is not False:
         (page, choice) = ans
+
+        if SETTINGS.get("builtin pager"):
+            last = read_entries(metas, choice)
+            page = last // 10
+            redraw(prompt)
+            continue
+
         redraw(
             "now reading ~{user}'s feels on {date}\n> press <q> to return to feels list.\n\n".format(
                 user=metas[choice][5], date=metas[choice][4]
@@ -1545,18 +1610,49 @@ def list_entries(metas, entries, prompt, page=0):
         show_entry(metas[choice][0])
         redraw(prompt)
 
-        return list_entries(metas, entries, prompt, page)
 
+def read_entries(metas, start):
+    """
+    reads entries from metas in the built-in pager, starting at index start;
+    returns the index of the last one read
+    """
+
+    def title(index):
+        return "now reading ~{user}'s feels on {date}".format(
+            user=metas[index][5], date=metas[index][4]
+        )
+
+    render = pager.read_plain
+    if SETTINGS.get("render markdown"):
+        render = ansi.render_file
+
+    # a LazyMetas already knows its filenames; asking it for rows would work
+    # out every entry's meta just to get them
+    if isinstance(metas, core.LazyMetas):
+        filenames = metas.filenames
     else:
-        redraw()
-        return
+        filenames = [entry[0] for entry in metas]
+
+    reader = pager.Pager(filenames, render, title)
+
+    return reader.show(start)
 
 
 def show_entry(filename):
     """
-    call less on passed in filename
+    call less on passed in filename, or on the rendered entry if "render
+    markdown" is on
     """
 
+    if SETTINGS.get("render markdown"):
+        try:
+            text = ansi.render_file(filename)
+        except (OSError, UnicodeDecodeError):
+            text = None
+        if text is not None:
+            subprocess.run(["less", "-R"], input=text.encode("utf-8"))
+            return
+
     subprocess.call(["less", filename])
 
     return
@@ -1577,14 +1673,64 @@ def view_global_feed():
 def view_subscribed_feed(subs, prompt=""):
     """
     display list of most recent entries on user's subscribed list.
+
+    * entries written or edited since the last visit are marked as new
+    * per-pal summaries are kept in config.SUBS_STATE, so only new and
+      edited entries need to be looked at (see core.subscribed_feed())
     """
-    (entries, metas) = feed_list(subs, 0)
-    list_entries(metas, entries, prompt)
+
+    state = load_subs_state()
+    metas = core.subscribed_feed(subs, state["summaries"], state["seen"])
+
+    unread = len([entry for entry in metas if entry[6]])
+    if unread:
+        prompt = "{prompt} ({count} new)".format(prompt=prompt, count=unread)
+        redraw(prompt)
+
+    list_entries(metas, feed_lines(metas), prompt)
+
+    # everything up to now has been shown, as it is now
+    for user in subs:
+        entries = state["summaries"].get(user, {}).get("entries", {})
+        state["seen"][user] = dict((name, entry[0]) for name, entry in entries.items())
+    save_subs_state(state)
+
     redraw()
 
     return
 
 
+def load_subs_state():
+    """
+    loads the subscription feed state: {"seen": {user: {filename: mtime}},
+    "summaries": {user: summary}}
+    """
+
+    try:
+        state = json.load(open(config.SUBS_STATE))
+    except (OSError, ValueError):
+        state = {}
+
+    if not isinstance(state, dict):
+        state = {}
+    state.setdefault("seen", {})
+    state.setdefault("summaries", {})
+
+    return state
+
+
+def save_subs_state(state):
+    """
+    saves the subscription feed state, privately
+    """
+
+    temp = config.SUBS_STATE + ".tmp"
+    with open(temp, "w") as f:
+        json.dump(state, f)
+    os.chmod(temp, 0o600)
+    os.replace(temp, config.SUBS_STATE)
+
+
 def feed_list(townies, delta=30):
     """
     given a list of townies, generate a list of 50 most recent entries within
@@ -1594,52 +1740,34 @@ def feed_list(townies, delta=30):
     returns a tuple of (entries, metas)
     """
 
-    feedList = []
-    all_users = core.find_ttbps()
-
-    for townie in townies:
-        if townie not in all_users:
-            continue
+    metas = core.town_feed(townies, delta)
 
-        entryDir = os.path.join("/home", townie, ".ttbp", "entries")
-        try:
-            filenames = os.listdir(entryDir)
-        except OSError:
-            filenames = []
-
-        for entry in filenames:
-            if delta > 0:
-                if core.valid(entry):
-                    year = int(entry[0:4])
-                    month = int(entry[4:6])
-                    day = int(entry[6:8])
-                    datecheck = datetime.date(year, month, day)
-                    displayCutoff = datetime.date.today() - datetime.timedelta(
-                        days=delta
-                    )
+    return feed_lines(metas[0:50]), metas
 
-                    if datecheck > displayCutoff:
-                        feedList.append(os.path.join(entryDir, entry))
-            else:
-                feedList.append(os.path.join(entryDir, entry))
 
-    metas = core.meta(feedList)
-    metas.sort(key=lambda entry: entry[3])
-    metas.reverse()
+def feed_lines(metas):
+    """
+    formats metas for a feed list, marking unread ones if they're flagged
+    """
 
     entries = []
-    for entry in metas[0:50]:
+    for entry in metas:
         pad = ""
         if len(entry[5]) < 8:
             pad = "\t"
 
+        new = ""
+        if len(entry) > 6 and entry[6]:
+            new = "\t(new)"
+
         entries.append(
-            "~{user}{pad}\ton {date} ({wordcount})".format(
-                user=entry[5], pad=pad, date=entry[3], wordcount=p.no("word", entry[2])
+            "~{user}{pad}\ton {date} ({wordcount}){new}".format(
+                user=entry[5], pad=pad, date=entry[3], wordcount=p.no("word", entry[2]),
+                new=new
             )
         )
 
-    return entries, metas
+    return entries
 
 
 def subscription_manager(subs, intro=""):
@@ -1647,29 +1775,29 @@ def subscription_manager(subs, intro=""):
 
     menuOptions = ["add pals", "remove pals"]
 
-    util.print_menu(menuOptions, SETTINGS.get("rainbows", False))
+    while True:
+        util.print_menu(menuOptions, SETTINGS.get("rainbows", False))
 
-    choice = util.list_select(
-        menuOptions, "what do you want to do? (enter 'q' to go back) "
-    )
+        choice = util.list_select(
+            menuOptions, "what do you want to do? (enter 'q' to go back) "
+        )
 
-    top = ""
+        top = ""
 
-    if choice is not False:
-        if choice == 0:
-            prompt = "list of townies recording feels:"
-            redraw(prompt)
-            subs = subscribe_handler(subs, prompt)
-        elif choice == 1:
-            prompt = "list of townies you're subscribed to:"
-            redraw(prompt)
-            subs = unsubscribe_handler(subs, prompt)
-    else:
-        redraw()
-        return
+        if choice is not False:
+            if choice == 0:
+                prompt = "list of townies recording feels:"
+                redraw(prompt)
+                subs = subscribe_handler(subs, prompt)
+            elif choice == 1:
+                prompt = "list of townies you're subscribed to:"
+                redraw(prompt)
+                subs = unsubscribe_handler(subs, prompt)
+        else:
+            redraw()
+            return
 
-    redraw(top + intro)
-    return subscription_manager(subs, intro)
+        redraw(top + intro)
 
 
 def unsubscribe_handler(subs, prompt, page=0):
@@ -1679,25 +1807,25 @@ def unsubscribe_handler(subs, prompt, page=0):
 
     subs.sort()
 
-    ans = menu_handler(
-        subs,
-        "pick a pal to unsubscribe (or 'q' to cancel): ",
-        15,
-        page,
-        SETTINGS.get("rainbows", False),
-        "list of townies recording feels:",
-    )
+    while True:
+        ans = menu_handler(
+            subs,
+            "pick a pal to unsubscribe (or 'q' to cancel): ",
+            15,
+            page,
+            SETTINGS.get("rainbows", False),
+            "list of townies recording feels:",
+        )
+
+        if ans is False:
+            redraw()
+            return subs
 
-    if ans is not False:
         (page, choice) = ans
         townie = subs[choice]
         subs.remove(townie)
         save_subs(subs)
         redraw("{townie} removed! \n\n> {prompt}".format(townie=townie, prompt=prompt))
-        return unsubscribe_handler(subs, prompt, page)
-    else:
-        redraw()
-        return subs
 
 
 def subscribe_handler(subs, prompt, page=0):
@@ -1706,33 +1834,34 @@ def subscribe_handler(subs, prompt, page=0):
     returning the subs list when finished.
     """
 
+    subscribed = set(subs)
     candidates = []
 
     for townie in core.find_ttbps():
-        if townie not in subs:
+        if townie not in subscribed:
             candidates.append(townie)
 
     candidates.sort()
 
-    ans = menu_handler(
-        candidates,
-        "pick a townie to add to your subscriptions (or 'q' to cancel): ",
-        15,
-        page,
-        SETTINGS.get("rainbows", False),
-        "list of townies recording feels:",
-    )
+    while True:
+        ans = menu_handler(
+            candidates,
+            "pick a townie to add to your subscriptions (or 'q' to cancel): ",
+            15,
+            page,
+            SETTINGS.get("rainbows", False),
+            "list of townies recording feels:",
+        )
+
+        if ans is False:
+            redraw()
+            return subs
 
-    if ans is not False:
         (page, choice) = ans
-        townie = candidates[choice]
+        townie = candidates.pop(choice)
         subs.append(townie)
         save_subs(subs)
         redraw("{townie} added! \n\n> {prompt}".format(townie=townie, prompt=prompt))
-        return subscribe_handler(subs, prompt, page)
-    else:
-        redraw()
-        return subs
 
 
 def save_subs(subs):
@@ -1750,39 +1879,52 @@ def save_subs(subs):
 
 def graffiti_handler():
     """
-    Main graffiti handler; checks for lockfile from another editing sesison
-    (overwriting by default if the lock is more than three days old.
+    Main graffiti handler; lets you edit a copy of the wall and adds your
+    changes to it when you're done (see graffiti.py). anyone else can be at
+    the wall at the same time.
     """
 
-    if (
-        os.path.isfile(config.WALL_LOCK)
-        and time.time() - os.path.getmtime(config.WALL_LOCK) < 60 * 60 * 24 * 3
-    ):
-        redraw(
-            "sorry, {friend}, but someone's there right now. try again in a few!".format(
-                friend=chatter.say("friend")
-            )
-        )
-    else:
-        subprocess.call(["touch", config.WALL_LOCK])
-        redraw()
-        print(
-            """\
+    (seq, lines) = graffiti.compact()
+    wall = "".join(lines)
+
+    redraw()
+    print(
+        """\
 the graffiti wall is a world-writeable text file. anyone can
 scribble on it; anyone can move or delete things. please be
 considerate of your neighbors when writing on it.
 
-no one will be able to visit the wall while you are here, so don't
-worry about overwriting someone else's work. anything you do to the
-wall will be recorded if you save the file, and you can cancel
-your changes by exiting without saving.
+other people can visit the wall while you're here. when you save,
+your changes get added to the wall as it is by then; if someone else
+changed the same spot in the meantime, anything you wrote there goes
+at the bottom of the wall instead. you can cancel your changes by
+exiting without saving.
 
 """
-        )
-        input("press <enter> to visit the wall\n\n")
-        subprocess.call([SETTINGS.get("editor"), config.WALL])
-        subprocess.call(["rm", config.WALL_LOCK])
+    )
+    input("press <enter> to visit the wall\n\n")
+
+    (fd, temp) = tempfile.mkstemp(prefix="ttbp-wall-", suffix=".txt")
+    with os.fdopen(fd, "w") as f:
+        f.write(wall)
+
+    subprocess.call([SETTINGS.get("editor"), temp])
+
+    with open(temp, "r") as f:
+        scribbled = f.read()
+    os.remove(temp)
+
+    try:
+        contributed = graffiti.contribute(seq, wall, scribbled)
+    except OSError as e:
+        redraw("sorry, i couldn't add your scribbles to the wall ({error}).".format(
+            error=e.strerror or e))
+        return
+
+    if contributed:
         redraw("thanks for visiting the graffiti wall!")
+    else:
+        redraw("thanks for visiting the graffiti wall! you left it as you found it.")
 
 
 ## misc helpers
@@ -23,7 +23,10 @@ LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
 OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
 WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 '''
+import hashlib
 import random
+import re
+import tempfile
 import time
 from six.moves import input
 import os
@@ -35,6 +38,22 @@ import inflect
 BACKS = ['back', 'b', 'q', '<q>']
 NAVS = ['u', 'd']
 
+## output globals
+# published files go out through one buffer this big
+WRITE_BUFFER = 256 * 1024
+# published files get the usual permissions for a fresh file
+UMASK = os.umask(0)
+os.umask(UMASK)
+# how many write_out() calls changed something, and how many were skipped
+WRITES = {"changed": 0, "unchanged": 0}
+# blocks minify_html() leaves exactly as they are
+VERBATIM = re.compile(br'(<(pre|textarea|script|style)\b.*?</\2\s*>)', re.S | re.I)
+# whitespace for minify_html() to collapse, or a quoted attribute value
+# (anything quoted right after an =) to leave alone
+SPACES = re.compile(br'''(=\s*(?:"[^"]*"|'[^']*'))|\s+''')
+# control characters other people's entries can't send to the terminal
+CONTROLS = re.compile('[\x00-\x08\x0b-\x1f\x7f-\x9f]')
+
 ## color stuff
 colorama.init()
 textcolors = [ colorama.Fore.RED, colorama.Fore.GREEN, colorama.Fore.YELLOW, colorama.Fore.BLUE, colorama.Fore.MAGENTA, colorama.Fore.WHITE, colorama.Fore.CYAN]
@@ -178,28 +197,22 @@ def list_select(options, prompt):
     ValueError or IndexError.
     '''
 
-    ans = ""
-    invalid = True
+    while True:
+        choice = input("\n"+prompt)
 
-    choice = input("\n"+prompt)
+        if choice in BACKS:
+            return False
 
-    if choice in BACKS:
-        return False
+        if choice in NAVS:
+            return choice
 
-    if choice in NAVS:
-        return choice
+        try:
+            ans = int(choice)
+            options[ans]
+        except (ValueError, IndexError):
+            continue
 
-    try:
-        ans = int(choice)
-    except ValueError:
-        return list_select(options, prompt)
-
-    try:
-        options[ans]
-    except IndexError:
-        return list_select(options, prompt)
-
-    return ans
+        return ans
 
 def input_yn(query):
     '''
@@ -233,3 +246,167 @@ def parse_date(file):
 
     return date
 
+
+class LazyMap(object):
+    '''
+    read-only sequence of func(item) for each item in a sequence, worked out
+    only for the items that are looked at; for menus over lazy lists, which
+    only ever show a page of them
+    '''
+
+    def __init__(self, func, items):
+        self.func = func
+        self.items = items
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.func(item) for item in self.items[index]]
+
+        return self.func(self.items[index])
+
+
+def show_controls(text):
+    '''
+    makes control characters (besides newlines and tabs) visible instead of
+    letting them through to the terminal, the way `less` does: ^[ for escape,
+    <U+009B> for the 8-bit ones
+    '''
+
+    def visible(match):
+        code = ord(match.group(0))
+        if code < 0x20:
+            return "^" + chr(code + 0x40)
+        if code == 0x7f:
+            return "^?"
+        return "<U+{code:04X}>".format(code=code)
+
+    return CONTROLS.sub(visible, text)
+
+def write_out(path, chunks, stamp=b""):
+    '''
+    atomic, change-detecting file writer
+
+    * writes stamp and then the byte chunks into a temp file next to path,
+      through one large buffer
+    * if everything after the stamp matches what's already at path, the temp
+      file is dropped and path is left alone (mtime and all); otherwise the
+      temp file is renamed over path, so readers never see half a file
+    * if we can't create files next to path (like a shared page in someone
+      else's directory), or can't replace path (someone else's file in a
+      sticky shared directory), falls back to rewriting path in place
+    * tallies into WRITES; returns True if path changed
+    '''
+
+    try:
+        fd, temp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".ttbp-")
+    except PermissionError:
+        return write_in_place(path, chunks, stamp)
+
+    digest = hashlib.sha1()
+
+    try:
+        with os.fdopen(fd, "wb", buffering=WRITE_BUFFER) as outfile:
+            outfile.write(stamp)
+            for chunk in chunks:
+                digest.update(chunk)
+                outfile.write(chunk)
+
+        if digest.digest() == old_digest(path, stamp):
+            os.remove(temp)
+            WRITES["unchanged"] += 1
+            return False
+
+        os.chmod(temp, 0o666 & ~UMASK)
+        try:
+            os.replace(temp, path)
+        except PermissionError:
+            with open(temp, "rb") as infile:
+                data = infile.read()[len(stamp):]
+            os.remove(temp)
+            return write_in_place(path, [data], stamp)
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+
+    WRITES["changed"] += 1
+    return True
+
+def write_in_place(path, chunks, stamp=b""):
+    '''
+    write_out() fallback that truncates and rewrites path directly, still
+    skipping the write if nothing changed
+    '''
+
+    data = b"".join(chunks)
+
+    if hashlib.sha1(data).digest() == old_digest(path, stamp):
+        WRITES["unchanged"] += 1
+        return False
+
+    with open(path, "wb") as outfile:
+        outfile.write(stamp)
+        outfile.write(data)
+
+    WRITES["changed"] += 1
+    return True
+
+def old_digest(path, stamp=b""):
+    '''
+    sha1 of what's at path now, minus as many leading lines as stamp has;
+    None if there's nothing there
+    '''
+
+    try:
+        with open(path, "rb") as f:
+            old = f.read()
+    except OSError:
+        return None
+
+    for i in range(stamp.count(b"\n")):
+        old = old[old.find(b"\n")+1:]
+
+    return hashlib.sha1(old).digest()
+
+def minify_html(html):
+    '''
+    conservative html minifier for bytes
+
+    * collapses every run of whitespace to one space, or one newline if the
+      run had a newline in it, which browsers render the same
+    * leaves <pre>, <textarea>, <script>, and <style> blocks alone, and
+      quoted attribute values like title="..." and alt="..."
+    * keeps comments, since the manual promises they stay in view-source
+    '''
+
+    def collapse(match):
+        if match.group(1):
+            return match.group(1)
+        if b"\n" in match.group(0):
+            return b"\n"
+        return b" "
+
+    parts = VERBATIM.split(html)
+    minified = []
+
+    # split() hands back text, then (block, tag name) pairs, then text...
+    for i in range(0, len(parts), 3):
+        minified.append(SPACES.sub(collapse, parts[i]))
+        if i + 1 < len(parts):
+            minified.append(parts[i+1])
+
+    return b"".join(minified)
+
+def reset_writes():
+    '''
+    zeroes the WRITES tally and returns what it was
+    '''
+
+    counts = dict(WRITES)
+    WRITES["changed"] = 0
+    WRITES["unchanged"] = 0
+
+    return counts
@@ -0,0 +1,256 @@
+"""
+This module contains `ttbp watch`, which republishes feels edited outside of
+ttbp.
+
+it watches the entries directory plus the nopub/header/footer/style files,
+waits for a burst of changes to settle, and then asks core.publish_changes() to
+rewrite only the pages that were touched. inotify is used through libc when
+it's available; otherwise the watched files are polled for mtime changes.
+"""
+import argparse
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import time
+
+from . import config
+from . import core
+from . import util
+
+## inotify flags, from <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+EVENT_HEADER = struct.Struct("iIII")
+
+## the config files we care about; anything else in USER_CONFIG is ignored
+LAYOUT_FILES = ["header.txt", "footer.txt"]
+STYLE_FILE = "style.css"
+NOPUB_FILE = os.path.basename(config.NOPUB)
+
+
+class InotifyWatcher(object):
+    """reports changed paths in the watched directories via inotify"""
+
+    def __init__(self, directories):
+        libc_name = ctypes.util.find_library("c")
+        if not libc_name:
+            raise OSError("no libc to get inotify from")
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("libc has no inotify")
+
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.dirs = {}
+        for directory in directories:
+            wd = libc.inotify_add_watch(self.fd, directory.encode(), WATCH_MASK)
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), "can't watch " + directory)
+            self.dirs[wd] = directory
+
+    def wait(self, timeout=None):
+        """blocks up to timeout seconds; returns a set of changed paths"""
+
+        changed = set()
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return changed
+
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0").decode(errors="replace")
+            offset += length
+            if wd in self.dirs and name:
+                changed.add(os.path.join(self.dirs[wd], name))
+
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollWatcher(object):
+    """reports changed paths by comparing (mtime, size) snapshots of the
+    watched directories every interval seconds"""
+
+    def __init__(self, directories, interval=2):
+        self.directories = directories
+        self.interval = interval
+        self.snapshot = self.scan()
+
+    def scan(self):
+        snapshot = {}
+        for directory in self.directories:
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                continue
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                snapshot[path] = (st.st_mtime, st.st_size)
+        return snapshot
+
+    def wait(self, timeout=None):
+        if timeout is None or timeout > self.interval:
+            timeout = self.interval
+        time.sleep(timeout)
+
+        current = self.scan()
+        changed = set()
+        for path in set(current) | set(self.snapshot):
+            if current.get(path) != self.snapshot.get(path):
+                changed.add(path)
+        self.snapshot = current
+
+        return changed
+
+    def close(self):
+        pass
+
+
+def make_watcher(directories, poll=False, interval=2):
+    """inotify if we can get it, mtime polling otherwise"""
+
+    if not poll:
+        try:
+            return InotifyWatcher(directories)
+        except (OSError, AttributeError):
+            pass
+
+    return PollWatcher(directories, interval)
+
+def debounce(watcher, delay=1.0, limit=10.0):
+    """waits for a change, then keeps collecting until nothing has changed for
+    delay seconds (or limit seconds have passed), and returns everything"""
+
+    changed = set()
+    while not changed:
+        changed = watcher.wait(None)
+
+    start = time.time()
+    while time.time() - start < limit:
+        more = watcher.wait(delay)
+        if not more:
+            break
+        changed |= more
+
+    return changed
+
+def classify(changed):
+    """sorts changed paths into (entries, nopubs, layout, style)"""
+
+    entries = []
+    nopubs = False
+    layout = False
+    style = False
+
+    for path in changed:
+        directory, name = os.path.split(path)
+        if directory == config.MAIN_FEELS:
+            if core.valid(name):
+                entries.append(name)
+        elif directory == config.USER_CONFIG:
+            if name == NOPUB_FILE:
+                nopubs = True
+            elif name in LAYOUT_FILES:
+                layout = True
+            elif name == STYLE_FILE:
+                style = True
+
+    entries.sort()
+
+    return entries, nopubs, layout, style
+
+def rebuild(changed):
+    """runs the smallest rebuild that covers the changed paths; returns a
+    short description of what happened"""
+
+    entries, nopubs, layout, style = classify(changed)
+
+    if not (entries or nopubs or layout):
+        if style:
+            return "style.css changed (it's linked into your page, nothing to rebuild)"
+        return ""
+
+    util.reset_writes()
+    written = core.publish_changes(entries, nopubs, layout)
+
+    if layout:
+        reason = "layout changed"
+    elif nopubs:
+        reason = "nopubs changed"
+    else:
+        reason = ", ".join(entries) + " changed"
+
+    return "{reason}; rebuilt {count} of {total} pages and the index ({changed} files changed)".format(
+            reason=reason, count=len(written), total=len(core.FILES),
+            changed=util.WRITES["changed"])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="ttbp watch",
+            description="republish your feels whenever they change on disk")
+    parser.add_argument("--poll", action="store_true",
+            help="poll for changes instead of using inotify")
+    parser.add_argument("--interval", type=float, default=2,
+            help="seconds between polls (with --poll or no inotify)")
+    parser.add_argument("--delay", type=float, default=1.0,
+            help="seconds of quiet to wait for before rebuilding")
+    args = parser.parse_args(argv)
+
+    try:
+        settings = json.load(open(config.TTBPRC))
+    except (OSError, ValueError):
+        print("i can't read your ttbprc; run ttbp to set up your feels first.")
+        return 1
+
+    core.load(settings, publish=False)
+
+    if not core.publishing():
+        print("you're not publishing your feels, so there's nothing to watch.")
+        return 1
+
+    stale = core.publish_stale()
+    if stale:
+        print("caught up on {count} stale pages".format(count=len(stale)))
+
+    watcher = make_watcher([config.MAIN_FEELS, config.USER_CONFIG],
+            args.poll, args.interval)
+    print("watching {feels} for changes ({kind}); press <ctrl-c> to stop.".format(
+        feels=config.MAIN_FEELS,
+        kind="inotify" if isinstance(watcher, InotifyWatcher) else "polling"))
+
+    try:
+        while True:
+            changed = debounce(watcher, args.delay)
+            result = rebuild(changed)
+            if result:
+                print(time.strftime("[%H:%M:%S] ") + result)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+    return 0
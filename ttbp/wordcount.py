@@ -0,0 +1,153 @@
+"""
+This module contains ttbp's word counter, a drop-in for forking `wc -w`.
+
+files are memory-mapped and counted with bytes-level operations that run in
+C: bytes.translate() squashes every byte into "space" or "word" (or drops it),
+and bytes.count() counts where words start. the result matches GNU `wc -w`:
+
+* words are separated by whitespace, and only start at a printable character;
+  control characters neither start nor end a word
+* in a UTF-8 locale, non-ASCII characters are printable, and the unicode
+  spaces (plus no-break spaces, which wc also treats as spaces) separate
+  words; in any other locale, non-ASCII bytes count like control characters
+* in a UTF-8 locale, what glibc's iswprint() turns down is dropped before
+  counting, like wc skips it: bytes that aren't valid UTF-8 (including
+  encoded surrogates and anything past U+10FFFF), controls, unassigned code
+  points such as U+FFFE, and the line and paragraph separators. "unassigned"
+  comes from python's unicodedata, so a python and a glibc built on
+  different unicode versions can disagree about brand new characters
+
+big batches are spread over a thread pool, since most of the time goes to
+opening and mapping files, which doesn't hold the GIL.
+"""
+import concurrent.futures
+import locale
+import mmap
+import os
+import unicodedata
+
+# in a UTF-8 locale, wc works in characters rather than bytes
+UTF8 = locale.nl_langinfo(locale.CODESET).lower().replace("-", "") == "utf8"
+# batches at least this big get a thread pool
+POOL_THRESHOLD = 64
+# big files are counted this many bytes at a time
+CHUNK = 1024 * 1024
+
+SPACE = b" "
+WORD = b"w"
+ASCII = bytes(range(0x80))
+ASCII_SPACES = b" \t\n\v\f\r"
+ASCII_PRINTABLE = bytes(range(0x21, 0x7f))
+# UTF-8 lead bytes; each one starts a (printable) character
+UTF8_LEADS = bytes(range(0xc2, 0xf5))
+
+# iswspace() outside ascii, plus the no-break spaces wc counts as spaces
+UNICODE_SPACES = [chr(c).encode("utf-8") for c in [0x00a0, 0x1680, 0x2000,
+    0x2001, 0x2002, 0x2003, 0x2004, 0x2005, 0x2006, 0x2007, 0x2008, 0x2009,
+    0x200a, 0x202f, 0x205f, 0x2060, 0x3000]]
+# unicode categories iswprint() turns down; invalid bytes decode to lone
+# surrogates (Cs) under surrogateescape, so they're dropped along with these
+HIDDEN = {"Cc", "Cn", "Cs", "Zl", "Zp"}
+
+
+def make_table(words):
+    '''
+    bytes.translate() table mapping ascii spaces to SPACE and the given word
+    bytes to WORD, plus the bytes to delete (everything else)
+    '''
+
+    table = bytearray(range(256))
+    keep = set(ASCII_SPACES) | set(words)
+    for c in ASCII_SPACES:
+        table[c] = SPACE[0]
+    for c in words:
+        table[c] = WORD[0]
+
+    return bytes(table), bytes(c for c in range(256) if c not in keep)
+
+ASCII_TABLE, ASCII_DELETE = make_table(ASCII_PRINTABLE)
+UTF8_TABLE, UTF8_DELETE = make_table(ASCII_PRINTABLE + UTF8_LEADS)
+
+
+def count_bytes(data, utf8=UTF8, inword=False):
+    '''
+    counts words in data (bytes); returns (words, inword), where inword says
+    whether data ended partway through a word, for counting in chunks
+    '''
+
+    if utf8 and not data.isascii():
+        try:
+            text = data.decode("utf-8")
+            # valid UTF-8 stays valid without its ascii, which is most of it
+            chars = set(data.translate(None, ASCII).decode("utf-8"))
+        except UnicodeDecodeError:
+            text = data.decode("utf-8", "surrogateescape")
+            chars = set(text)
+        hidden = [ord(char) for char in chars
+                if char > "\x7f" and unicodedata.category(char) in HIDDEN]
+        if hidden:
+            data = text.translate(dict.fromkeys(hidden)).encode("utf-8")
+        for space in UNICODE_SPACES:
+            if space in data:
+                data = data.replace(space, SPACE)
+        squashed = data.translate(UTF8_TABLE, UTF8_DELETE)
+    else:
+        squashed = data.translate(ASCII_TABLE, ASCII_DELETE)
+
+    if not squashed:
+        return 0, inword
+
+    words = squashed.count(SPACE + WORD)
+    if squashed[:1] == WORD and not inword:
+        words += 1
+
+    return words, squashed[-1:] == WORD
+
+def count_file(filename, utf8=UTF8):
+    '''
+    counts the words in one file, like `wc -w`
+    '''
+
+    with open(filename, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return 0
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if size <= CHUNK:
+                return count_bytes(mapped[:], utf8)[0]
+
+            total = 0
+            inword = False
+            start = 0
+            while start < size:
+                end = min(size, start + CHUNK)
+                # don't split a UTF-8 character between chunks
+                while utf8 and end < size and 0x80 <= mapped[end] < 0xc0:
+                    end += 1
+                words, inword = count_bytes(mapped[start:end], utf8, inword)
+                total += words
+                start = end
+
+            return total
+
+def count_files(filenames, utf8=UTF8, workers=None):
+    '''
+    counts words in many files; returns a dict of filename: words, with None
+    for files that couldn't be read
+    '''
+
+    def count(filename):
+        try:
+            return count_file(filename, utf8)
+        except (OSError, ValueError):
+            return None
+
+    if len(filenames) < POOL_THRESHOLD:
+        return dict((filename, count(filename)) for filename in filenames)
+
+    if workers is None:
+        workers = min(8, (os.cpu_count() or 1) * 2)
+
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        return dict(zip(filenames, pool.map(count, filenames, chunksize=32)))